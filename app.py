@@ -1,22 +1,84 @@
+import atexit
+import logging
+
 from flask import Flask
+from pymongo.errors import PyMongoError
 from config import Config
-from db.mongo import close_db
+from db.mongo import close_db, close_client, get_database
+from db.indexes import ensure_indexes, ensure_ttl_index
 from blueprints.position import position_bp
 from blueprints.rooms import rooms_bp
-from blueprints.routes import routes_bp
+from blueprints.routes import routes_bp, route_cache
+from blueprints.graph_cache import room_graph_cache
+from blueprints.occupancy import occupancy_tracker
+from blueprints.stay_coalescer import stay_coalescer
+from blueprints.ingest_queue import ingestion_queue
+from blueprints.occupancy_stream import occupancy_broker
+from blueprints.occupancy_engine import occupancy_engine
+from blueprints.fingerprint_store import fingerprint_store
+from blueprints.rollups import room_rollups
+from blueprints.dwell import dwell_sessions
+from utils.http_cache import response_cache
+from utils.serialization import FastJSONProvider, response_compressor
+from utils.smoothing import room_smoother
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
 
+    # Serialización de respuestas (orjson / MessagePack) y compresión
+    app.json = FastJSONProvider(app)
+    app.json.configure(app.config)
+    response_compressor.configure(app.config)
+    app.after_request(response_compressor)
+
+    # Crear los índices que usan los endpoints (idempotente)
+    if app.config["MONGO_ENSURE_INDEXES"]:
+        try:
+            ensure_indexes(get_database(app.config))
+            ensure_ttl_index(get_database(app.config), "room_events", "event_at",
+                             app.config["ROOM_EVENTS_TTL_DAYS"] * 86400)
+        except PyMongoError as e:
+            logging.getLogger(__name__).warning("could not ensure indexes: %s", e)
+
+    ttl_days = app.config["ROOM_EVENTS_TTL_DAYS"]
+    if ttl_days and ttl_days <= app.config["ROOM_EVENTS_ARCHIVE_AFTER_DAYS"]:
+        logging.getLogger(__name__).warning(
+            "ROOM_EVENTS_TTL_DAYS (%s) <= ROOM_EVENTS_ARCHIVE_AFTER_DAYS: events may expire before being archived",
+            ttl_days
+        )
+
+    # Componentes en memoria del proceso (sus hilos arrancan en el primer uso)
+    room_graph_cache.configure(app.config)
+    occupancy_tracker.configure(app.config)
+    stay_coalescer.configure(app.config)
+    ingestion_queue.configure(app.config)
+    occupancy_broker.configure(app.config)
+    occupancy_engine.configure(app.config)
+    fingerprint_store.configure(app.config)
+    room_smoother.configure(app.config)
+    room_rollups.configure(app.config)
+    dwell_sessions.configure(app.config)
+    route_cache.maxsize = app.config["ROUTE_CACHE_SIZE"]
+    response_cache.configure(app.config)
+
     # Registrar blueprints
     app.register_blueprint(position_bp, url_prefix="/position")
     app.register_blueprint(rooms_bp, url_prefix="/rooms")
     app.register_blueprint(routes_bp, url_prefix="/routes")
 
-    # Cerrar Mongo al terminar el contexto
+    # Soltar el handle de Mongo al terminar el contexto
     app.teardown_appcontext(close_db)
 
+    # Al salir: vaciar la cola, volcar lo pendiente y cerrar el cliente compartido
+    # (atexit ejecuta en orden inverso al de registro)
+    atexit.register(close_client)
+    atexit.register(occupancy_engine.stop)
+    atexit.register(stay_coalescer.stop)
+    atexit.register(ingestion_queue.shutdown)
+    atexit.register(room_graph_cache.stop)
+    atexit.register(occupancy_broker.stop)
+
     return app
 
 if __name__ == "__main__":
@@ -0,0 +1,54 @@
+"""
+Retención de room_events.
+
+  archive  mueve los eventos anteriores a --older-than-days a segmentos
+           comprimidos de solo-añadir en --dir (con index.ndjson)
+  scan     lee del archivo los eventos de un rango [--from, --to) sin
+           descomprimir segmentos enteros (un JSON por línea)
+  event-at rellena event_at en los eventos antiguos para el índice TTL
+"""
+import argparse
+import json
+import os
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from config import Config
+from db.retention import archive_events, backfill_event_at
+from utils.segments import scan_range
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/indoor_db")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["archive", "scan", "event-at"])
+    parser.add_argument("--dir", default=Config.ROOM_EVENTS_ARCHIVE_DIR)
+    parser.add_argument("--older-than-days", type=int, default=Config.ROOM_EVENTS_ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--chunk-size", type=int, default=Config.ROOM_EVENTS_ARCHIVE_CHUNK)
+    parser.add_argument("--from", dest="start")
+    parser.add_argument("--to", dest="end")
+    args = parser.parse_args()
+
+    if args.command == "scan":
+        for event in scan_range(args.dir, args.start, args.end):
+            print(json.dumps(event, ensure_ascii=False))
+        return
+
+    client = MongoClient(MONGO_URI)
+    db = client.get_default_database()
+
+    if args.command == "archive":
+        result = archive_events(
+            db, args.dir, args.older_than_days, chunk_size=args.chunk_size,
+            segment_max_bytes=Config.ROOM_EVENTS_SEGMENT_MAX_MB * 1024 * 1024
+        )
+        print(f"eventos archivados: {result['events']} en {result['blocks']} bloques ({args.dir})")
+    else:
+        print(f"eventos actualizados: {backfill_event_at(db)}")
+
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Materializa en dwell_sessions las visitas (entrada -> salida) que ya hay en
+room_events, por trozos de --chunk-size eventos. Se puede repetir: cada
+visita se identifica por usuario, habitación y hora de entrada.
+"""
+import argparse
+import os
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from blueprints.dwell import dwell_sessions
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/indoor_db")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    client = MongoClient(MONGO_URI)
+    db = client.get_default_database()
+
+    result = dwell_sessions.backfill(db, chunk_size=args.chunk_size)
+    print(f"eventos procesados: {result['events']} en {result['chunks']} trozos, visitas: {result['sessions']}")
+
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Reconstruye room_rollups (entradas, salidas y pico por habitación y
+minuto/hora) a partir de room_events, por trozos de --chunk-size eventos.
+
+Solo se rehacen los buckets del rango [--from, --to) (ISO, horas exactas);
+sin --from se empieza en la primera hora completa de los eventos que quedan
+en Mongo, así no se pierden los buckets de eventos archivados o caducados.
+"""
+import argparse
+import os
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from blueprints.rollups import room_rollups
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/indoor_db")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--from", dest="start", default=None)
+    parser.add_argument("--to", dest="end", default=None)
+    args = parser.parse_args()
+
+    client = MongoClient(MONGO_URI)
+    db = client.get_default_database()
+
+    result = room_rollups.backfill(db, start=args.start, end=args.end, chunk_size=args.chunk_size)
+    print(f"rango: {result['from']} - {result['to'] or 'ahora'}")
+    print(f"eventos procesados: {result['events']} en {result['chunks']} trozos")
+
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark offline de localización: precisión y latencia por consulta del
+puntuador por cobertura de beacons frente al kNN de huellas RSSI.
+
+Usa las huellas de la colección fingerprints o, con --synthetic N,
+genera N escaneos por habitación con un modelo simple de pérdida por
+saltos en el grafo de rooms.
+"""
+import argparse
+import os
+import time
+from collections import deque
+
+import numpy as np
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from blueprints.fingerprint_store import scan_vectors
+from blueprints.graph import graph_from_rooms
+from utils.beacon_locator import BeaconLocator
+from utils.fingerprints import FingerprintIndex
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/indoor_db")
+
+
+def hop_distances(rooms, start):
+    dist = {start: 0}
+    queue = deque([start])
+    while queue:
+        room = queue.popleft()
+        for neighbor in rooms[room].get("connections", []):
+            if neighbor in rooms and neighbor not in dist:
+                dist[neighbor] = dist[room] + 1
+                queue.append(neighbor)
+    return dist
+
+
+def synthetic_fingerprints(rooms, per_room, rng):
+    beacons = [
+        (room_id, b) for room_id, room in rooms.items() for b in room.get("beacons") or []
+    ]
+    hops = {room_id: hop_distances(rooms, room_id) for room_id in rooms}
+
+    fingerprints = []
+    for room_id in rooms:
+        for _ in range(per_room):
+            scan = []
+            for beacon_room, b in beacons:
+                h = hops[beacon_room].get(room_id)
+                if h is None:
+                    continue
+                rssi = -55 - 15 * h + rng.normal(0, 6)
+                if rssi > -95:
+                    scan.append(dict(b, rssi=float(rssi)))
+            fingerprints.append({"room_id": room_id, "beacons": scan})
+    return fingerprints
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--synthetic", type=int, default=0, help="escaneos sintéticos por habitación")
+    parser.add_argument("--test-ratio", type=float, default=0.2)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    client = MongoClient(MONGO_URI)
+    db = client.get_default_database()
+    docs = list(db.rooms.find({}, {"connections": 1, "beacons": 1}))
+    # Conexiones como ids de habitación (también las de forma documento), igual que GraphSnapshot.locator
+    graph = graph_from_rooms(docs)
+    rooms = {r["_id"]: dict(r, connections=graph[r["_id"]]) for r in docs}
+    rng = np.random.default_rng(args.seed)
+
+    if args.synthetic:
+        fingerprints = synthetic_fingerprints(rooms, args.synthetic, rng)
+    else:
+        fingerprints = list(db.fingerprints.find({}, {"_id": 0, "room_id": 1, "beacons": 1}))
+    client.close()
+
+    if len(fingerprints) < 2:
+        print("No hay huellas suficientes (usa --synthetic N)")
+        return
+
+    rng.shuffle(fingerprints)
+    n_test = max(1, int(len(fingerprints) * args.test_ratio))
+    test, train = fingerprints[:n_test], fingerprints[n_test:]
+    labels = [f["room_id"] for f in test]
+    scans = [f["beacons"] for f in test]
+
+    locator = BeaconLocator(rooms)
+    index = FingerprintIndex(len(locator.beacon_index))
+    index.add(scan_vectors(locator, [f["beacons"] for f in train]), [f["room_id"] for f in train])
+    vectors = scan_vectors(locator, scans)
+
+    results = {}
+    results["coverage (lote)"] = timed(lambda: locator.locate(scans), 5)
+    results["coverage (1 a 1)"] = timed(lambda: [locator.locate([s])[0] for s in scans], 1)
+    results[f"knn k={args.k}"] = timed(lambda: index.predict(vectors, args.k), 1)
+
+    print(f"{len(train)} huellas de entrenamiento, {len(test)} de prueba, {len(locator.beacon_index)} beacons")
+    print(f"{'método':<20}{'precisión':>12}{'µs/consulta':>14}")
+    for name, (estimates, seconds) in results.items():
+        accuracy = np.mean([room == label for (room, _), label in zip(estimates, labels)])
+        print(f"{name:<20}{accuracy:>12.3f}{seconds / len(test) * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
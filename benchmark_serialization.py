@@ -0,0 +1,112 @@
+"""
+Micro-benchmark de serialización de respuestas: tiempo de codificación y
+tamaño del cuerpo por endpoint con json de la stdlib (lo que hacía
+jsonify), orjson y MessagePack, sin comprimir y con gzip / deflate.
+
+Usa los datos de Mongo (como los devuelven /routes, /position/users_state
+y /rooms/room_events) o, con --synthetic N, N documentos generados.
+"""
+import argparse
+import json
+import os
+import time
+
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from utils.serialization import compress, encode_default, msgpack, orjson
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/indoor_db")
+
+
+def payloads_from_db(db, limit):
+    return {
+        "/routes": list(db.routes.find({}, {"_id": 1, "name": 1, "created_at": 1, "steps": 1}).limit(limit)),
+        "/position/users_state": list(db.users_state.find({}, {"_id": 0}).limit(limit)),
+        "/rooms/room_events": list(db.room_events.find({}, {"_id": 0, "event_at": 0}).limit(limit)),
+    }
+
+
+def synthetic_payloads(n):
+    rooms = ["ENTRADA", "SALON", "PASILLO", "COCINA", "HAB1", "HAB2", "HAB3", "BAN1", "BAN2"]
+    timestamp = "2025-01-01T10:00:00.000000+00:00"
+    return {
+        "/routes": [
+            {
+                "_id": f"bfs_user{i}_{timestamp}",
+                "name": f"Ruta automática BFS desde {rooms[i % 9]}",
+                "created_at": timestamp,
+                "steps": [{"room_id": r, "poi_id": f"poi_{r.lower()}"} for r in rooms]
+            }
+            for i in range(n)
+        ],
+        "/position/users_state": [
+            {
+                "user_id": f"user{i}", "current_room": rooms[i % 9], "last_update": timestamp,
+                "confidence": 0.87, "last_event": "stay", "last_room_change": timestamp
+            }
+            for i in range(n)
+        ],
+        "/rooms/room_events": [
+            {
+                "user_id": f"user{i % 50}", "room_id": rooms[i % 9], "event": "enter" if i % 2 else "exit",
+                "timestamp": timestamp, "confidence": 0.9
+            }
+            for i in range(n)
+        ],
+    }
+
+
+def encoders():
+    result = {
+        "json (stdlib)": lambda obj: json.dumps(
+            obj, default=encode_default, ensure_ascii=True, sort_keys=True, separators=(",", ":")
+        ).encode()
+    }
+    if orjson is not None:
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        result["orjson"] = lambda obj: orjson.dumps(obj, default=encode_default, option=option)
+    if msgpack is not None:
+        result["msgpack"] = lambda obj: msgpack.packb(obj, default=encode_default, use_bin_type=True)
+    return result
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--synthetic", type=int, default=0, help="documentos sintéticos por endpoint")
+    parser.add_argument("--limit", type=int, default=5000, help="documentos leídos de Mongo por endpoint")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--level", type=int, default=6, help="nivel de compresión")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        payloads = synthetic_payloads(args.synthetic)
+    else:
+        client = MongoClient(MONGO_URI)
+        payloads = payloads_from_db(client.get_default_database(), args.limit)
+        client.close()
+
+    print(f"{'endpoint':<24}{'codificador':<16}{'docs':>7}{'ms':>9}{'bytes':>11}{'gzip':>10}{'ms gzip':>9}{'deflate':>10}")
+    for endpoint, payload in payloads.items():
+        if not payload:
+            print(f"{endpoint:<24}(sin datos)")
+            continue
+        for name, encode in encoders().items():
+            body, seconds = timed(lambda: encode(payload), args.repeat)
+            gzipped, gzip_seconds = timed(lambda: compress(body, "gzip", args.level), args.repeat)
+            deflated = compress(body, "deflate", args.level)
+            print(f"{endpoint:<24}{name:<16}{len(payload):>7}{seconds * 1e3:>9.2f}{len(body):>11}"
+                  f"{len(gzipped):>10}{gzip_seconds * 1e3:>9.2f}{len(deflated):>10}")
+
+
+if __name__ == "__main__":
+    main()
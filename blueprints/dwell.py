@@ -0,0 +1,194 @@
+import logging
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+from utils.time_utils import parse_iso_seconds
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 95)
+# Bins por unidad de ln(1 + duración) en el histograma de stats()
+HISTOGRAM_RESOLUTION = 10
+
+
+def session_op(user_id, room_id, entered_at, exited_at):
+    """
+    Upsert de una visita cerrada en dwell_sessions. El _id es
+    (usuario, habitación, entrada), así la escritura en vivo y el backfill
+    son idempotentes. Devuelve None si los timestamps no sirven.
+    """
+    try:
+        duration = parse_iso_seconds(exited_at) - parse_iso_seconds(entered_at)
+    except (AttributeError, TypeError, ValueError):
+        return None
+    if duration < 0:
+        return None
+
+    return UpdateOne(
+        {"_id": f"{user_id}|{room_id}|{entered_at}"},
+        {"$setOnInsert": {
+            "user_id": user_id,
+            "room_id": room_id,
+            "entered_at": entered_at,
+            "exited_at": exited_at,
+            "duration": duration
+        }},
+        upsert=True
+    )
+
+
+def histogram_bin(duration_field):
+    """
+    Expresión de agregación con el bin de una duración: floor(ln(1 + s) * 10),
+    bins de ~10 % de ancho relativo (unos 115 hasta un día).
+    """
+    return {"$floor": {"$multiply": [{"$ln": {"$add": [duration_field, 1]}}, HISTOGRAM_RESOLUTION]}}
+
+
+def histogram_percentile(bins, p):
+    """
+    Percentil p (0-100) a partir de bins [(n, mínimo, máximo)] ordenados,
+    con el mismo rango que la interpolación lineal sobre los valores: dentro
+    de un bin se interpola entre su mínimo y su máximo, así que el error
+    está acotado por el ancho del bin (exacto si cada bin tiene 1-2 valores).
+    """
+    total = sum(count for count, _, _ in bins)
+    if not total:
+        return None
+    rank = (total - 1) * p / 100
+    seen = 0
+    previous_high = None
+    for count, low, high in bins:
+        if rank < seen:
+            # Entre el último valor del bin anterior y el primero de este
+            return previous_high + (low - previous_high) * (rank - (seen - 1))
+        if rank <= seen + count - 1:
+            if count == 1:
+                return low
+            return low + (high - low) * (rank - seen) / (count - 1)
+        seen += count
+        previous_high = high
+    return previous_high
+
+
+class DwellSessions:
+    """
+    Visitas cerradas (entrada -> salida) materializadas en dwell_sessions.
+
+    - update_position llama a record() en la rama de salida con la hora de
+      entrada guardada en users_state (last_room_change).
+    - stats() agrupa por habitación o usuario en un histograma logarítmico
+      de duraciones: el resultado de $group está acotado por el número de
+      bins y no por el de visitas.
+    - backfill() reconstruye las visitas emparejando los room_events de
+      cada usuario por trozos.
+    """
+
+    def __init__(self):
+        self.enabled = True
+
+    def configure(self, config):
+        self.enabled = config.get("DWELL_SESSIONS", True)
+
+    def record(self, db, ops, session=None):
+        """
+        ops: resultados de session_op() (se ignoran los None).
+        """
+        ops = [op for op in ops if op is not None]
+        if not self.enabled or not ops:
+            return
+        try:
+            db.dwell_sessions.bulk_write(ops, ordered=False, session=session)
+        except PyMongoError as e:
+            # Los eventos ya están en room_events: el backfill puede rehacerlas
+            if session is not None:
+                raise
+            logger.warning("could not record dwell sessions: %s", e)
+
+    def stats(self, db, match, group_by):
+        """
+        Número de visitas, media, percentiles y máximo de la duración
+        (segundos), agrupados por group_by ("room_id" o "user_id"). Los
+        percentiles salen del histograma; el resto es exacto.
+        """
+        rows = db.dwell_sessions.aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": {"group": f"${group_by}", "bin": histogram_bin("$duration")},
+                "count": {"$sum": 1},
+                "total": {"$sum": "$duration"},
+                "low": {"$min": "$duration"},
+                "high": {"$max": "$duration"}
+            }}
+        ])
+
+        histograms = {}
+        for row in rows:
+            histograms.setdefault(row["_id"]["group"], []).append(
+                (row["_id"]["bin"], row["count"], row["low"], row["high"], row["total"])
+            )
+
+        result = []
+        for group in sorted(histograms):
+            bins = sorted(histograms[group])
+            count = sum(n for _, n, _, _, _ in bins)
+            entry = {
+                group_by: group,
+                "count": count,
+                "mean": sum(total for _, _, _, _, total in bins) / count,
+                "max": bins[-1][3]
+            }
+            counts = [(n, low, high) for _, n, low, high, _ in bins]
+            for p in PERCENTILES:
+                entry[f"p{p}"] = histogram_percentile(counts, p)
+            result.append(entry)
+        return result
+
+    def backfill(self, db, chunk_size=5000):
+        """
+        Recorre room_events por (user_id, timestamp, _id) en trozos de
+        chunk_size y empareja cada entrada con la salida siguiente de la
+        misma habitación del mismo usuario. La visita abierta de un usuario
+        pasa de un trozo al siguiente. Devuelve {"events", "sessions", "chunks"}.
+        """
+        open_visit = {}
+        last = None
+        events_done = sessions = chunks = 0
+        while True:
+            query = {}
+            if last is not None:
+                user_id, timestamp, event_id = last
+                query = {"$or": [
+                    {"user_id": {"$gt": user_id}},
+                    {"user_id": user_id, "timestamp": {"$gt": timestamp}},
+                    {"user_id": user_id, "timestamp": timestamp, "_id": {"$gt": event_id}}
+                ]}
+            chunk = list(db.room_events.find(
+                query, {"user_id": 1, "room_id": 1, "event": 1, "timestamp": 1}
+            ).sort([("user_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)]).limit(chunk_size))
+            if not chunk:
+                break
+
+            ops = []
+            for event in chunk:
+                user_id = event["user_id"]
+                if event["event"] == "enter":
+                    open_visit[user_id] = (event["room_id"], event["timestamp"])
+                    continue
+                room_id, entered_at = open_visit.pop(user_id, (None, None))
+                if room_id == event["room_id"]:
+                    ops.append(session_op(user_id, room_id, entered_at, event["timestamp"]))
+
+            ops = [op for op in ops if op is not None]
+            if ops:
+                db.dwell_sessions.bulk_write(ops, ordered=False)
+            events_done += len(chunk)
+            sessions += len(ops)
+            chunks += 1
+            last = (chunk[-1]["user_id"], chunk[-1]["timestamp"], chunk[-1]["_id"])
+
+        return {"events": events_done, "sessions": sessions, "chunks": chunks}
+
+
+dwell_sessions = DwellSessions()
@@ -0,0 +1,111 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from bson import ObjectId
+
+from utils.fingerprints import MISSING_RSSI, FingerprintIndex
+
+# Margen (segundos) de las cargas incrementales: los ObjectId los generan los
+# clientes, así que los de otros workers no llegan en orden estricto
+LOAD_OVERLAP = 60
+
+
+def scan_vectors(locator, scans):
+    """
+    Escaneos -> matriz (escaneos x beacons) en el orden de columnas del
+    localizador, con MISSING_RSSI para los beacons no vistos.
+    """
+    matrix = locator.rssi_matrix(scans)
+    matrix[np.isnan(matrix)] = MISSING_RSSI
+    return matrix
+
+
+class FingerprintStore:
+    """
+    Índice kNN de huellas RSSI (colección fingerprints) por proceso.
+
+    Se construye desde Mongo para cada versión del grafo (las columnas
+    dependen de los beacons de rooms) y después, cada reload_interval
+    segundos, se leen las huellas con _id generado desde la carga anterior
+    menos LOAD_OVERLAP, para ver las que añaden otros workers; las ya
+    cargadas se saltan por _id. Cada full_reload_interval segundos se
+    reconstruye entero por si algún reloj va más desfasado que el margen.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._since = None
+        self._loaded_ids = set()
+        self._loaded_at = 0.0
+        self._built_at = 0.0
+        self.k = 5
+        self._reload_interval = 30
+        self._full_reload_interval = 600
+
+    def configure(self, config):
+        self.k = config.get("FINGERPRINT_K", 5)
+        self._reload_interval = config.get("FINGERPRINT_RELOAD_INTERVAL", 30)
+        self._full_reload_interval = config.get("FINGERPRINT_FULL_RELOAD_INTERVAL", 600)
+
+    def index(self, db, snapshot):
+        with self._lock:
+            now = time.time()
+            if (self._index is None or self._version != snapshot.version
+                    or now - self._built_at > self._full_reload_interval):
+                self._index = FingerprintIndex(len(snapshot.locator.beacon_index))
+                self._version = snapshot.version
+                self._since = None
+                self._loaded_ids = set()
+                self._built_at = now
+                self._load(db, snapshot)
+            elif now - self._loaded_at > self._reload_interval:
+                self._load(db, snapshot)
+            return self._index
+
+    def add(self, db, snapshot, fingerprints):
+        """
+        Guarda huellas {room_id, beacons} en Mongo y las añade al índice.
+        """
+        index = self.index(db, snapshot)
+        result = db.fingerprints.insert_many(fingerprints)
+
+        with self._lock:
+            # Una carga incremental concurrente puede haberlas leído ya de Mongo
+            fresh = [f for f in fingerprints if f["_id"] not in self._loaded_ids]
+            if self._index is index and fresh:
+                vectors = scan_vectors(snapshot.locator, [f["beacons"] for f in fresh])
+                index.add(vectors, [f["room_id"] for f in fresh])
+                # Ya están en el índice: la siguiente carga incremental las salta
+                self._loaded_ids.update(f["_id"] for f in fresh)
+        return len(result.inserted_ids)
+
+    def stats(self):
+        index = self._index
+        return {
+            "fingerprints": len(index) if index is not None else 0,
+            "rebuilds": index.rebuilds if index is not None else 0,
+            "graph_version": self._version
+        }
+
+    def _load(self, db, snapshot):
+        started = datetime.now(timezone.utc)
+        query = {}
+        if self._since is not None:
+            query = {"_id": {"$gte": ObjectId.from_datetime(self._since - timedelta(seconds=LOAD_OVERLAP))}}
+        docs = [
+            d for d in db.fingerprints.find(query, {"room_id": 1, "beacons": 1})
+            if d["_id"] not in self._loaded_ids
+        ]
+        if docs:
+            self._loaded_ids.update(d["_id"] for d in docs)
+            vectors = scan_vectors(snapshot.locator, [d.get("beacons", []) for d in docs])
+            self._index.add(vectors, [d["room_id"] for d in docs])
+        self._since = started
+        self._loaded_at = time.time()
+
+
+fingerprint_store = FingerprintStore()
@@ -1,14 +1,40 @@
-def build_room_graph(db):
-    rooms = list(db.rooms.find({}, {"_id": 1, "connections": 1}))
+def graph_from_rooms(rooms):
     graph = {}
 
     for room in rooms:
         room_id = room["_id"]
-        graph[room_id] = room.get("connections", [])
+        graph[room_id] = [connection_target(c) for c in room.get("connections", [])]
 
     return graph
 
 
+def connection_target(connection):
+    """
+    Una conexión puede ser solo el id de la habitación ("SALON") o un
+    documento con atributos de la arista:
+    {"room_id": "SALON", "distance": 4.5, "stairs": false, "accessible": true}
+    """
+    if isinstance(connection, dict):
+        return connection["room_id"]
+    return connection
+
+
+def edges_from_rooms(rooms):
+    """
+    Lista de adyacencia con atributos: {room_id: [(vecino, atributos), ...]}.
+    """
+    edges = {}
+
+    for room in rooms:
+        room_id = room["_id"]
+        edges[room_id] = [
+            (connection_target(c), c if isinstance(c, dict) else {})
+            for c in room.get("connections", [])
+        ]
+
+    return edges
+
+
 def bfs(graph, start):
     visited = set()
     queue = [start]
@@ -40,10 +66,6 @@ def dfs(graph, start):
     return order
 
 
-def rooms_to_pois(db, room_route):
-    pois = []
-    for room_id in room_route:
-        room = db.rooms.find_one({"_id": room_id}, {"poi_id": 1})
-        if room:
-            pois.append(room["poi_id"])
-    return pois
+def pois_from_map(poi_by_room, room_route):
+    # Mantiene el orden de la ruta y salta las habitaciones que no existen
+    return [poi_by_room[room_id] for room_id in room_route if room_id in poi_by_room]
@@ -0,0 +1,289 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from db.mongo import get_database
+from utils.beacon_locator import BeaconLocator
+from utils.lru import LRUCache
+from .graph import bfs, dfs, edges_from_rooms, graph_from_rooms, pois_from_map
+from .pathfinding import DistanceTables
+
+logger = logging.getLogger(__name__)
+
+# Campos de rooms que definen el plano y sus metadatos. Los cambios en
+# current_occupancy (que ocurren en cada /position/update) no invalidan el grafo.
+STRUCTURAL_FIELDS = ("connections", "poi_id", "name", "beacons")
+
+TRAVERSALS = {"bfs": bfs, "dfs": dfs}
+
+# Recorridos ya calculados: (algoritmo, habitación inicial, versión) -> (rooms, pois)
+traversal_cache = LRUCache(1024)
+
+
+def rooms_fingerprint(rooms):
+    """
+    Huella de los campos estructurales de las habitaciones.
+    Permite saber si un rebuild ha cambiado realmente el grafo.
+    """
+    h = hashlib.sha1()
+    for room in sorted(rooms, key=lambda r: str(r["_id"])):
+        h.update(repr((room["_id"], [room.get(f) for f in STRUCTURAL_FIELDS])).encode())
+    return h.hexdigest()
+
+
+class GraphSnapshot:
+    """
+    Foto inmutable del grafo de habitaciones en una versión concreta.
+    """
+
+    def __init__(self, graph, rooms, version, fingerprint, distance_tables):
+        self.graph = graph
+        # Aristas con atributos (distance, stairs, accessible) para rutas ponderadas
+        self.edges = distance_tables.edges
+        # Metadatos por habitación (poi_id, name, beacons), compartidos con las rutas
+        self.rooms = rooms
+        self.poi_by_room = {room_id: meta.get("poi_id") for room_id, meta in rooms.items()}
+        self._locator = None
+        self.version = version
+        self.fingerprint = fingerprint
+        # Distancias y siguientes saltos precalculados para /routes/shortest
+        self.distance_tables = distance_tables
+        self.built_at = time.time()
+
+    @property
+    def locator(self):
+        """
+        Localizador por beacons de esta versión (matriz de cobertura).
+        """
+        if self._locator is None:
+            self._locator = BeaconLocator({
+                room_id: dict(meta, connections=self.graph.get(room_id, []))
+                for room_id, meta in self.rooms.items()
+            })
+        return self._locator
+
+
+class RoomGraphCache:
+    """
+    Cache a nivel de proceso del grafo de habitaciones.
+
+    - La versión solo sube cuando el contenido del grafo cambia.
+    - Se invalida explícitamente (invalidate), por TTL o por el hilo
+      vigilante (change stream de Mongo o polling si no hay replica set).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._stale = True
+        self._invalidation_seq = 0
+        self._version = 0
+        self._ttl = 0
+        self._watch_mode = "off"
+        self._poll_interval = 30
+        self._stairs_penalty = 0.0
+        self._config = None
+        self._watcher = None
+        self._watcher_pid = None
+        self._stop = threading.Event()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "rebuilds": 0,
+            "invalidations": 0
+        }
+
+    def configure(self, config):
+        self._config = config
+        self._ttl = config.get("GRAPH_CACHE_TTL", 0)
+        self._watch_mode = config.get("GRAPH_CACHE_WATCH", "off")
+        self._poll_interval = config.get("GRAPH_CACHE_POLL_INTERVAL", 30)
+        self._stairs_penalty = config.get("ROUTE_STAIRS_PENALTY", 0.0)
+        traversal_cache.maxsize = config.get("TRAVERSAL_CACHE_SIZE", 1024)
+
+    @property
+    def version(self):
+        return self._version
+
+    def get(self, db):
+        """
+        Devuelve el GraphSnapshot vigente, reconstruyéndolo si hace falta.
+        """
+        self._ensure_watcher()
+
+        snapshot = self._snapshot
+        if snapshot is not None and not self._stale and not self._expired(snapshot):
+            self._stats["hits"] += 1
+            return snapshot
+
+        with self._lock:
+            # Otro hilo puede haberlo reconstruido mientras esperábamos
+            snapshot = self._snapshot
+            if snapshot is not None and not self._stale and not self._expired(snapshot):
+                self._stats["hits"] += 1
+                return snapshot
+
+            self._stats["misses"] += 1
+            return self._rebuild(db)
+
+    def invalidate(self, reason="manual"):
+        self._invalidation_seq += 1
+        self._stale = True
+        self._stats["invalidations"] += 1
+        logger.debug("room graph invalidated (%s)", reason)
+
+    def stats(self):
+        snapshot = self._snapshot
+        return dict(
+            self._stats,
+            traversal_cache=traversal_cache.stats(),
+            version=self._version,
+            stale=self._stale,
+            watch_mode=self._watch_mode,
+            rooms=len(snapshot.graph) if snapshot else 0,
+            built_at=snapshot.built_at if snapshot else None
+        )
+
+    def stop(self):
+        self._stop.set()
+
+    def _expired(self, snapshot):
+        return bool(self._ttl) and time.time() - snapshot.built_at > self._ttl
+
+    def _rebuild(self, db):
+        seq = self._invalidation_seq
+        rooms = list(db.rooms.find({}, {"_id": 1, **{f: 1 for f in STRUCTURAL_FIELDS}}))
+        fingerprint = rooms_fingerprint(rooms)
+
+        previous = self._snapshot
+        if previous is not None and previous.fingerprint == fingerprint:
+            # Mismo plano: se reutilizan las tablas de distancias ya calculadas
+            distance_tables = previous.distance_tables
+        else:
+            self._version += 1
+            # Los recorridos de versiones anteriores ya no sirven
+            traversal_cache.clear()
+            edges = edges_from_rooms(rooms)
+            distance_tables = DistanceTables(edges, self._stairs_penalty)
+            # Precalcular el perfil por defecto al cambiar el grafo
+            distance_tables.get("default")
+
+        metadata = {
+            room["_id"]: {
+                "poi_id": room.get("poi_id"),
+                "name": room.get("name"),
+                "beacons": room.get("beacons", [])
+            }
+            for room in rooms
+        }
+        snapshot = GraphSnapshot(
+            graph_from_rooms(rooms),
+            metadata,
+            self._version,
+            fingerprint,
+            distance_tables
+        )
+        self._snapshot = snapshot
+        # Si llegó una invalidación durante la lectura, el siguiente get reconstruye
+        self._stale = seq != self._invalidation_seq
+        self._stats["rebuilds"] += 1
+        return snapshot
+
+    # ------------------------------------------------------------------
+    # Vigilancia de cambios en rooms
+    # ------------------------------------------------------------------
+
+    def _ensure_watcher(self):
+        if self._watch_mode == "off" or self._config is None:
+            return
+        pid = os.getpid()
+        if self._watcher_pid == pid:
+            return
+        with self._lock:
+            if self._watcher_pid == pid:
+                return
+            # Tras un fork los hilos del padre no existen: arrancamos uno nuevo
+            self._stop = threading.Event()
+            self._watcher = threading.Thread(
+                target=self._watch, name="room-graph-watcher", daemon=True
+            )
+            self._watcher_pid = pid
+            self._watcher.start()
+
+    def _watch(self):
+        db = get_database(self._config)
+        mode = self._watch_mode
+
+        while mode in ("changestream", "auto") and not self._stop.is_set():
+            try:
+                self._watch_change_stream(db)
+                return
+            except OperationFailure as e:
+                # Los change streams requieren replica set
+                if mode == "changestream":
+                    logger.error("room graph change stream failed: %s", e)
+                    return
+                logger.info("change streams not available, polling rooms instead")
+                break
+            except PyMongoError as e:
+                # Error transitorio: podemos haber perdido eventos
+                logger.warning("room graph change stream interrupted: %s", e)
+                self.invalidate("change_stream_error")
+                self._stop.wait(self._poll_interval)
+
+        self._watch_polling(db)
+
+    def _watch_change_stream(self, db):
+        with db.rooms.watch() as stream:
+            while not self._stop.is_set():
+                change = stream.try_next()
+                if change is None:
+                    continue
+                if self._is_structural_change(change):
+                    self.invalidate("change_stream")
+
+    @staticmethod
+    def _is_structural_change(change):
+        if change.get("operationType") != "update":
+            return True
+        description = change.get("updateDescription", {})
+        touched = set(description.get("updatedFields", {})) | set(description.get("removedFields", []))
+        return any(field.split(".")[0] in STRUCTURAL_FIELDS for field in touched)
+
+    def _watch_polling(self, db):
+        while not self._stop.wait(self._poll_interval):
+            snapshot = self._snapshot
+            if snapshot is None or self._stale:
+                continue
+            try:
+                rooms = db.rooms.find({}, {"_id": 1, **{f: 1 for f in STRUCTURAL_FIELDS}})
+                if rooms_fingerprint(list(rooms)) != snapshot.fingerprint:
+                    self.invalidate("polling")
+            except PyMongoError as e:
+                logger.warning("room graph polling failed: %s", e)
+
+
+def cached_traversal(snapshot, algorithm, start_room):
+    """
+    Recorrido bfs/dfs desde start_room con sus POIs, memorizado por versión
+    del grafo. Devuelve (rooms, pois) como tuplas, o None si el algoritmo
+    no existe.
+    """
+    traverse = TRAVERSALS.get(algorithm)
+    if traverse is None:
+        return None
+
+    key = (algorithm, start_room, snapshot.version)
+    result = traversal_cache.get(key)
+    if result is None:
+        room_route = tuple(traverse(snapshot.graph, start_room))
+        result = (room_route, tuple(pois_from_map(snapshot.poi_by_room, room_route)))
+        traversal_cache.put(key, result)
+    return result
+
+
+room_graph_cache = RoomGraphCache()
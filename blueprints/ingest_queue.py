@@ -0,0 +1,138 @@
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+
+from db.mongo import get_database
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class IngestionQueue:
+    """
+    Cola acotada en memoria para /position/update en modo asíncrono.
+
+    Hay una cola por worker y cada usuario va siempre a la misma
+    (shard por user_id), así sus actualizaciones se aplican en orden.
+    Si la cola de su shard está llena, submit devuelve False (-> 429).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues = []
+        self._threads = []
+        self._pid = None
+        self._accepting = False
+        self._stop = threading.Event()
+        self._handler = None
+        self._config = None
+        self.enabled = False
+        self._workers = 4
+        self._queue_size = 1000
+        self._stats = {
+            "accepted": 0,
+            "rejected": 0,
+            "processed": 0,
+            "failed": 0
+        }
+
+    def configure(self, config):
+        self._config = config
+        self.enabled = config.get("POSITION_ASYNC", False)
+        self._workers = max(1, config.get("POSITION_ASYNC_WORKERS", 4))
+        self._queue_size = config.get("POSITION_ASYNC_QUEUE_SIZE", 1000)
+
+    def set_handler(self, handler):
+        """
+        handler(db, config, update) aplica una actualización ya validada.
+        """
+        self._handler = handler
+
+    def submit(self, update):
+        self._ensure_workers()
+        if not self._accepting:
+            self._stats["rejected"] += 1
+            return False
+
+        shard = zlib.crc32(str(update["user_id"]).encode()) % len(self._queues)
+        try:
+            self._queues[shard].put_nowait(update)
+        except queue.Full:
+            self._stats["rejected"] += 1
+            return False
+
+        self._stats["accepted"] += 1
+        return True
+
+    def stats(self):
+        return dict(
+            self._stats,
+            enabled=self.enabled,
+            workers=len(self._threads),
+            depth=[q.qsize() for q in self._queues]
+        )
+
+    def shutdown(self, timeout=10):
+        """
+        Deja de aceptar y espera como mucho timeout segundos (en total) a
+        que los workers vacíen sus colas. Nunca se bloquea en una cola
+        llena (p.ej. con Mongo caído): los workers ven el evento de parada
+        y terminan al quedarse sin trabajo; lo que quede se pierde al salir.
+        """
+        if self._pid != os.getpid():
+            return
+        self._accepting = False
+        self._stop.set()
+        for q in self._queues:
+            try:
+                q.put_nowait(_STOP)
+            except queue.Full:
+                pass
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0, deadline - time.monotonic()))
+
+    def _ensure_workers(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # Tras un fork las colas y los hilos del padre no sirven
+            self._stop = threading.Event()
+            self._queues = [queue.Queue(self._queue_size) for _ in range(self._workers)]
+            self._threads = [
+                threading.Thread(target=self._run, args=(q, self._stop), name=f"position-writer-{i}", daemon=True)
+                for i, q in enumerate(self._queues)
+            ]
+            for t in self._threads:
+                t.start()
+            self._pid = pid
+            self._accepting = True
+
+    def _run(self, q, stop):
+        db = get_database(self._config)
+        while True:
+            try:
+                update = q.get(timeout=0.5)
+            except queue.Empty:
+                if stop.is_set():
+                    break
+                continue
+            if update is _STOP:
+                break
+            try:
+                self._handler(db, self._config, update)
+                self._stats["processed"] += 1
+            except Exception:
+                # Un error en una actualización no debe parar el worker
+                logger.exception("position update failed for %s", update.get("user_id"))
+                self._stats["failed"] += 1
+
+
+ingestion_queue = IngestionQueue()
@@ -0,0 +1,129 @@
+import bisect
+import threading
+import time
+
+from pymongo.errors import PyMongoError
+
+
+class OccupancyTracker:
+    """
+    Foto en memoria de current_occupancy por habitación para el enrutado.
+
+    - update_position aplica los deltas de este proceso al momento.
+    - Cada refresh_interval se relee rooms (una sola consulta) para recoger
+      los cambios hechos por otros workers.
+    - La ocupación se discretiza en niveles según los umbrales configurados;
+      la generación solo sube cuando algún nivel cambia, así las rutas
+      precalculadas solo se recalculan cuando la ocupación cruza un umbral.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._levels = {}
+        self._generation = 0
+        self._version = 0
+        self._refreshed_at = 0.0
+        self._thresholds = [5, 10, 20]
+        self._refresh_interval = 5
+        self._listeners = []
+        self._pending_source = None
+
+    def configure(self, config):
+        self._thresholds = sorted(config.get("ROUTE_OCCUPANCY_THRESHOLDS", self._thresholds))
+        self._refresh_interval = config.get("ROUTE_OCCUPANCY_REFRESH_INTERVAL", 5)
+
+    @property
+    def generation(self):
+        return self._generation
+
+    @property
+    def version(self):
+        """
+        Sube con cualquier cambio de un contador (ETag de /rooms/occupancy).
+        """
+        return self._version
+
+    def level(self, count):
+        return bisect.bisect_right(self._thresholds, count)
+
+    def levels(self, db):
+        """
+        Devuelve (niveles por habitación, generación), refrescando si toca.
+        """
+        if time.time() - self._refreshed_at > self._refresh_interval:
+            self.refresh(db)
+        return self._levels, self._generation
+
+    def counts(self):
+        return dict(self._counts)
+
+    def snapshot(self, db):
+        """
+        Ocupación actual por habitación, refrescando si toca.
+        """
+        if time.time() - self._refreshed_at > self._refresh_interval:
+            self.refresh(db)
+        return self.counts()
+
+    def set_pending_source(self, source):
+        """
+        source() devuelve deltas aún no escritos en Mongo ({room_id: delta});
+        se suman a lo leído en cada refresco para no perderlos.
+        """
+        self._pending_source = source
+
+    def add_listener(self, callback):
+        """
+        callback(room_id, count) se llama cada vez que cambia un contador
+        (deltas locales, refrescos o change stream).
+        """
+        self._listeners.append(callback)
+
+    def refresh(self, db):
+        try:
+            cursor = db.rooms.find({}, {"_id": 1, "current_occupancy": 1})
+            counts = {r["_id"]: r.get("current_occupancy", 0) for r in cursor}
+        except PyMongoError:
+            # Seguimos con la foto anterior; se reintenta en el siguiente intervalo
+            self._refreshed_at = time.time()
+            return
+
+        with self._lock:
+            pending = self._pending_source() if self._pending_source else {}
+            for room_id in set(self._counts) - set(counts):
+                del self._counts[room_id]
+                self._version += 1
+            for room_id, count in counts.items():
+                self._set(room_id, count + pending.get(room_id, 0))
+            self._refreshed_at = time.time()
+
+    def apply_delta(self, room_id, delta):
+        with self._lock:
+            self._set(room_id, self._counts.get(room_id, 0) + delta)
+
+    def set_count(self, room_id, count):
+        """
+        Valor leído de Mongo (change stream): se le suman los deltas locales
+        aún no volcados, igual que en refresh().
+        """
+        with self._lock:
+            pending = self._pending_source() if self._pending_source else {}
+            self._set(room_id, count + pending.get(room_id, 0))
+
+    def _set(self, room_id, count):
+        if self._counts.get(room_id, 0) != count:
+            self._version += 1
+            for callback in self._listeners:
+                callback(room_id, count)
+        self._counts[room_id] = count
+        level = self.level(count)
+        if self._levels.get(room_id, 0) != level:
+            # Copia para no mutar el dict que puedan estar leyendo otros hilos
+            levels = dict(self._levels)
+            levels[room_id] = level
+            self._levels = levels
+            self._generation += 1
+
+
+occupancy_tracker = OccupancyTracker()
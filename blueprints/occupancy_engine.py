@@ -0,0 +1,137 @@
+import logging
+import os
+import threading
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from db.mongo import get_database
+from .occupancy import occupancy_tracker
+
+logger = logging.getLogger(__name__)
+
+
+class OccupancyEngine:
+    """
+    Contadores de ocupación en memoria (modo opcional OCCUPANCY_ENGINE).
+
+    update_position ya no hace $inc en rooms en cada entrada/salida: los
+    deltas se acumulan aquí y se escriben con un único bulk_write ($inc
+    por habitación) cada flush_interval segundos. Al usar $inc, varios
+    workers pueden volcar sus deltas sin pisarse.
+    Los contadores se leen del OccupancyTracker (Mongo + deltas pendientes).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._config = None
+        self.enabled = False
+        self._flush_interval = 1
+        self._flusher_pid = None
+        self._stop = threading.Event()
+        self._stats = {"flushes": 0, "flush_errors": 0, "rebuilds": 0}
+
+    def configure(self, config):
+        self._config = config
+        self.enabled = config.get("OCCUPANCY_ENGINE", False)
+        self._flush_interval = config.get("OCCUPANCY_FLUSH_INTERVAL", 1)
+        if self.enabled:
+            occupancy_tracker.set_pending_source(self.pending)
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def apply_delta(self, room_id, delta):
+        self._ensure_flusher()
+        with self._lock:
+            self._pending[room_id] = self._pending.get(room_id, 0) + delta
+        occupancy_tracker.apply_delta(room_id, delta)
+
+    def counts(self, db):
+        return occupancy_tracker.snapshot(db)
+
+    def rebuild(self, db):
+        """
+        Recalcula la ocupación a partir de users_state (fuente de verdad de
+        dónde está cada usuario) y la persiste en rooms. Se ejecuta una vez
+        con rebuild_occupancy.py, con los workers parados: si otro proceso
+        tiene deltas sin volcar de transiciones ya guardadas en users_state,
+        se contarían dos veces. Devuelve la ocupación por habitación.
+        """
+        counts = {
+            r["_id"]: r["count"]
+            for r in db.users_state.aggregate([
+                {"$match": {"current_room": {"$ne": None}}},
+                {"$group": {"_id": "$current_room", "count": {"$sum": 1}}}
+            ])
+        }
+        room_ids = [r["_id"] for r in db.rooms.find({}, {"_id": 1})]
+        if room_ids:
+            db.rooms.bulk_write([
+                UpdateOne({"_id": room_id}, {"$set": {"current_occupancy": counts.get(room_id, 0)}})
+                for room_id in room_ids
+            ], ordered=False)
+
+        with self._lock:
+            self._pending = {}
+        occupancy_tracker.refresh(db)
+        self._stats["rebuilds"] += 1
+        return {room_id: counts.get(room_id, 0) for room_id in room_ids}
+
+    def flush(self, db=None):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        ops = [
+            UpdateOne({"_id": room_id}, {"$inc": {"current_occupancy": delta}})
+            for room_id, delta in pending.items() if delta != 0
+        ]
+        if not ops:
+            return 0
+
+        try:
+            if db is None:
+                db = get_database(self._config)
+            db.rooms.bulk_write(ops, ordered=False)
+        except PyMongoError as e:
+            logger.warning("occupancy flush failed: %s", e)
+            self._stats["flush_errors"] += 1
+            # Reincorporar los deltas para el siguiente intento
+            with self._lock:
+                for room_id, delta in pending.items():
+                    self._pending[room_id] = self._pending.get(room_id, 0) + delta
+            return 0
+
+        self._stats["flushes"] += 1
+        return len(ops)
+
+    def stats(self):
+        return dict(self._stats, enabled=self.enabled, pending=self.pending())
+
+    def stop(self):
+        self._stop.set()
+        if self.enabled and self._config is not None:
+            self.flush()
+
+    def _ensure_flusher(self):
+        pid = os.getpid()
+        if self._flusher_pid == pid:
+            return
+        with self._lock:
+            if self._flusher_pid == pid:
+                return
+            # Los deltas heredados del padre ya los volcará el padre
+            self._pending = {}
+            self._stop = threading.Event()
+            self._flusher_pid = pid
+            threading.Thread(target=self._run, name="occupancy-flusher", daemon=True).start()
+
+    def _run(self):
+        db = get_database(self._config)
+        while not self._stop.wait(self._flush_interval):
+            self.flush(db)
+
+
+occupancy_engine = OccupancyEngine()
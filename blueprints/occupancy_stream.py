@@ -0,0 +1,128 @@
+import itertools
+import logging
+import os
+import queue
+import threading
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from db.mongo import get_database
+from .occupancy import occupancy_tracker
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    Cola acotada de un cliente SSE. Si se llena, el cliente es lento y se
+    le expulsa (tendrá que reconectar y recibirá un snapshot nuevo).
+    """
+
+    def __init__(self, max_pending):
+        self.queue = queue.Queue(max_pending)
+        self.evicted = False
+
+
+class OccupancyBroker:
+    """
+    Pub/sub en proceso de cambios de ocupación para /rooms/occupancy/stream.
+
+    Se alimenta del OccupancyTracker: los deltas de update_position de este
+    proceso llegan al momento y los de otros workers por change stream de
+    rooms (si hay replica set) o por refresco periódico.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._sequence = itertools.count(1)
+        self._config = None
+        self._feeder_pid = None
+        self._stop = threading.Event()
+        self.heartbeat_interval = 15
+        self._max_pending = 100
+        self._refresh_interval = 5
+        self._stats = {"published": 0, "evicted": 0}
+        occupancy_tracker.add_listener(self.publish)
+
+    def configure(self, config):
+        self._config = config
+        self.heartbeat_interval = config.get("OCCUPANCY_STREAM_HEARTBEAT", 15)
+        self._max_pending = config.get("OCCUPANCY_STREAM_MAX_PENDING", 100)
+        self._refresh_interval = config.get("ROUTE_OCCUPANCY_REFRESH_INTERVAL", 5)
+
+    def subscribe(self):
+        self._ensure_feeder()
+        subscription = Subscription(self._max_pending)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, room_id, count):
+        if not self._subscribers:
+            return
+
+        message = (next(self._sequence), {room_id: count})
+        self._stats["published"] += 1
+
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                subscription.evicted = True
+                self._stats["evicted"] += 1
+                self.unsubscribe(subscription)
+
+    def stats(self):
+        return dict(self._stats, subscribers=len(self._subscribers))
+
+    def stop(self):
+        self._stop.set()
+
+    def _ensure_feeder(self):
+        if self._config is None:
+            return
+        pid = os.getpid()
+        if self._feeder_pid == pid:
+            return
+        with self._lock:
+            if self._feeder_pid == pid:
+                return
+            self._stop = threading.Event()
+            self._feeder_pid = pid
+            threading.Thread(target=self._feed, name="occupancy-feeder", daemon=True).start()
+
+    def _feed(self):
+        db = get_database(self._config)
+        try:
+            self._feed_change_stream(db)
+            return
+        except OperationFailure:
+            logger.info("change streams not available, refreshing occupancy periodically")
+        except PyMongoError as e:
+            logger.warning("occupancy change stream interrupted: %s", e)
+
+        while not self._stop.wait(self._refresh_interval):
+            if self._subscribers:
+                occupancy_tracker.refresh(db)
+
+    def _feed_change_stream(self, db):
+        pipeline = [{"$match": {"operationType": "update"}}]
+        with db.rooms.watch(pipeline) as stream:
+            while not self._stop.is_set():
+                change = stream.try_next()
+                if change is None:
+                    continue
+                fields = change.get("updateDescription", {}).get("updatedFields", {})
+                if "current_occupancy" in fields:
+                    occupancy_tracker.set_count(change["documentKey"]["_id"], fields["current_occupancy"])
+
+
+occupancy_broker = OccupancyBroker()
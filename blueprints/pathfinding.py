@@ -0,0 +1,137 @@
+import heapq
+import math
+import threading
+
+# Perfiles de ruta: el accesible no usa escaleras ni aristas no accesibles
+PROFILES = ("default", "accessible")
+
+DEFAULT_DISTANCE = 1.0
+
+
+def edge_cost(attrs, profile="default", stairs_penalty=0.0):
+    """
+    Coste de recorrer una arista según sus atributos.
+    Devuelve None si la arista no se puede usar con ese perfil.
+    """
+    stairs = attrs.get("stairs", False)
+    if profile == "accessible" and (stairs or attrs.get("accessible", True) is False):
+        return None
+
+    cost = float(attrs.get("distance", DEFAULT_DISTANCE))
+    if stairs:
+        cost += stairs_penalty
+    return cost
+
+
+def dijkstra(edges, source, cost):
+    """
+    Dijkstra desde source. cost(origen, destino, atributos) -> float o None.
+    Devuelve (distancias, primer salto desde source hacia cada nodo).
+    """
+    dist = {source: 0.0}
+    first_hop = {source: source}
+    heap = [(0.0, source)]
+
+    while heap:
+        d, room = heapq.heappop(heap)
+        if d > dist.get(room, math.inf):
+            continue
+        for neighbor, attrs in edges.get(room, []):
+            w = cost(room, neighbor, attrs)
+            if w is None:
+                continue
+            nd = d + w
+            if nd < dist.get(neighbor, math.inf):
+                dist[neighbor] = nd
+                # El primer salto se hereda salvo si salimos directamente de source
+                first_hop[neighbor] = neighbor if room == source else first_hop[room]
+                heapq.heappush(heap, (nd, neighbor))
+
+    return dist, first_hop
+
+
+class DistanceTable:
+    """
+    Distancias y siguientes saltos entre todos los pares de habitaciones.
+    Una vez calculada, cada consulta es O(longitud del camino).
+    """
+
+    def __init__(self, edges, cost):
+        self.dist = {}
+        self.next_hop = {}
+        for room in edges:
+            self.dist[room], self.next_hop[room] = dijkstra(edges, room, cost)
+
+    def distance(self, start, target):
+        return self.dist.get(start, {}).get(target)
+
+    def path(self, start, target):
+        hops = self.next_hop.get(start, {})
+        if target not in hops:
+            return None
+
+        path = [start]
+        room = start
+        while room != target:
+            room = self.next_hop[room][target]
+            path.append(room)
+        return path
+
+
+class DistanceTables:
+    """
+    Tablas por perfil asociadas a una versión del grafo. Se calculan la
+    primera vez que se piden y se descartan junto con el snapshot.
+    """
+
+    def __init__(self, edges, stairs_penalty=0.0):
+        self.edges = edges
+        self._stairs_penalty = stairs_penalty
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def get(self, profile="default"):
+        table = self._tables.get(profile)
+        if table is not None:
+            return table
+
+        with self._lock:
+            table = self._tables.get(profile)
+            if table is None:
+                table = DistanceTable(self.edges, self._cost(profile))
+                self._tables[profile] = table
+        return table
+
+    def get_crowd_aware(self, profile, levels, generation, penalty):
+        """
+        Tabla con el coste de entrar en cada habitación penalizado por su
+        nivel de ocupación. Solo se recalcula cuando cambia la generación
+        de niveles (la ocupación ha cruzado algún umbral).
+        """
+        key = ("crowd", profile)
+        cached = self._tables.get(key)
+        if cached is not None and cached[0] == generation:
+            return cached[1]
+
+        with self._lock:
+            cached = self._tables.get(key)
+            if cached is None or cached[0] != generation:
+                base_cost = self._cost(profile)
+
+                def cost(room, neighbor, attrs):
+                    w = base_cost(room, neighbor, attrs)
+                    if w is None:
+                        return None
+                    return w + penalty * levels.get(neighbor, 0)
+
+                cached = (generation, DistanceTable(self.edges, cost))
+                self._tables[key] = cached
+        return cached[1]
+
+    def _cost(self, profile):
+        penalty = self._stairs_penalty
+
+        def cost(room, neighbor, attrs):
+            return edge_cost(attrs, profile, penalty)
+
+        return cost
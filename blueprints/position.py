@@ -1,9 +1,195 @@
-from flask import Blueprint, request, jsonify
+import uuid
+
+from flask import Blueprint, current_app, request, jsonify
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from db.mongo import get_db
-from utils.time_utils import now_iso
+from utils.smoothing import room_smoother
+from utils.time_utils import event_datetime, now_iso
+from .graph_cache import room_graph_cache
+from .occupancy import occupancy_tracker
+from .occupancy_engine import occupancy_engine
+from .rollups import room_rollups
+from .dwell import dwell_sessions, session_op
+from .stay_coalescer import stay_coalescer
+from .ingest_queue import ingestion_queue
+from .fingerprint_store import fingerprint_store, scan_vectors
 
 position_bp = Blueprint("position", __name__)
 
+def room_exists(db, room_id):
+    """
+    Valida la habitación contra los metadatos del grafo cacheado y solo
+    consulta Mongo si no aparece (p.ej. habitación recién creada).
+    """
+    if room_id in room_graph_cache.get(db).rooms:
+        return True
+    return db.rooms.find_one({"_id": room_id}, {"_id": 1}) is not None
+
+
+def _state_update(user_id, detected_room, confidence, timestamp):
+    """
+    Pipeline de actualización de users_state. Las expresiones se evalúan
+    sobre el documento anterior, así que en la misma operación atómica se
+    decide si es "stay" o "enter" sin leer antes el estado.
+    """
+    same_room = {"$eq": ["$current_room", {"$literal": detected_room}]}
+    return [{
+        "$set": {
+            "user_id": {"$literal": user_id},
+            "last_event": {"$cond": [same_room, "stay", "enter"]},
+            "last_room_change": {"$cond": [same_room, "$last_room_change", {"$literal": timestamp}]},
+            "current_room": {"$literal": detected_room},
+            "last_update": {"$literal": timestamp},
+            "confidence": {"$literal": confidence}
+        }
+    }]
+
+
+def apply_transition(db, user_id, detected_room, confidence, timestamp):
+    """
+    Aplica una detección al estado del usuario con el mínimo de viajes a Mongo:
+    1 find_one_and_update atómico (devuelve la habitación anterior y desde
+    cuándo estaba en ella), 1 insert_many de eventos y 1 bulk_write de
+    ocupación (más los rollups y la visita cerrada, si están activos).
+    Devuelve el cuerpo de respuesta (enter / stay / room_changed).
+    """
+    result, deltas = write_transition(db, user_id, detected_room, confidence, timestamp)
+    apply_memory_deltas(deltas)
+    return result
+
+
+def write_transition(db, user_id, detected_room, confidence, timestamp, session=None):
+    """
+    Escrituras en Mongo de apply_transition. Devuelve (respuesta, deltas de
+    ocupación); los contadores en memoria no se tocan aquí porque dentro de
+    una transacción esto puede repetirse o abortarse.
+    """
+    try:
+        previous = db.users_state.find_one_and_update(
+            {"user_id": user_id},
+            _state_update(user_id, detected_room, confidence, timestamp),
+            projection={"_id": 0, "current_room": 1, "last_room_change": 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+            session=session
+        )
+    except DuplicateKeyError:
+        # Dos upserts simultáneos del mismo usuario nuevo: el otro ganó.
+        # Dentro de una transacción ya está abortada: reintenta quien la abrió
+        if session is not None:
+            raise
+        previous = db.users_state.find_one_and_update(
+            {"user_id": user_id},
+            _state_update(user_id, detected_room, confidence, timestamp),
+            projection={"_id": 0, "current_room": 1, "last_room_change": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+
+    current_room = previous.get("current_room") if previous else None
+
+    if current_room == detected_room:
+        # Mismo cuarto: "stay"
+        return {"status": "ok", "event": "stay", "room": detected_room}, {}
+
+    events = []
+    deltas = {}
+
+    if current_room is not None:
+        # Evento exit de current_room. Sin filtro $gt: 0: cada -1 se empareja
+        # con el +1 de la transición anterior del mismo usuario, así que el
+        # contador no deriva aunque ese +1 llegue después por concurrencia
+        events.append({
+            "user_id": user_id,
+            "room_id": current_room,
+            "event": "exit",
+            "timestamp": timestamp,
+            "event_at": event_datetime(timestamp),
+            "confidence": confidence
+        })
+        deltas[current_room] = -1
+
+    # Evento enter de detected_room
+    events.append({
+        "user_id": user_id,
+        "room_id": detected_room,
+        "event": "enter",
+        "timestamp": timestamp,
+        "event_at": event_datetime(timestamp),
+        "confidence": confidence
+    })
+    deltas[detected_room] = 1
+
+    db.room_events.insert_many(events, session=session)
+    counts = apply_occupancy_deltas(db, deltas, session=session)
+    room_rollups.record(db, events, session=session, pending=deltas, counts=counts)
+    if current_room is not None:
+        # La salida cierra la visita que empezó en last_room_change
+        dwell_sessions.record(db, [
+            session_op(user_id, current_room, previous.get("last_room_change"), timestamp)
+        ], session=session)
+
+    if current_room is None:
+        return {"status": "ok", "event": "enter", "room": detected_room}, deltas
+    return {"status": "ok", "event": "room_changed", "from": current_room, "to": detected_room}, deltas
+
+
+def apply_occupancy_deltas(db, deltas, session=None):
+    """
+    Escribe los cambios de ocupación en rooms con un único bulk_write de
+    $inc, sin límite inferior (todas las rutas de escritura usan la misma
+    regla). Con el motor en memoria no se escribe nada: se vuelcan en bloque.
+    Devuelve la ocupación resultante de esas habitaciones leída de rooms
+    (para los picos de room_rollups) o None con el motor.
+    """
+    if occupancy_engine.enabled:
+        return None
+
+    ops = [
+        UpdateOne({"_id": room_id}, {"$inc": {"current_occupancy": delta}})
+        for room_id, delta in deltas.items() if delta != 0
+    ]
+    if not ops:
+        return {}
+    db.rooms.bulk_write(ops, ordered=False, session=session)
+    cursor = db.rooms.find({"_id": {"$in": list(deltas)}}, {"current_occupancy": 1}, session=session)
+    return {r["_id"]: r.get("current_occupancy", 0) for r in cursor}
+
+
+def apply_memory_deltas(deltas):
+    """
+    Aplica los cambios de ocupación ya confirmados al motor en memoria (que
+    los volcará a rooms) o a la foto del OccupancyTracker.
+    """
+    for room_id, delta in deltas.items():
+        if occupancy_engine.enabled:
+            occupancy_engine.apply_delta(room_id, delta)
+        else:
+            occupancy_tracker.apply_delta(room_id, delta)
+
+
+def apply_transition_transactional(db, user_id, detected_room, confidence, timestamp):
+    """
+    Igual que apply_transition pero dentro de una transacción (requiere
+    replica set): estado, eventos y ocupación se confirman juntos. Los
+    contadores en memoria se actualizan una sola vez, tras el commit.
+    """
+    def run():
+        with db.client.start_session() as session:
+            return session.with_transaction(
+                lambda s: write_transition(db, user_id, detected_room, confidence, timestamp, session=s)
+            )
+
+    try:
+        result, deltas = run()
+    except DuplicateKeyError:
+        # Otro request ha creado el usuario a la vez; la transacción se
+        # abortó, se repite entera sobre el documento que ya existe
+        result, deltas = run()
+    apply_memory_deltas(deltas)
+    return result
+
+
 @position_bp.route("/update", methods=["POST"])
 def update_position():
     """
@@ -16,135 +202,458 @@ def update_position():
     user_id = data.get("user_id")
     detected_room = data.get("detected_room")
     confidence = data.get("confidence", None)
-    timestamp = data.get("timestamp", now_iso())
+    timestamp = data.get("timestamp") or now_iso()
 
     if not user_id or not detected_room:
         return jsonify({"error": "user_id and detected_room are required"}), 400
 
-    users_state = db.users_state
-    rooms = db.rooms
-    room_events = db.room_events
+    if not isinstance(user_id, str) or not isinstance(detected_room, str):
+        return jsonify({"error": "user_id and detected_room must be strings"}), 400
+
+    if not isinstance(timestamp, str):
+        return jsonify({"error": "timestamp must be an ISO 8601 string"}), 400
 
     # Validar que la habitación existe
-    room = rooms.find_one({"_id": detected_room})
-    if not room:
+    if not room_exists(db, detected_room):
         return jsonify({"error": f"room {detected_room} not found"}), 404
 
-    user_state = users_state.find_one({"user_id": user_id})
-
-    # Si el usuario no tenía estado previo
-    if not user_state:
-        # Insertar estado nuevo
-        users_state.insert_one({
+    # Modo asíncrono: se encola y se responde sin esperar a Mongo
+    if ingestion_queue.enabled:
+        update = {
             "user_id": user_id,
-            "current_room": detected_room,
-            "last_update": timestamp,
+            "detected_room": detected_room,
             "confidence": confidence,
-            "last_event": "enter",
-            "last_room_change": timestamp
-        })
+            "timestamp": timestamp
+        }
+        if not ingestion_queue.submit(update):
+            return jsonify({"error": "ingestion queue full"}), 429, {"Retry-After": "1"}
+        return jsonify({"status": "accepted"}), 202
 
-        # Evento de entrada
-        room_events.insert_one({
-            "user_id": user_id,
-            "room_id": detected_room,
-            "event": "enter",
-            "timestamp": timestamp,
-            "confidence": confidence
-        })
+    result = process_update(db, current_app.config, user_id, detected_room, confidence, timestamp)
+    return jsonify(result), 200
 
-        # Incrementar ocupación
-        rooms.update_one({"_id": detected_room}, {"$inc": {"current_occupancy": 1}})
 
-        return jsonify({
-            "status": "ok",
-            "event": "enter",
-            "room": detected_room
-        }), 200
+def process_update(db, config, user_id, detected_room, confidence, timestamp):
+    """
+    Aplica una detección ya validada (desde el request o desde la cola).
+    """
+    # Suavizado: solo se confirma un cambio de habitación cuando es estable
+    if room_smoother.enabled:
+        committed_room, changed = room_smoother.decide(
+            user_id, detected_room, confidence, timestamp,
+            stored_room=lambda: _stored_room(db, user_id)
+        )
+        if changed:
+            result = _apply_detection(db, config, user_id, committed_room, confidence, timestamp)
+        else:
+            result = _apply_stay(db, config, user_id, committed_room, confidence, timestamp)
+        if result.get("room", result.get("to")) != detected_room:
+            result = dict(result, detected_room=detected_room)
+        return result
 
-    # Usuario ya tiene estado
-    current_room = user_state["current_room"]
+    return _apply_detection(db, config, user_id, detected_room, confidence, timestamp)
 
-    if current_room == detected_room:
-        # Mismo cuarto: "stay"
-        users_state.update_one(
-            {"user_id": user_id},
-            {
-                "$set": {
-                    "last_update": timestamp,
-                    "confidence": confidence,
-                    "last_event": "stay"
-                }
-            }
-        )
-        return jsonify({
-            "status": "ok",
-            "event": "stay",
-            "room": detected_room
-        }), 200
-
-    # Cambio de habitación: exit de la antigua + enter en la nueva
-    # Evento exit de current_room
-    room_events.insert_one({
-        "user_id": user_id,
-        "room_id": current_room,
-        "event": "exit",
-        "timestamp": timestamp,
-        "confidence": confidence
-    })
 
-    # Evento enter de detected_room
-    room_events.insert_one({
-        "user_id": user_id,
-        "room_id": detected_room,
-        "event": "enter",
-        "timestamp": timestamp,
-        "confidence": confidence
-    })
+def _stored_room(db, user_id):
+    state = db.users_state.find_one({"user_id": user_id}, {"_id": 0, "current_room": 1})
+    return state.get("current_room") if state else None
 
-    # Actualizar ocupación (protegiendo negativos)
-    rooms.update_one(
-        {"_id": current_room, "current_occupancy": {"$gt": 0}},
-        {"$inc": {"current_occupancy": -1}}
+
+def _apply_stay(db, config, user_id, room_id, confidence, timestamp):
+    """
+    Detección sin cambio confirmado por el suavizado: solo un "stay" de
+    room_id. Si users_state tiene otra habitación (otro worker ha
+    confirmado un cambio), el suavizado de este proceso se resincroniza con
+    ella en lugar de escribir una transición de vuelta.
+    """
+    if stay_coalescer.enabled and stay_coalescer.known_room(user_id) == room_id:
+        stay_coalescer.record_stay(user_id, room_id, confidence, timestamp)
+        return {"status": "ok", "event": "stay", "room": room_id}
+
+    state = db.users_state.find_one_and_update(
+        {"user_id": user_id, "current_room": room_id},
+        {"$set": {"last_update": timestamp, "confidence": confidence, "last_event": "stay"}},
+        projection={"_id": 0, "current_room": 1}
     )
-    rooms.update_one(
-        {"_id": detected_room},
-        {"$inc": {"current_occupancy": 1}}
+    if state is not None:
+        stay_coalescer.remember(user_id, room_id)
+        return {"status": "ok", "event": "stay", "room": room_id}
+
+    stored_room = _stored_room(db, user_id)
+    if stored_room is None:
+        # Estado borrado entretanto: se vuelve a crear
+        return _apply_detection(db, config, user_id, room_id, confidence, timestamp)
+    room_smoother.resync(user_id, stored_room)
+    stay_coalescer.remember(user_id, stored_room)
+    return {"status": "ok", "event": "stay", "room": stored_room}
+
+
+def _replay_missed_stay(db, config, user_id, room_id, confidence, timestamp):
+    if room_smoother.enabled:
+        # Con suavizado solo el filtro confirma cambios: la próxima detección
+        # parte otra vez de la habitación guardada
+        room_smoother.forget(user_id)
+        return
+    _write_detection(db, config, user_id, room_id, confidence, timestamp)
+
+
+def _apply_detection(db, config, user_id, detected_room, confidence, timestamp):
+    # "stay" en la habitación que ya conocemos: se agrupa y se escribe en bloque
+    if stay_coalescer.enabled and stay_coalescer.known_room(user_id) == detected_room:
+        stay_coalescer.record_stay(user_id, detected_room, confidence, timestamp)
+        return {"status": "ok", "event": "stay", "room": detected_room}
+
+    stay_coalescer.discard(user_id)
+    return _write_detection(db, config, user_id, detected_room, confidence, timestamp)
+
+
+def _write_detection(db, config, user_id, detected_room, confidence, timestamp):
+    if config.get("POSITION_TRANSACTIONS"):
+        result = apply_transition_transactional(db, user_id, detected_room, confidence, timestamp)
+    else:
+        result = apply_transition(db, user_id, detected_room, confidence, timestamp)
+
+    stay_coalescer.remember(user_id, detected_room)
+    return result
+
+
+def _process_queued_update(db, config, update):
+    process_update(
+        db,
+        config,
+        update["user_id"],
+        update["detected_room"],
+        update["confidence"],
+        update["timestamp"]
     )
 
-    # Actualizar estado usuario
-    users_state.update_one(
-        {"user_id": user_id},
-        {
-            "$set": {
+
+ingestion_queue.set_handler(_process_queued_update)
+# Latidos agrupados con una habitación recordada obsoleta
+stay_coalescer.set_miss_handler(_replay_missed_stay)
+
+
+@position_bp.route("/locate", methods=["POST"])
+def locate():
+    """
+    Estima la habitación a partir de escaneos de beacons, para muchos
+    usuarios a la vez:
+    {"scans": [{"user_id", "beacons": [{uuid, major, minor, rssi}]}, ...],
+     "apply": true, "mode": "coverage" | "knn"}
+    "coverage" puntúa con la matriz de cobertura de beacons; "knn" busca
+    las huellas RSSI más parecidas (ver /position/fingerprints).
+    Con "apply": true cada estimación se aplica como en /position/update.
+    """
+    db = get_db()
+    data = request.get_json() or {}
+    scans = data.get("scans")
+
+    if not isinstance(scans, list) or not scans:
+        return jsonify({"error": "scans must be a non-empty list"}), 400
+    if any(not isinstance(scan, dict) or not isinstance(scan.get("beacons"), list) for scan in scans):
+        return jsonify({"error": "each scan needs a beacons list"}), 400
+
+    mode = data.get("mode", "coverage")
+    snapshot = room_graph_cache.get(db)
+    beacon_scans = [scan["beacons"] for scan in scans]
+
+    if mode == "coverage":
+        estimates = snapshot.locator.locate(beacon_scans)
+    elif mode == "knn":
+        index = fingerprint_store.index(db, snapshot)
+        if not len(index):
+            return jsonify({"error": "no fingerprints collected"}), 409
+        estimates = index.predict(scan_vectors(snapshot.locator, beacon_scans), fingerprint_store.k)
+    else:
+        return jsonify({"error": "invalid mode"}), 400
+
+    results = []
+    for scan, (room_id, confidence) in zip(scans, estimates):
+        result = {"user_id": scan.get("user_id"), "room": room_id, "confidence": confidence}
+
+        if data.get("apply") and room_id and scan.get("user_id"):
+            result["update"] = process_update(
+                db,
+                current_app.config,
+                scan["user_id"],
+                room_id,
+                confidence,
+                scan.get("timestamp") or now_iso()
+            )
+
+        results.append(result)
+
+    return jsonify({"status": "ok", "results": results}), 200
+
+
+@position_bp.route("/fingerprints", methods=["POST"])
+def add_fingerprints():
+    """
+    Guarda huellas RSSI etiquetadas para la localización kNN:
+    {"fingerprints": [{"room_id", "beacons": [{uuid, major, minor, rssi}]}, ...]}
+    """
+    db = get_db()
+    data = request.get_json() or {}
+    fingerprints = data.get("fingerprints")
+
+    if not isinstance(fingerprints, list) or not fingerprints:
+        return jsonify({"error": "fingerprints must be a non-empty list"}), 400
+
+    snapshot = room_graph_cache.get(db)
+    docs = []
+    for f in fingerprints:
+        if not isinstance(f, dict) or not isinstance(f.get("beacons"), list):
+            return jsonify({"error": "each fingerprint needs room_id and a beacons list"}), 400
+        if f.get("room_id") not in snapshot.rooms:
+            return jsonify({"error": f"room {f.get('room_id')} not found"}), 404
+        docs.append({
+            "room_id": f["room_id"],
+            "beacons": f["beacons"],
+            "created_at": now_iso()
+        })
+
+    inserted = fingerprint_store.add(db, snapshot, docs)
+    return jsonify({"status": "ok", "inserted": inserted, **fingerprint_store.stats()}), 200
+
+
+@position_bp.route("/update_batch", methods=["POST"])
+def update_position_batch():
+    """
+    Igual que /update pero para muchas detecciones a la vez:
+    {"updates": [{user_id, detected_room, confidence, timestamp}, ...]}
+
+    Las detecciones de cada usuario se aplican en orden de timestamp (con
+    el mismo suavizado que /update) y todas las escrituras van en un único
+    bulk por colección.
+    La respuesta tiene un resultado por registro, en el orden de entrada.
+
+    El estado de cada usuario se escribe solo si sigue siendo el que se
+    leyó (current_room y last_room_change); si un /update concurrente lo
+    ha cambiado, las detecciones de ese usuario se aplican una a una como
+    en /update en lugar de pisar su transición.
+    """
+    db = get_db()
+    data = request.get_json() or {}
+    records = data.get("updates")
+
+    if not isinstance(records, list) or not records:
+        return jsonify({"error": "updates must be a non-empty list"}), 400
+
+    results = [None] * len(records)
+    valid = []
+    for i, record in enumerate(records):
+        if not isinstance(record, dict) or not record.get("user_id") or not record.get("detected_room"):
+            results[i] = {"status": "error", "error": "user_id and detected_room are required"}
+            continue
+        if not all(isinstance(record.get(field) or "", str) for field in ("user_id", "detected_room", "timestamp")):
+            # Con tipos mezclados fallarían el orden y los conjuntos de todo el lote
+            results[i] = {"status": "error", "error": "user_id, detected_room and timestamp must be strings"}
+            continue
+        # El timestamp por defecto se pone antes de ordenar
+        valid.append((i, dict(record, timestamp=record.get("timestamp") or now_iso())))
+
+    # Una consulta para validar habitaciones y otra para el estado de los usuarios
+    room_ids = {r["detected_room"] for _, r in valid}
+    existing_rooms = {r["_id"] for r in db.rooms.find({"_id": {"$in": list(room_ids)}}, {"_id": 1})}
+
+    user_ids = {r["user_id"] for _, r in valid}
+    states = {
+        s["user_id"]: s
+        for s in db.users_state.find({"user_id": {"$in": list(user_ids)}}, {"_id": 0})
+    }
+    # Estado leído, para escribir el nuevo solo si nadie lo ha cambiado
+    read_states = {
+        user_id: (s.get("current_room"), s.get("last_room_change"))
+        for user_id, s in states.items()
+    }
+
+    # Orden por usuario y timestamp (estable para empates)
+    valid.sort(key=lambda item: (item[1]["user_id"], item[1]["timestamp"]))
+
+    events = []
+    closed_visits = []
+    applied = {}
+
+    for i, record in valid:
+        user_id = record["user_id"]
+        detected_room = record["detected_room"]
+        confidence = record.get("confidence", None)
+        timestamp = record["timestamp"]
+
+        if detected_room not in existing_rooms:
+            results[i] = {"status": "error", "error": f"room {detected_room} not found"}
+            continue
+
+        state = states.get(user_id)
+        if room_smoother.enabled:
+            detected_room, changed = room_smoother.decide(
+                user_id, record["detected_room"], confidence, timestamp,
+                stored_room=lambda: state.get("current_room") if state else None
+            )
+            if not changed and state and state["current_room"] != detected_room:
+                # Como en _apply_stay: se sigue el estado guardado
+                detected_room = state["current_room"]
+                room_smoother.resync(user_id, detected_room)
+        applied.setdefault(user_id, []).append((i, dict(record, detected_room=detected_room)))
+
+        if not state:
+            states[user_id] = {
+                "user_id": user_id,
                 "current_room": detected_room,
                 "last_update": timestamp,
                 "confidence": confidence,
                 "last_event": "enter",
                 "last_room_change": timestamp
             }
-        }
-    )
+            events.append({
+                "user_id": user_id,
+                "room_id": detected_room,
+                "event": "enter",
+                "timestamp": timestamp,
+                "event_at": event_datetime(timestamp),
+                "confidence": confidence
+            })
+            results[i] = {"status": "ok", "event": "enter", "room": detected_room}
+            continue
+
+        current_room = state["current_room"]
+
+        if current_room == detected_room:
+            state.update({
+                "last_update": timestamp,
+                "confidence": confidence,
+                "last_event": "stay"
+            })
+            results[i] = {"status": "ok", "event": "stay", "room": detected_room}
+            continue
+
+        for room_id, event in ((current_room, "exit"), (detected_room, "enter")):
+            events.append({
+                "user_id": user_id,
+                "room_id": room_id,
+                "event": event,
+                "timestamp": timestamp,
+                "event_at": event_datetime(timestamp),
+                "confidence": confidence
+            })
+        closed_visits.append((user_id, session_op(user_id, current_room, state.get("last_room_change"), timestamp)))
+        state.update({
+            "current_room": detected_room,
+            "last_update": timestamp,
+            "confidence": confidence,
+            "last_event": "enter",
+            "last_room_change": timestamp
+        })
+        results[i] = {"status": "ok", "event": "room_changed", "from": current_room, "to": detected_room}
+
+    # Primero el estado (condicionado a lo leído); los eventos y la
+    # ocupación solo de los usuarios cuyo estado se ha escrito
+    lost = write_batch_states(db, {user_id: states[user_id] for user_id in applied}, read_states)
+
+    events = [e for e in events if e["user_id"] not in lost]
+    occupancy = {}
+    for e in events:
+        occupancy[e["room_id"]] = occupancy.get(e["room_id"], 0) + (1 if e["event"] == "enter" else -1)
+
+    if events:
+        db.room_events.insert_many(events, ordered=False)
+
+    counts = apply_occupancy_deltas(db, occupancy)
+    apply_memory_deltas(occupancy)
+    room_rollups.record(db, events, counts=counts)
+    dwell_sessions.record(db, [op for user_id, op in closed_visits if user_id not in lost])
+
+    for user_id in applied:
+        stay_coalescer.discard(user_id)
+        if user_id not in lost:
+            stay_coalescer.remember(user_id, states[user_id]["current_room"])
+
+    # Usuarios movidos por un /update concurrente: se aplican una a una
+    # sobre su estado actual
+    config = current_app.config
+    for user_id in sorted(lost):
+        for i, record in applied[user_id]:
+            results[i] = _apply_detection(
+                db, config, user_id, record["detected_room"], record.get("confidence"), record["timestamp"]
+            )
+
+    # Con suavizado, si la habitación aplicada no es la detectada se indica
+    for user_records in applied.values():
+        for i, record in user_records:
+            if record["detected_room"] != records[i]["detected_room"]:
+                results[i] = dict(results[i], detected_room=records[i]["detected_room"])
+
+    return jsonify({"status": "ok", "results": results}), 200
+
+
+def write_batch_states(db, states, read_states):
+    """
+    Escribe el estado final de cada usuario del lote en un único bulk_write,
+    solo donde users_state sigue como se leyó (los nuevos, solo si siguen
+    sin existir). Devuelve los usuarios cuyo estado no se ha escrito.
+    """
+    batch_id = uuid.uuid4().hex
+    ops = []
+    for user_id, state in states.items():
+        state = dict(state, batch_id=batch_id)
+        if user_id not in read_states:
+            ops.append(UpdateOne({"user_id": user_id}, {"$setOnInsert": state}, upsert=True))
+            continue
+        current_room, last_room_change = read_states[user_id]
+        ops.append(UpdateOne(
+            {"user_id": user_id, "current_room": current_room, "last_room_change": last_room_change},
+            {"$set": state}
+        ))
+    if not ops:
+        return set()
+
+    new_users = len(states.keys() - read_states.keys())
+    try:
+        result = db.users_state.bulk_write(ops, ordered=False)
+        if result.upserted_count == new_users and result.matched_count == len(ops) - new_users:
+            return set()
+    except BulkWriteError:
+        # Upsert duplicado de un usuario nuevo (otro request lo ha creado)
+        pass
+
+    # Algún filtro no ha coincidido: los escritos llevan el batch_id de este lote
+    written = {
+        s["user_id"]
+        for s in db.users_state.find({"user_id": {"$in": list(states)}, "batch_id": batch_id}, {"user_id": 1})
+    }
+    return set(states) - written
 
-    return jsonify({
-        "status": "ok",
-        "event": "room_changed",
-        "from": current_room,
-        "to": detected_room
-    }), 200
 
 # Para ver donde están todos los usuarios (no tiene una utilidad real por el momento)
 @position_bp.route("/users_state", methods=["GET"])
 def get_users_state():
     db = get_db()
-    users = list(db.users_state.find({}, {"_id": 0}))
+    users = [stay_coalescer.merge(u) for u in db.users_state.find({}, {"_id": 0, "batch_id": 0})]
     return jsonify(users), 200
 
 # Para ver donde está cada usuario (no tiene una utilidad real por el momento)
 @position_bp.route("/users_state/<user_id>", methods=["GET"])
 def get_user_state(user_id):
     db = get_db()
-    user = db.users_state.find_one({"user_id": user_id}, {"_id": 0})
+    user = db.users_state.find_one({"user_id": user_id}, {"_id": 0, "batch_id": 0})
     if not user:
         return jsonify({"error": "user not found"}), 404
-    return jsonify(user), 200
+    return jsonify(stay_coalescer.merge(user)), 200
+
+
+# Estado de la cola de ingesta asíncrona
+@position_bp.route("/ingestion/stats", methods=["GET"])
+def ingestion_stats():
+    return jsonify(ingestion_queue.stats()), 200
+
+
+# Estado del suavizado de detecciones
+@position_bp.route("/smoothing/stats", methods=["GET"])
+def smoothing_stats():
+    return jsonify(room_smoother.stats()), 200
+
+
+# Estado de la agrupación de latidos "stay"
+@position_bp.route("/coalescing/stats", methods=["GET"])
+def coalescing_stats():
+    return jsonify(stay_coalescer.stats()), 200
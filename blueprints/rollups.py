@@ -0,0 +1,260 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+from utils.time_utils import parse_iso_seconds
+from .occupancy import occupancy_tracker
+
+logger = logging.getLogger(__name__)
+
+# Granularidades de los buckets (segundos)
+GRANULARITIES = {"minute": 60, "hour": 3600}
+
+
+def bucket_start(seconds, granularity):
+    """
+    Inicio (ISO UTC) del bucket que contiene el instante dado. Todos los
+    buckets tienen el mismo formato, así que se ordenan como texto.
+    """
+    size = GRANULARITIES[granularity]
+    return datetime.fromtimestamp(seconds // size * size, timezone.utc).isoformat()
+
+
+def add_event(buckets, room_id, event, seconds, peak):
+    """
+    Suma un evento enter/exit a los buckets de todas las granularidades.
+    buckets: {(room_id, granularidad, bucket): {"enters", "exits", "peak_occupancy"}}
+    """
+    for granularity in GRANULARITIES:
+        key = (room_id, granularity, bucket_start(seconds, granularity))
+        counters = buckets.setdefault(key, {"enters": 0, "exits": 0, "peak_occupancy": None})
+        counters["enters" if event == "enter" else "exits"] += 1
+        if peak is not None and (counters["peak_occupancy"] is None or peak > counters["peak_occupancy"]):
+            counters["peak_occupancy"] = peak
+
+
+def rollup_ops(buckets):
+    """
+    Un upsert por bucket: $inc de entradas/salidas y $max del pico, así
+    varios workers (o la escritura en vivo y el backfill) no se pisan.
+    """
+    ops = []
+    for (room_id, granularity, bucket), counters in buckets.items():
+        update = {
+            "$inc": {"enters": counters["enters"], "exits": counters["exits"]},
+            "$setOnInsert": {"room_id": room_id, "granularity": granularity, "bucket": bucket}
+        }
+        if counters["peak_occupancy"] is not None:
+            update["$max"] = {"peak_occupancy": counters["peak_occupancy"]}
+        ops.append(UpdateOne({"_id": f"{room_id}|{granularity}|{bucket}"}, update, upsert=True))
+    return ops
+
+
+class RoomRollups:
+    """
+    Series temporales pre-agregadas por habitación (colección room_rollups):
+    entradas, salidas y pico de ocupación por minuto y por hora.
+
+    - record() se llama con los eventos que se acaban de insertar en
+      room_events; los buckets se actualizan en un único bulk_write.
+    - El pico es la ocupación tras los eventos: counts, leída de rooms
+      después del $inc, o, con el motor en memoria, la foto del
+      OccupancyTracker (refrescada desde Mongo si toca) más pending, los
+      deltas que aún no ha recibido.
+    - backfill() reconstruye por trozos los buckets de un rango de horas
+      desde room_events.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self._stats = {"writes": 0, "write_errors": 0}
+
+    def configure(self, config):
+        self.enabled = config.get("ROOM_ROLLUPS", True)
+
+    def record(self, db, events, session=None, pending=None, counts=None):
+        if not self.enabled or not events:
+            return
+
+        if counts is None:
+            counts = occupancy_tracker.snapshot(db)
+            for room_id, delta in (pending or {}).items():
+                counts[room_id] = counts.get(room_id, 0) + delta
+        buckets = {}
+        for event in events:
+            try:
+                seconds = parse_iso_seconds(event["timestamp"])
+            except (TypeError, ValueError):
+                continue
+            count = counts.get(event["room_id"])
+            if count is not None and event["event"] == "exit":
+                # Justo antes de la salida había una persona más
+                count += 1
+            add_event(buckets, event["room_id"], event["event"], seconds, count)
+
+        ops = rollup_ops(buckets)
+        if not ops:
+            return
+        try:
+            db.room_rollups.bulk_write(ops, ordered=False, session=session)
+            self._stats["writes"] += 1
+        except PyMongoError as e:
+            # Los eventos ya están en room_events: el backfill puede rehacerlos
+            if session is not None:
+                raise
+            self._stats["write_errors"] += 1
+            logger.warning("could not update room rollups: %s", e)
+
+    def history(self, db, room_id, granularity, start, end):
+        """
+        Buckets de una habitación con inicio en [start, end] (ISO UTC).
+        Los intervalos sin eventos no tienen bucket.
+        """
+        return list(db.room_rollups.find(
+            {"room_id": room_id, "granularity": granularity, "bucket": {"$gte": start, "$lte": end}},
+            {"_id": 0, "bucket": 1, "enters": 1, "exits": 1, "peak_occupancy": 1}
+        ).sort("bucket", ASCENDING))
+
+    def backfill(self, db, start=None, end=None, chunk_size=5000):
+        """
+        Reconstruye los buckets de room_rollups con inicio en [start, end)
+        (ISO alineados a la hora; end None = sin límite) desde room_events,
+        recorriendo (timestamp, _id) por trozos de chunk_size.
+
+        - Solo se borran los buckets del rango: los anteriores, cuyos eventos
+          ya se archivaron o caducaron, se conservan. Sin start se empieza en
+          la primera hora completa de los eventos que quedan en Mongo.
+        - Solo se cuentan los eventos insertados antes de borrar los
+          buckets (_id anterior al corte); los que llegan después, aunque
+          traigan un timestamp del rango, los cuenta record().
+        - La ocupación al inicio del rango es la de users_state menos el neto
+          de los eventos posteriores, así el pico no depende del historial
+          que ya no está.
+        Devuelve {"events": n, "chunks": n, "from": start, "to": end}.
+        """
+        start = _hour_boundary(start) if start is not None else _first_full_hour(db)
+        end = _hour_boundary(end) if end is not None else None
+        if start is None:
+            return {"events": 0, "chunks": 0, "from": None, "to": end}
+
+        window = {"$gte": start}
+        if end is not None:
+            window["$lt"] = end
+        start_seconds = parse_iso_seconds(start)
+        end_seconds = parse_iso_seconds(end) if end is not None else None
+
+        occupancy = _occupancy_at(db, start)
+        # Primero se borra y después se fija el corte: un evento insertado
+        # tras el borrado lo cuenta solo record(), sobre el bucket ya vacío
+        boundary = _next_second()
+        db.room_rollups.delete_many({"bucket": dict(window)})
+        cutoff = ObjectId.from_datetime(boundary)
+
+        last = None
+        events_done = chunks = 0
+        while True:
+            query = {"timestamp": dict(window), "_id": {"$lt": cutoff}}
+            if last is not None:
+                query = {"$and": [query, {"$or": [
+                    {"timestamp": {"$gt": last[0]}},
+                    {"timestamp": last[0], "_id": {"$gt": last[1]}}
+                ]}]}
+            chunk = list(db.room_events.find(
+                query, {"room_id": 1, "event": 1, "timestamp": 1}
+            ).sort([("timestamp", ASCENDING), ("_id", ASCENDING)]).limit(chunk_size))
+            if not chunk:
+                break
+
+            buckets = {}
+            for event in chunk:
+                try:
+                    seconds = parse_iso_seconds(event["timestamp"])
+                except (TypeError, ValueError):
+                    continue
+                if seconds < start_seconds or (end_seconds is not None and seconds >= end_seconds):
+                    # Timestamp con otra zona horaria: su bucket queda fuera del rango borrado
+                    continue
+                room_id = event["room_id"]
+                before = occupancy.get(room_id, 0)
+                if event["event"] == "enter":
+                    occupancy[room_id] = peak = before + 1
+                else:
+                    occupancy[room_id] = max(0, before - 1)
+                    peak = before
+                add_event(buckets, room_id, event["event"], seconds, peak)
+
+            ops = rollup_ops(buckets)
+            if ops:
+                db.room_rollups.bulk_write(ops, ordered=False)
+            events_done += len(chunk)
+            chunks += 1
+            last = (chunk[-1]["timestamp"], chunk[-1]["_id"])
+
+        return {"events": events_done, "chunks": chunks, "from": start, "to": end}
+
+    def stats(self):
+        return dict(self._stats, enabled=self.enabled)
+
+
+def _next_second():
+    """
+    Espera al siguiente segundo exacto y lo devuelve. Un ObjectId solo
+    guarda el segundo: borrando justo al empezar un segundo, los _id de
+    ese segundo en adelante son de eventos insertados tras el borrado.
+    """
+    now = datetime.now(timezone.utc)
+    boundary = now.replace(microsecond=0) + timedelta(seconds=1)
+    time.sleep((boundary - now).total_seconds())
+    return boundary
+
+
+def _hour_boundary(value):
+    """
+    Límite de rango del backfill en el formato de los buckets; tiene que
+    caer en una hora exacta para no reconstruir buckets a medias.
+    """
+    seconds = parse_iso_seconds(value)
+    if seconds % GRANULARITIES["hour"]:
+        raise ValueError(f"{value} is not aligned to the hour")
+    return bucket_start(seconds, "hour")
+
+
+def _first_full_hour(db):
+    """
+    Primera hora completa de los eventos que quedan en room_events: la hora
+    del evento más antiguo puede incluir otros ya archivados o caducados.
+    """
+    for event in db.room_events.find({}, {"timestamp": 1}).sort("timestamp", ASCENDING):
+        try:
+            seconds = parse_iso_seconds(event["timestamp"])
+        except (TypeError, ValueError):
+            continue
+        size = GRANULARITIES["hour"]
+        return bucket_start(-(-seconds // size) * size, "hour")
+    return None
+
+
+def _occupancy_at(db, start):
+    """
+    Ocupación por habitación al inicio del rango: la actual de users_state
+    menos el neto (entradas - salidas) de los eventos desde start.
+    """
+    occupancy = {}
+    for row in db.users_state.aggregate([
+        {"$match": {"current_room": {"$ne": None}}},
+        {"$group": {"_id": "$current_room", "count": {"$sum": 1}}}
+    ]):
+        occupancy[row["_id"]] = row["count"]
+    for row in db.room_events.aggregate([
+        {"$match": {"timestamp": {"$gte": start}}},
+        {"$group": {"_id": "$room_id", "net": {"$sum": {"$cond": [{"$eq": ["$event", "enter"]}, 1, -1]}}}}
+    ]):
+        occupancy[row["_id"]] = occupancy.get(row["_id"], 0) - row["net"]
+    return {room_id: max(0, count) for room_id, count in occupancy.items()}
+
+
+room_rollups = RoomRollups()
@@ -1,5 +1,21 @@
-from flask import Blueprint, jsonify
+import json
+import queue
+import time
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from pymongo import ASCENDING
 from db.mongo import get_db
+from utils.http_cache import instance_tag, response_cache
+from utils.pagination import InvalidCursor, encode_cursor, keyset_filter, parse_limit
+from utils.time_utils import parse_iso_seconds
+from .graph_cache import room_graph_cache
+from .occupancy import occupancy_tracker
+from .occupancy_engine import occupancy_engine
+from .occupancy_stream import occupancy_broker
+from .dwell import dwell_sessions
+from .rollups import GRANULARITIES, bucket_start, room_rollups
+
+NDJSON = "application/x-ndjson"
 
 rooms_bp = Blueprint("rooms", __name__)
 
@@ -7,28 +23,29 @@ rooms_bp = Blueprint("rooms", __name__)
 def list_rooms():
     """
     Lista todas las habitaciones con información básica y ocupación actual.
+
+    Sale del grafo cacheado y de la foto de ocupación en memoria; la ETag
+    combina sus versiones, así un sondeo sin cambios responde 304 (o el
+    cuerpo ya serializado) sin tocar Mongo.
     """
     db = get_db()
-    cursor = db.rooms.find(
-        {},
-        {
-            "_id": 1,
-            "name": 1,
-            "poi_id": 1,
-            "current_occupancy": 1
-        }
-    )
+    snapshot = room_graph_cache.get(db)
+    occupancy_tracker.snapshot(db)  # refresca si toca
+    etag = instance_tag("rooms", snapshot.version, occupancy_tracker.version)
 
-    rooms = []
-    for r in cursor:
-        rooms.append({
-            "room_id": r["_id"],
-            "name": r.get("name"),
-            "poi_id": r.get("poi_id"),
-            "current_occupancy": r.get("current_occupancy", 0)
-        })
+    def build():
+        counts = occupancy_tracker.counts()
+        return [
+            {
+                "room_id": room_id,
+                "name": meta.get("name"),
+                "poi_id": meta.get("poi_id"),
+                "current_occupancy": counts.get(room_id, 0)
+            }
+            for room_id, meta in snapshot.rooms.items()
+        ]
 
-    return jsonify(rooms), 200
+    return response_cache.respond("rooms", etag, build)
 
 @rooms_bp.route("/occupancy", methods=["GET"])
 def occupancy():
@@ -36,30 +53,221 @@ def occupancy():
     Devuelve solo la ocupación por habitación (mapa simple).
     """
     db = get_db()
-    cursor = db.rooms.find(
-        {},
-        {
-            "_id": 1,
-            "current_occupancy": 1
-        }
+    snapshot = room_graph_cache.get(db)
+    occupancy_tracker.snapshot(db)
+    etag = instance_tag("occupancy", snapshot.version, occupancy_tracker.version)
+
+    def build():
+        counts = occupancy_tracker.counts()
+        return {room_id: counts.get(room_id, 0) for room_id in snapshot.rooms}
+
+    return response_cache.respond("occupancy", etag, build)
+
+
+def _sse(event, data, event_id=None):
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+@rooms_bp.route("/occupancy/stream", methods=["GET"])
+def occupancy_stream():
+    """
+    Server-Sent Events con la ocupación: primero un "snapshot" completo y
+    después solo "delta" con las habitaciones que cambian. Manda un
+    comentario de heartbeat si no hay cambios; si el cliente no consume
+    a tiempo se le envía "evicted" y se cierra el stream.
+    """
+    db = get_db()
+    # Suscribirse antes de la foto para no perder cambios intermedios
+    subscription = occupancy_broker.subscribe()
+    snapshot = occupancy_tracker.snapshot(db)
+    heartbeat = occupancy_broker.heartbeat_interval
+
+    def generate():
+        try:
+            yield _sse("snapshot", snapshot)
+            while not subscription.evicted:
+                try:
+                    event_id, delta = subscription.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+
+                # Juntar en un solo mensaje los cambios que ya estén esperando,
+                # en una copia: el mensaje es el mismo para todos los suscriptores
+                delta = dict(delta)
+                while True:
+                    try:
+                        event_id, more = subscription.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    delta.update(more)
+
+                yield _sse("delta", delta, event_id)
+
+            yield _sse("evicted", {"reason": "slow consumer"})
+        finally:
+            occupancy_broker.unsubscribe(subscription)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
-    result = {}
-    for r in cursor:
-        result[r["_id"]] = r.get("current_occupancy", 0)
 
-    return jsonify(result), 200
+@rooms_bp.route("/occupancy/stream/stats", methods=["GET"])
+def occupancy_stream_stats():
+    return jsonify(occupancy_broker.stats()), 200
+
+
+@rooms_bp.route("/occupancy/engine/stats", methods=["GET"])
+def occupancy_engine_stats():
+    return jsonify(occupancy_engine.stats()), 200
+
+
+def _room_events_response(base_filter):
+    """
+    Eventos paginados por clave (timestamp, _id).
+
+    Parámetros: limit, cursor (de la cabecera X-Next-Cursor de la página
+    anterior), from / to (rango de timestamp, to exclusivo) y
+    format=ndjson para recibir todos los eventos en streaming, un JSON
+    por línea, leyendo del cursor de Mongo según llegan.
+    """
+    db = get_db()
+    args = request.args
+    streaming = args.get("format") == "ndjson" or request.accept_mimetypes.best == NDJSON
+
+    try:
+        default_limit = None if streaming else current_app.config["ROOM_EVENTS_PAGE_SIZE"]
+        limit = parse_limit(args.get("limit"), default_limit, current_app.config["ROOM_EVENTS_MAX_PAGE_SIZE"])
+        conditions = [base_filter]
+        time_range = {}
+        if args.get("from"):
+            time_range["$gte"] = args["from"]
+        if args.get("to"):
+            time_range["$lt"] = args["to"]
+        if time_range:
+            conditions.append({"timestamp": time_range})
+        if args.get("cursor"):
+            conditions.append(keyset_filter("timestamp", args["cursor"]))
+    except (ValueError, InvalidCursor) as e:
+        return jsonify({"error": f"invalid pagination parameters: {e}"}), 400
+
+    query = {"$and": conditions} if len(conditions) > 1 else base_filter
+    # event_at es solo para el índice TTL de retención
+    cursor = db.room_events.find(query, {"event_at": 0}).sort([("timestamp", ASCENDING), ("_id", ASCENDING)])
+
+    if streaming:
+        if limit:
+            cursor = cursor.limit(limit)
+
+        dumps = current_app.json.dumps
+
+        def generate():
+            for event in cursor.batch_size(500):
+                del event["_id"]
+                yield dumps(event) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype=NDJSON)
+
+    # Pedimos uno de más para saber si hay siguiente página
+    events = list(cursor.limit(limit + 1))
+    headers = {}
+    if len(events) > limit:
+        events = events[:limit]
+        last = events[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last.get("timestamp"), last["_id"])
+
+    for event in events:
+        del event["_id"]
+    return jsonify(events), 200, headers
 
 
 @rooms_bp.route("/room_events", methods=["GET"])
 def get_room_events():
-    db = get_db()
-    events = list(db.room_events.find({}, {"_id": 0}))
-    return jsonify(events), 200
+    return _room_events_response({})
 
 
 @rooms_bp.route("/room_events/<user_id>", methods=["GET"])
 def get_room_events_user(user_id):
-    db = get_db()
-    events = list(db.room_events.find({"user_id": user_id}, {"_id": 0}))
-    return jsonify(events), 200
+    return _room_events_response({"user_id": user_id})
+
+
+@rooms_bp.route("/<room_id>/history", methods=["GET"])
+def room_history(room_id):
+    """
+    Entradas, salidas y pico de ocupación de una habitación por minuto u
+    hora, leyendo solo los buckets pre-agregados de room_rollups.
+
+    Parámetros: granularity (minute | hour, por defecto hour) y from / to
+    (ISO 8601, ambos incluidos; por defecto las últimas 24 horas o los
+    últimos 60 minutos). Los intervalos sin eventos no aparecen.
+    """
+    args = request.args
+    granularity = args.get("granularity", "hour")
+    if granularity not in GRANULARITIES:
+        return jsonify({"error": f"granularity must be one of {sorted(GRANULARITIES)}"}), 400
+
+    size = GRANULARITIES[granularity]
+    try:
+        end = parse_iso_seconds(args["to"]) if args.get("to") else time.time()
+        default_span = (60 if granularity == "minute" else 24) * size
+        start = parse_iso_seconds(args["from"]) if args.get("from") else end - default_span
+    except ValueError as e:
+        return jsonify({"error": f"invalid time range: {e}"}), 400
+
+    if start > end:
+        return jsonify({"error": "from must be before to"}), 400
+    if (end - start) / size >= current_app.config["ROOM_HISTORY_MAX_BUCKETS"]:
+        return jsonify({"error": "time range too large for this granularity"}), 400
+
+    buckets = room_rollups.history(
+        get_db(), room_id, granularity,
+        bucket_start(start, granularity), bucket_start(end, granularity)
+    )
+    return jsonify({
+        "room_id": room_id,
+        "granularity": granularity,
+        "from": bucket_start(start, granularity),
+        "to": bucket_start(end, granularity),
+        "totals": {
+            "enters": sum(b.get("enters", 0) for b in buckets),
+            "exits": sum(b.get("exits", 0) for b in buckets),
+            "peak_occupancy": max((b["peak_occupancy"] for b in buckets if b.get("peak_occupancy") is not None), default=None)
+        },
+        "buckets": buckets
+    }), 200
+
+
+@rooms_bp.route("/dwell", methods=["GET"])
+def dwell_stats():
+    """
+    Tiempo de permanencia (segundos) a partir de las visitas cerradas de
+    dwell_sessions: número, media, p50/p90/p95 y máximo.
+
+    Parámetros: by (room | user, por defecto room), room_id / user_id para
+    filtrar y from / to (rango de la hora de salida, to exclusivo).
+    """
+    args = request.args
+    by = args.get("by", "room")
+    if by not in ("room", "user"):
+        return jsonify({"error": "by must be room or user"}), 400
+
+    match = {}
+    if args.get("room_id"):
+        match["room_id"] = args["room_id"]
+    if args.get("user_id"):
+        match["user_id"] = args["user_id"]
+    time_range = {}
+    if args.get("from"):
+        time_range["$gte"] = args["from"]
+    if args.get("to"):
+        time_range["$lt"] = args["to"]
+    if time_range:
+        match["exited_at"] = time_range
+
+    return jsonify(dwell_sessions.stats(get_db(), match, f"{by}_id")), 200
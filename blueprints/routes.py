@@ -1,89 +1,267 @@
-from flask import Blueprint, request, jsonify
+import math
+
+from flask import Blueprint, abort, current_app, make_response, request, jsonify
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from db.mongo import get_db
+from utils.http_cache import response_cache
+from utils.lru import LRUCache
+from utils.pagination import InvalidCursor, encode_cursor, keyset_filter, parse_limit
 from utils.time_utils import now_iso
-from .graph import build_room_graph, bfs, dfs, rooms_to_pois
+from .graph import pois_from_map
+from .graph_cache import cached_traversal, room_graph_cache
+from .pathfinding import PROFILES
+from .tour import expand_tour, plan_tour
+from .occupancy import occupancy_tracker
 
 routes_bp = Blueprint("routes", __name__)
 
-@routes_bp.route("/auto/<algorithm>", methods=["POST"])
-def create_auto_route(algorithm):
-    db = get_db()
-    data = request.get_json() or {}
+# Rutas ya leídas de Mongo (inmutables tras crearse): route_id -> (versión de routes, ruta)
+route_cache = LRUCache(1024)
 
-    user_id = data.get("user_id")
-    if not user_id:
-        return jsonify({"error": "user_id is required"}), 400
 
-    # Obtener habitación actual del usuario
-    user_state = db.users_state.find_one({"user_id": user_id})
-    if not user_state:
-        return jsonify({"error": "user has no position yet"}), 404
+# Campos que se pueden pedir en GET /routes?fields=
+ROUTE_FIELDS = ("name", "description", "created_at", "steps", "step_count",
+                "algorithm", "start_room", "graph_version")
+DEFAULT_ROUTE_FIELDS = ("name", "created_at", "steps")
+SUMMARY_ROUTE_FIELDS = ("name", "created_at", "step_count")
 
-    start_room = user_state["current_room"]
 
-    # Construir grafo real desde rooms
-    graph = build_room_graph(db)
+def new_route(route_id, name, description, room_route, poi_route, **metadata):
+    """
+    Documento de ruta; metadata (algorithm, start_room, graph_version...) se
+    guarda tal cual para poder reutilizar rutas idénticas.
+    """
+    return {
+        "_id": route_id,
+        "name": name,
+        "description": description,
+        "steps": [{"room_id": r, "poi_id": p} for r, p in zip(room_route, poi_route)],
+        "created_at": now_iso(),
+        **metadata
+    }
+
 
-    # Generar ruta
-    if algorithm == "bfs":
-        room_route = bfs(graph, start_room)
-    elif algorithm == "dfs":
-        room_route = dfs(graph, start_room)
-    else:
-        return jsonify({"error": "invalid algorithm"}), 400
+def save_and_assign_route(db, user_id, route_id, name, description, room_route, poi_route, **metadata):
+    """
+    Guarda una ruta generada y se la asigna al usuario desde el primer paso.
+    """
+    route = new_route(route_id, name, description, room_route, poi_route, **metadata)
+    db.routes.insert_one(route)
+    bump_routes_version(db)
+    assign_route_to_user(db, user_id, route)
 
-    # Convertir habitaciones → POIs
-    poi_route = rooms_to_pois(db, room_route)
 
-    # Crear route_id único
-    route_id = f"{algorithm}_{user_id}_{now_iso()}"
+def reuse_or_save_route(db, route):
+    """
+    Modo dedup: el _id de la ruta sale de (algoritmo, habitación de inicio,
+    versión del grafo), así que si ya existe se reutiliza en vez de insertar
+    otra igual. Devuelve (ruta, reutilizada).
+    """
+    existing = load_route(db, route["_id"])
+    if existing is not None:
+        return existing, True
+    try:
+        db.routes.insert_one(route)
+    except DuplicateKeyError:
+        # Otra petición la ha creado a la vez
+        return load_route(db, route["_id"]), True
+    bump_routes_version(db)
+    return route, False
+
+
+def routes_version(db):
+    doc = db.counters.find_one({"_id": "routes"}, {"version": 1})
+    return doc["version"] if doc else 0
 
-    # Guardar ruta en MongoDB
-    db.routes.insert_one({
-        "_id": route_id,
-        "name": f"Ruta {algorithm.upper()} para {user_id}",
-        "description": f"Generada automáticamente usando {algorithm.upper()}",
-        "steps": [{"room_id": r, "poi_id": p} for r, p in zip(room_route, poi_route)],
-        "created_at": now_iso()
-    })
 
-    # Asignar ruta al usuario
+def bump_routes_version(db):
+    """
+    Contador compartido por todos los workers: sube con cada alta o baja de
+    ruta e invalida la ETag de GET /routes.
+    """
+    db.counters.update_one({"_id": "routes"}, {"$inc": {"version": 1}}, upsert=True)
+
+
+def assign_route_to_user(db, user_id, route):
+    """
+    Asigna la ruta al usuario copiando sus pasos en user_routes: las rutas
+    no cambian tras crearse, así el progreso se consulta con una sola lectura.
+    """
     db.user_routes.update_one(
         {"user_id": user_id},
         {
             "$set": {
                 "user_id": user_id,
-                "route_id": route_id,
+                "route_id": route["_id"],
+                "route_name": route.get("name"),
+                "route_description": route.get("description"),
+                "steps": route.get("steps", []),
                 "current_step": 0,
                 "completed": False,
                 "assigned_at": now_iso(),
                 "updated_at": now_iso()
-            }
+            },
+            "$unset": {"route_deleted": ""}
         },
         upsert=True
     )
 
-    return jsonify({
+
+def load_route(db, route_id):
+    """
+    Ruta por id a través del LRU. Las rutas son inmutables, pero otro worker
+    puede borrarlas: cada entrada guarda el contador routes (sube con cada
+    alta o baja) y solo se da por buena si no ha cambiado; si ha cambiado
+    se comprueba que la ruta sigue en Mongo.
+    """
+    version = routes_version(db)
+    cached = route_cache.get(route_id)
+    if cached is not None:
+        cached_version, route = cached
+        if cached_version == version:
+            return route
+        if db.routes.find_one({"_id": route_id}, {"_id": 1}) is None:
+            route_cache.pop(route_id)
+            return None
+        route_cache.put(route_id, (version, route))
+        return route
+
+    route = db.routes.find_one({"_id": route_id}, {"name": 1, "description": 1, "steps": 1})
+    if route is not None:
+        route_cache.put(route_id, (version, route))
+    return route
+
+
+def user_route_with_steps(db, user_id):
+    """
+    Devuelve (user_route, route, error). Las asignaciones nuevas llevan los
+    pasos copiados; las antiguas los leen de routes vía LRU.
+    """
+    user_route = db.user_routes.find_one({"user_id": user_id})
+    if not user_route:
+        return None, None, "no route assigned"
+
+    if user_route.get("route_deleted"):
+        return user_route, None, "route not found"
+
+    if "steps" in user_route:
+        route = {
+            "_id": user_route["route_id"],
+            "name": user_route.get("route_name"),
+            "description": user_route.get("route_description"),
+            "steps": user_route["steps"]
+        }
+        return user_route, route, None
+
+    route = load_route(db, user_route["route_id"])
+    if not route:
+        return user_route, None, "route not found"
+    return user_route, route, None
+
+
+@routes_bp.route("/auto/<algorithm>", methods=["POST"])
+def create_auto_route(algorithm):
+    db = get_db()
+    data = request.get_json() or {}
+
+    user_id = data.get("user_id")
+    if not user_id:
+        return jsonify({"error": "user_id is required"}), 400
+
+    # Obtener habitación actual del usuario
+    user_state = db.users_state.find_one({"user_id": user_id})
+    if not user_state:
+        return jsonify({"error": "user has no position yet"}), 404
+
+    start_room = user_state["current_room"]
+
+    # Generar ruta sobre el grafo cacheado (memorizada por versión del grafo)
+    snapshot = room_graph_cache.get(db)
+    traversal = cached_traversal(snapshot, algorithm, start_room)
+    if traversal is None:
+        return jsonify({"error": "invalid algorithm"}), 400
+
+    room_route, poi_route = list(traversal[0]), list(traversal[1])
+
+    # La huella del grafo es estable entre workers y reinicios, a diferencia
+    # del contador de versión local de la cache
+    metadata = {"algorithm": algorithm, "start_room": start_room, "graph_version": snapshot.fingerprint}
+    response = {
         "status": "ok",
         "algorithm": algorithm,
         "rooms": room_route,
-        "pois": poi_route,
-        "route_id": route_id
-    }), 200
+        "pois": poi_route
+    }
+
+    if data.get("dedup", current_app.config["ROUTE_DEDUP"]):
+        # Una sola ruta por (algoritmo, inicio, versión del grafo)
+        route, reused = reuse_or_save_route(db, new_route(
+            f"{algorithm}_{start_room}_{snapshot.fingerprint[:12]}",
+            f"Ruta {algorithm.upper()} desde {start_room}",
+            f"Generada automáticamente usando {algorithm.upper()}",
+            room_route,
+            poi_route,
+            **metadata
+        ))
+        assign_route_to_user(db, user_id, route)
+        response.update(route_id=route["_id"], reused=reused)
+        return jsonify(response), 200
+
+    # Crear route_id único, guardar la ruta y asignarla al usuario
+    route_id = f"{algorithm}_{user_id}_{now_iso()}"
+    save_and_assign_route(
+        db,
+        user_id,
+        route_id,
+        f"Ruta {algorithm.upper()} para {user_id}",
+        f"Generada automáticamente usando {algorithm.upper()}",
+        room_route,
+        poi_route,
+        **metadata
+    )
+
+    response["route_id"] = route_id
+    return jsonify(response), 200
 
 
 
 @routes_bp.route("/<route_id>", methods=["GET"])
 def get_route(route_id):
+    # Las rutas no cambian tras crearse: la ETag es el propio id y el cuerpo
+    # serializado se guarda hasta que se borra la ruta (en cualquier worker)
+    key = f"route:{route_id}"
+    etag = f"route-{route_id}"
     db = get_db()
-    route = db.routes.find_one({"_id": route_id})
-    if not route:
-        return jsonify({"error": "route not found"}), 404
 
-    # Convertir _id a string explícito para JSON
-    route["route_id"] = route["_id"]
-    del route["_id"]
-    return jsonify(route), 200
+    def find_route():
+        route = db.routes.find_one({"_id": route_id})
+        if route is not None:
+            # Convertir _id a string explícito para JSON
+            route["route_id"] = route.pop("_id")
+        return route
+
+    route = None
+    if response_cache.contains(key, etag):
+        # Cuerpo ya serializado: solo se comprueba que ningún otro worker
+        # la ha borrado (el DELETE solo limpia la cache de su proceso)
+        if db.routes.find_one({"_id": route_id}, {"_id": 1}) is None:
+            response_cache.invalidate(key)
+            return jsonify({"error": "route not found"}), 404
+    else:
+        route = find_route()
+        if not route:
+            return jsonify({"error": "route not found"}), 404
+
+    def build():
+        # Otra representación (Accept / Accept-Encoding) de una ruta ya
+        # cacheada: se lee la ruta solo para serializar esa variante
+        found = route or find_route()
+        if not found:
+            abort(make_response(jsonify({"error": "route not found"}), 404))
+        return found
+
+    return response_cache.respond(key, etag, build)
 
 @routes_bp.route("/assign", methods=["POST"])
 def assign_route():
@@ -99,24 +277,11 @@ def assign_route():
     if not user_id or not route_id:
         return jsonify({"error": "user_id and route_id are required"}), 400
 
-    route = db.routes.find_one({"_id": route_id})
+    route = load_route(db, route_id)
     if not route:
         return jsonify({"error": "route not found"}), 404
 
-    db.user_routes.update_one(
-        {"user_id": user_id},
-        {
-            "$set": {
-                "user_id": user_id,
-                "route_id": route_id,
-                "current_step": 0,
-                "completed": False,
-                "assigned_at": now_iso(),
-                "updated_at": now_iso()
-            }
-        },
-        upsert=True
-    )
+    assign_route_to_user(db, user_id, route)
 
     return jsonify({"status": "ok"}), 200
 
@@ -126,13 +291,9 @@ def get_user_route(user_id):
     Devuelve la ruta asignada a un usuario + su progreso.
     """
     db = get_db()
-    user_route = db.user_routes.find_one({"user_id": user_id})
-    if not user_route:
-        return jsonify({"error": "no route assigned"}), 404
-
-    route = db.routes.find_one({"_id": user_route["route_id"]})
-    if not route:
-        return jsonify({"error": "route not found"}), 404
+    user_route, route, error = user_route_with_steps(db, user_id)
+    if error:
+        return jsonify({"error": error}), 404
 
     # Ajustar IDs para JSON
     route_response = {
@@ -172,13 +333,40 @@ def update_progress():
     if not user_id or not reached_room_id:
         return jsonify({"error": "user_id and room_id are required"}), 400
 
-    user_route = db.user_routes.find_one({"user_id": user_id})
-    if not user_route:
-        return jsonify({"error": "no route assigned"}), 404
+    # Camino rápido (un solo viaje): avanzar si el paso actual de los pasos
+    # copiados en user_routes es la habitación alcanzada. Es un
+    # compare-and-set atómico sobre current_step.
+    next_step = {"$add": [{"$ifNull": ["$current_step", 0]}, 1]}
+    updated = db.user_routes.find_one_and_update(
+        {
+            "user_id": user_id,
+            "route_deleted": {"$exists": False},
+            "completed": {"$ne": True},
+            "steps": {"$exists": True},
+            "$expr": {"$eq": [
+                {"$arrayElemAt": ["$steps.room_id", {"$ifNull": ["$current_step", 0]}]},
+                {"$literal": reached_room_id}
+            ]}
+        },
+        [{"$set": {
+            "current_step": next_step,
+            "completed": {"$gte": [next_step, {"$size": "$steps"}]},
+            "updated_at": {"$literal": now_iso()}
+        }}],
+        projection={"current_step": 1, "completed": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if updated:
+        return jsonify({
+            "status": "ok",
+            "current_step": updated["current_step"],
+            "completed": updated["completed"]
+        }), 200
 
-    route = db.routes.find_one({"_id": user_route["route_id"]})
-    if not route:
-        return jsonify({"error": "route not found"}), 404
+    # No ha avanzado: averiguar por qué (o asignación antigua sin pasos copiados)
+    user_route, route, error = user_route_with_steps(db, user_id)
+    if error:
+        return jsonify({"error": error}), 404
 
     current_step = user_route.get("current_step", 0)
     steps = route.get("steps", [])
@@ -195,12 +383,12 @@ def update_progress():
             "reached_room": reached_room_id
         }), 200
 
-    # Avanzar un paso
+    # Avanzar un paso (compare-and-set sobre current_step)
     new_step = current_step + 1
     completed = new_step >= len(steps)
 
-    db.user_routes.update_one(
-        {"user_id": user_id},
+    result = db.user_routes.update_one(
+        {"user_id": user_id, "current_step": current_step},
         {
             "$set": {
                 "current_step": new_step,
@@ -209,6 +397,8 @@ def update_progress():
             }
         }
     )
+    if result.matched_count == 0:
+        return jsonify({"status": "conflict", "error": "progress changed concurrently"}), 409
 
     return jsonify({
         "status": "ok",
@@ -220,9 +410,63 @@ def update_progress():
 # Ver todas las rutas
 @routes_bp.route("", methods=["GET"])
 def list_routes():
+    """
+    Rutas guardadas paginadas por clave (created_at, _id).
+
+    Parámetros: limit, cursor (de la cabecera X-Next-Cursor de la página
+    anterior) y fields, lista separada por comas de ROUTE_FIELDS o
+    "summary" (name, created_at y step_count, calculado en Mongo sin
+    devolver los pasos). Por defecto: name, created_at y steps.
+    """
+    args = request.args
+    try:
+        fields = parse_route_fields(args.get("fields"))
+        limit = parse_limit(args.get("limit"), current_app.config["ROUTES_PAGE_SIZE"],
+                            current_app.config["ROUTES_MAX_PAGE_SIZE"])
+        match = keyset_filter("created_at", args["cursor"]) if args.get("cursor") else {}
+    except (ValueError, InvalidCursor) as e:
+        return jsonify({"error": f"invalid parameters: {e}"}), 400
+
+    # La versión de routes (un find_one por _id) basta para saber si la
+    # página cacheada sigue valiendo
     db = get_db()
-    routes = list(db.routes.find({}, {"_id": 1, "name": 1, "created_at": 1, "steps": 1}))
-    return jsonify(routes), 200
+    etag = f"routes-{routes_version(db)}"
+
+    def build():
+        projection = {field: 1 for field in fields if field != "step_count"}
+        projection["created_at"] = 1
+        if "step_count" in fields:
+            projection["step_count"] = {"$size": {"$ifNull": ["$steps", []]}}
+
+        # Pedimos una de más para saber si hay siguiente página
+        routes = list(db.routes.aggregate([
+            {"$match": match},
+            {"$sort": {"created_at": 1, "_id": 1}},
+            {"$limit": limit + 1},
+            {"$project": projection}
+        ]))
+        headers = {}
+        if len(routes) > limit:
+            routes = routes[:limit]
+            headers["X-Next-Cursor"] = encode_cursor(routes[-1].get("created_at"), routes[-1]["_id"])
+        if "created_at" not in fields:
+            for route in routes:
+                del route["created_at"]
+        return routes, headers
+
+    return response_cache.respond(f"routes?{request.query_string.decode()}", etag, build, with_headers=True)
+
+
+def parse_route_fields(value):
+    if not value:
+        return DEFAULT_ROUTE_FIELDS
+    if value == "summary":
+        return SUMMARY_ROUTE_FIELDS
+    fields = tuple(f.strip() for f in value.split(",") if f.strip())
+    unknown = [f for f in fields if f not in ROUTE_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown fields {unknown}, allowed: {', '.join(ROUTE_FIELDS)} or summary")
+    return fields
 
 # Borrar ruta
 @routes_bp.route("/<route_id>", methods=["DELETE"])
@@ -231,6 +475,12 @@ def delete_route(route_id):
     result = db.routes.delete_one({"_id": route_id})
     if result.deleted_count == 0:
         return jsonify({"error": "route not found"}), 404
+
+    # Sacarla de las caches y marcar las copias en user_routes
+    route_cache.pop(route_id)
+    response_cache.invalidate(f"route:{route_id}")
+    bump_routes_version(db)
+    db.user_routes.update_many({"route_id": route_id}, {"$set": {"route_deleted": True}})
     return jsonify({"status": "deleted"}), 200
 
 
@@ -250,16 +500,11 @@ def preview_route(algorithm):
 
     start_room = user_state["current_room"]
 
-    graph = build_room_graph(db)
-
-    if algorithm == "bfs":
-        room_route = bfs(graph, start_room)
-    elif algorithm == "dfs":
-        room_route = dfs(graph, start_room)
-    else:
+    traversal = cached_traversal(room_graph_cache.get(db), algorithm, start_room)
+    if traversal is None:
         return jsonify({"error": "invalid algorithm"}), 400
 
-    poi_route = rooms_to_pois(db, room_route)
+    room_route, poi_route = list(traversal[0]), list(traversal[1])
 
     return jsonify({
         "status": "ok",
@@ -268,6 +513,185 @@ def preview_route(algorithm):
     }), 200
 
 
+# Camino más corto (ponderado) hasta una habitación concreta
+@routes_bp.route("/shortest", methods=["POST"])
+def shortest_route():
+    """
+    Calcula el camino de menor coste desde la habitación actual del usuario
+    (o start_room) hasta target_room usando las tablas precalculadas.
+    Con "avoid_crowds": true el coste de entrar en cada habitación se
+    penaliza según su ocupación actual.
+    Con "assign": true la ruta se guarda y se asigna como en /auto.
+    """
+    db = get_db()
+    data = request.get_json() or {}
+
+    user_id = data.get("user_id")
+    target_room = data.get("target_room")
+    start_room = data.get("start_room")
+    profile = data.get("profile", "default")
+
+    if not target_room or (not user_id and not start_room):
+        return jsonify({"error": "target_room and user_id or start_room are required"}), 400
+
+    if not isinstance(target_room, str) or (start_room and not isinstance(start_room, str)):
+        return jsonify({"error": "target_room and start_room must be room ids (strings)"}), 400
+
+    if profile not in PROFILES:
+        return jsonify({"error": "invalid profile"}), 400
+
+    if not start_room:
+        user_state = db.users_state.find_one({"user_id": user_id})
+        if not user_state:
+            return jsonify({"error": "user has no position"}), 404
+        start_room = user_state["current_room"]
+
+    snapshot = room_graph_cache.get(db)
+    for room_id in (start_room, target_room):
+        if room_id not in snapshot.graph:
+            return jsonify({"error": f"room {room_id} not found"}), 404
+
+    table = distance_table(db, snapshot, profile, data.get("avoid_crowds"))
+    room_route = table.path(start_room, target_room)
+    if room_route is None:
+        return jsonify({"error": "no path found"}), 404
+
+    poi_route = pois_from_map(snapshot.poi_by_room, room_route)
+
+    response = {
+        "status": "ok",
+        "profile": profile,
+        "avoid_crowds": bool(data.get("avoid_crowds")),
+        "distance": table.distance(start_room, target_room),
+        "rooms": room_route,
+        "pois": poi_route
+    }
+
+    if data.get("assign"):
+        if not user_id:
+            return jsonify({"error": "user_id is required to assign"}), 400
+        route_id = f"shortest_{user_id}_{now_iso()}"
+        save_and_assign_route(
+            db,
+            user_id,
+            route_id,
+            f"Ruta a {target_room} para {user_id}",
+            f"Camino más corto ({profile}) de {start_room} a {target_room}",
+            room_route,
+            poi_route
+        )
+        response["route_id"] = route_id
+
+    return jsonify(response), 200
+
+
+def distance_table(db, snapshot, profile, avoid_crowds=False):
+    """
+    Tabla de caminos más cortos del snapshot para el perfil; con
+    avoid_crowds, la penalizada por ocupación.
+    """
+    if not avoid_crowds:
+        return snapshot.distance_tables.get(profile)
+    levels, generation = occupancy_tracker.levels(db)
+    return snapshot.distance_tables.get_crowd_aware(
+        profile,
+        levels,
+        generation,
+        current_app.config.get("ROUTE_OCCUPANCY_PENALTY", 5.0)
+    )
+
+
+# Visita guiada por varias habitaciones
+@routes_bp.route("/tour", methods=["POST"])
+def tour_route():
+    """
+    Orden corto para visitar todas las habitaciones de "rooms" desde la
+    habitación actual del usuario (o start_room), sobre las tablas de
+    caminos más cortos cacheadas: vecino más cercano + 2-opt / Or-opt con
+    un presupuesto de tiempo (time_budget_ms, como mucho TOUR_TIME_BUDGET_MS).
+    Devuelve el orden de visita y el camino completo habitación a habitación.
+    Acepta profile, avoid_crowds, return_to_start y assign como /shortest.
+    """
+    db = get_db()
+    data = request.get_json() or {}
+
+    user_id = data.get("user_id")
+    start_room = data.get("start_room")
+    targets = data.get("rooms")
+    profile = data.get("profile", "default")
+    return_to_start = bool(data.get("return_to_start"))
+
+    if not isinstance(targets, list) or not targets or (not user_id and not start_room):
+        return jsonify({"error": "rooms (non-empty list) and user_id or start_room are required"}), 400
+
+    if not all(isinstance(room_id, str) for room_id in targets) or (start_room and not isinstance(start_room, str)):
+        return jsonify({"error": "rooms and start_room must be room ids (strings)"}), 400
+
+    if profile not in PROFILES:
+        return jsonify({"error": "invalid profile"}), 400
+
+    max_budget = current_app.config["TOUR_TIME_BUDGET_MS"]
+    try:
+        budget_ms = float(data.get("time_budget_ms", max_budget))
+    except (TypeError, ValueError):
+        return jsonify({"error": "time_budget_ms must be a number"}), 400
+    # "nan" o "inf" pasan por float() y dejarían el plazo sin efecto
+    if not math.isfinite(budget_ms) or budget_ms <= 0:
+        return jsonify({"error": "time_budget_ms must be a positive number"}), 400
+    budget_ms = min(budget_ms, max_budget)
+
+    if not start_room:
+        user_state = db.users_state.find_one({"user_id": user_id})
+        if not user_state:
+            return jsonify({"error": "user has no position"}), 404
+        start_room = user_state["current_room"]
+
+    snapshot = room_graph_cache.get(db)
+    missing = [room_id for room_id in [start_room] + targets if room_id not in snapshot.graph]
+    if missing:
+        return jsonify({"error": "rooms not found", "rooms": missing}), 404
+
+    table = distance_table(db, snapshot, profile, data.get("avoid_crowds"))
+    try:
+        order, distance, stats = plan_tour(table, start_room, targets, budget_ms / 1000, return_to_start)
+    except ValueError as e:
+        return jsonify({"error": "no path between some rooms", "rooms": e.args[0]}), 404
+
+    room_route = expand_tour(table, start_room, order, return_to_start)
+    poi_route = pois_from_map(snapshot.poi_by_room, room_route)
+
+    response = {
+        "status": "ok",
+        "profile": profile,
+        "avoid_crowds": bool(data.get("avoid_crowds")),
+        "order": order,
+        "distance": distance,
+        "rooms": room_route,
+        "pois": poi_route,
+        "optimizer": stats
+    }
+
+    if data.get("assign"):
+        if not user_id:
+            return jsonify({"error": "user_id is required to assign"}), 400
+        route_id = f"tour_{user_id}_{now_iso()}"
+        save_and_assign_route(
+            db,
+            user_id,
+            route_id,
+            f"Visita guiada para {user_id}",
+            f"Visita ({profile}) de {', '.join(order)} desde {start_room}",
+            room_route,
+            poi_route,
+            algorithm="tour",
+            start_room=start_room,
+            graph_version=snapshot.fingerprint
+        )
+        response["route_id"] = route_id
+
+    return jsonify(response), 200
+
+
 # Quitar ruta asignada a un usuario
 @routes_bp.route("/reset_user", methods=["POST"])
 def reset_user_route():
@@ -288,13 +712,9 @@ def reset_user_route():
 def get_next_step(user_id):
     db = get_db()
 
-    user_route = db.user_routes.find_one({"user_id": user_id})
-    if not user_route:
-        return jsonify({"error": "no route assigned"}), 404
-
-    route = db.routes.find_one({"_id": user_route["route_id"]})
-    if not route:
-        return jsonify({"error": "route not found"}), 404
+    user_route, route, error = user_route_with_steps(db, user_id)
+    if error:
+        return jsonify({"error": error}), 404
 
     current_step = user_route.get("current_step", 0)
     steps = route.get("steps", [])
@@ -309,3 +729,16 @@ def get_next_step(user_id):
         "next_room": next_step["room_id"],
         "next_poi": next_step["poi_id"]
     }), 200
+
+
+# Estado de la cache del grafo de habitaciones
+@routes_bp.route("/graph/stats", methods=["GET"])
+def graph_cache_stats():
+    return jsonify(room_graph_cache.stats()), 200
+
+
+# Forzar reconstrucción del grafo (p.ej. tras modificar el plano)
+@routes_bp.route("/graph/invalidate", methods=["POST"])
+def invalidate_graph_cache():
+    room_graph_cache.invalidate()
+    return jsonify({"status": "invalidated", "version": room_graph_cache.version}), 200
@@ -0,0 +1,213 @@
+import logging
+import os
+import threading
+import time
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from db.mongo import get_database
+
+logger = logging.getLogger(__name__)
+
+
+class StayCoalescer:
+    """
+    Agrupa los latidos "stay" de /position/update en memoria y los escribe
+    en bloque cada flush_interval segundos o al llegar a max_dirty usuarios
+    pendientes. Las entradas/salidas de habitación no pasan por aquí.
+
+    Para saber sin consultar Mongo que una detección es un "stay", se
+    recuerda la última habitación conocida de cada usuario (con caducidad,
+    por si otro worker lo ha movido). Las escrituras diferidas llevan
+    current_room en el filtro, así un latido atrasado nunca pisa un cambio
+    de habitación más reciente. Si el filtro no coincide y el latido es
+    posterior al estado guardado, la habitación recordada estaba obsoleta
+    (otro worker movió al usuario): el latido se vuelve a aplicar como
+    transición con el manejador de set_miss_handler.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._known_rooms = {}
+        self._config = None
+        self.enabled = False
+        self._flush_interval = 2
+        self._max_dirty = 500
+        self._room_ttl = 60
+        self._flusher_pid = None
+        self._stop = threading.Event()
+        self._miss_handler = None
+        self._stats = {
+            "coalesced": 0,
+            "flushes": 0,
+            "flushed_users": 0,
+            "flush_errors": 0,
+            "missed": 0
+        }
+
+    def configure(self, config):
+        self._config = config
+        self.enabled = config.get("STAY_COALESCING", False)
+        self._flush_interval = config.get("STAY_FLUSH_INTERVAL", 2)
+        self._max_dirty = config.get("STAY_FLUSH_MAX_DIRTY", 500)
+        self._room_ttl = config.get("STAY_KNOWN_ROOM_TTL", 60)
+
+    def set_miss_handler(self, handler):
+        """
+        handler(db, config, user_id, room_id, confidence, timestamp) aplica
+        como transición un latido cuya habitación ya no era la guardada.
+        """
+        self._miss_handler = handler
+
+    def known_room(self, user_id):
+        entry = self._known_rooms.get(user_id)
+        if entry is None:
+            return None
+        room_id, seen_at = entry
+        if time.time() - seen_at > self._room_ttl:
+            return None
+        return room_id
+
+    def remember(self, user_id, room_id):
+        self._known_rooms[user_id] = (room_id, time.time())
+
+    def discard(self, user_id):
+        """
+        Olvida el latido pendiente de un usuario (va a escribirse una
+        transición, que ya actualiza last_update).
+        """
+        with self._lock:
+            self._pending.pop(user_id, None)
+
+    def record_stay(self, user_id, room_id, confidence, timestamp):
+        self._ensure_flusher()
+
+        with self._lock:
+            self._pending[user_id] = {
+                "room": room_id,
+                "last_update": timestamp,
+                "confidence": confidence
+            }
+            self._stats["coalesced"] += 1
+            full = len(self._pending) >= self._max_dirty
+
+        # Refrescamos la caducidad: el usuario sigue en la habitación
+        self.remember(user_id, room_id)
+
+        if full:
+            self.flush()
+
+    def merge(self, user_state):
+        """
+        Superpone el latido pendiente (si lo hay) sobre un documento de
+        users_state leído de Mongo.
+        """
+        pending = self._pending.get(user_state.get("user_id"))
+        if pending is None or pending["room"] != user_state.get("current_room"):
+            return user_state
+        return dict(
+            user_state,
+            last_update=pending["last_update"],
+            confidence=pending["confidence"],
+            last_event="stay"
+        )
+
+    def flush(self, db=None):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        if not pending:
+            return 0
+
+        ops = [
+            UpdateOne(
+                {"user_id": user_id, "current_room": stay["room"]},
+                {"$set": {
+                    "last_update": stay["last_update"],
+                    "confidence": stay["confidence"],
+                    "last_event": "stay"
+                }}
+            )
+            for user_id, stay in pending.items()
+        ]
+
+        try:
+            if db is None:
+                db = get_database(self._config)
+            result = db.users_state.bulk_write(ops, ordered=False)
+            if result.matched_count < len(ops):
+                self._replay_missed(db, pending)
+        except PyMongoError as e:
+            logger.warning("stay flush failed: %s", e)
+            self._stats["flush_errors"] += 1
+            # Devolver los latidos que no hayan sido sustituidos por otros más nuevos
+            with self._lock:
+                for user_id, stay in pending.items():
+                    self._pending.setdefault(user_id, stay)
+            return 0
+
+        self._stats["flushes"] += 1
+        self._stats["flushed_users"] += len(ops)
+        return len(ops)
+
+    def _replay_missed(self, db, pending):
+        """
+        Latidos cuyo filtro (user_id, current_room) no ha coincidido: si el
+        estado guardado es más antiguo que el latido, el usuario ha vuelto a
+        esta habitación sin que este proceso lo supiera y se aplica como
+        transición. Si es más reciente, el latido estaba superado.
+        """
+        states = {
+            s["user_id"]: s
+            for s in db.users_state.find(
+                {"user_id": {"$in": list(pending)}},
+                {"_id": 0, "user_id": 1, "current_room": 1, "last_update": 1}
+            )
+        }
+        for user_id, stay in pending.items():
+            state = states.get(user_id, {})
+            if state.get("current_room") == stay["room"]:
+                continue
+            if (state.get("last_update") or "") > (stay["last_update"] or ""):
+                continue
+            self._stats["missed"] += 1
+            self._known_rooms.pop(user_id, None)
+            if self._miss_handler is not None:
+                self._miss_handler(db, self._config, user_id, stay["room"], stay["confidence"], stay["last_update"])
+
+    def stats(self):
+        return dict(self._stats, enabled=self.enabled, pending=len(self._pending))
+
+    def stop(self):
+        self._stop.set()
+        if self.enabled and self._config is not None:
+            self.flush()
+
+    def _ensure_flusher(self):
+        pid = os.getpid()
+        if self._flusher_pid == pid:
+            return
+        with self._lock:
+            if self._flusher_pid == pid:
+                return
+            # Tras un fork no heredamos latidos del padre ni su hilo
+            self._pending = {}
+            self._stop = threading.Event()
+            self._flusher_pid = pid
+            threading.Thread(target=self._run, name="stay-flusher", daemon=True).start()
+
+    def _run(self):
+        while not self._stop.wait(self._flush_interval):
+            self.flush()
+            self._prune_known_rooms()
+
+    def _prune_known_rooms(self):
+        limit = time.time() - self._room_ttl
+        for user_id, (_, seen_at) in list(self._known_rooms.items()):
+            if seen_at < limit:
+                self._known_rooms.pop(user_id, None)
+
+
+stay_coalescer = StayCoalescer()
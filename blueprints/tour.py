@@ -0,0 +1,146 @@
+import math
+import time
+
+
+def nearest_neighbour(dist, start, targets):
+    """
+    Orden inicial: desde start, siempre a la habitación pendiente más cercana.
+    """
+    order = []
+    pending = set(targets)
+    current = start
+    while pending:
+        row = dist[current]
+        current = min(pending, key=lambda room: (row.get(room, math.inf), room))
+        order.append(current)
+        pending.remove(current)
+    return order
+
+
+def route_cost(dist, route):
+    return sum(dist[a][b] for a, b in zip(route, route[1:]))
+
+
+def _prefix_costs(dist, route):
+    """
+    forward[k]: coste de route[0..k] en el sentido de la ruta;
+    backward[k]: el mismo tramo recorrido al revés (las distancias pueden no
+    ser simétricas, p.ej. con penalización por ocupación).
+    """
+    forward, backward = [0.0], [0.0]
+    for a, b in zip(route, route[1:]):
+        forward.append(forward[-1] + dist[a][b])
+        backward.append(backward[-1] + dist[b][a])
+    return forward, backward
+
+
+def _two_opt_move(dist, route, last, deadline):
+    """
+    Primera inversión de un tramo route[i..j] (1 <= i < j <= last) que
+    acorta la ruta. Devuelve True si ha aplicado alguna, False si no hay
+    y None si se acaba el tiempo.
+    """
+    forward, backward = _prefix_costs(dist, route)
+    for i in range(1, last):
+        if time.perf_counter() >= deadline:
+            return None
+        before = route[i - 1]
+        for j in range(i + 1, last + 1):
+            delta = dist[before][route[j]] - dist[before][route[i]]
+            if j + 1 < len(route):
+                delta += dist[route[i]][route[j + 1]] - dist[route[j]][route[j + 1]]
+            delta += (backward[j] - backward[i]) - (forward[j] - forward[i])
+            if delta < -1e-9:
+                route[i:j + 1] = reversed(route[i:j + 1])
+                return True
+    return False
+
+
+def _or_opt_move(dist, route, last, deadline, max_segment=3):
+    """
+    Primer traslado de un tramo de 1 a max_segment habitaciones a otra
+    posición que acorta la ruta. Devuelve True si ha aplicado alguno, False
+    si no hay y None si se acaba el tiempo.
+    """
+    for length in range(1, max_segment + 1):
+        for i in range(1, last - length + 2):
+            if time.perf_counter() >= deadline:
+                return None
+            j = i + length - 1
+            prev, first, end = route[i - 1], route[i], route[j]
+            following = route[j + 1] if j + 1 < len(route) else None
+            removed = dist[prev][first] + (dist[end][following] - dist[prev][following] if following else 0.0)
+
+            for p in range(0, last + 1):
+                if i - 1 <= p <= j:
+                    continue
+                a = route[p]
+                b = route[p + 1] if p + 1 < len(route) else None
+                added = dist[a][first] + (dist[end][b] - dist[a][b] if b else 0.0)
+                if added - removed < -1e-9:
+                    segment = route[i:j + 1]
+                    del route[i:j + 1]
+                    insert_at = p + 1 if p < i else p + 1 - length
+                    route[insert_at:insert_at] = segment
+                    return True
+    return False
+
+
+def plan_tour(table, start, targets, time_budget, return_to_start=False):
+    """
+    Orden corto para visitar targets desde start sobre la tabla de
+    distancias (camino más corto entre cada par): semilla del vecino más
+    cercano y mejoras 2-opt / Or-opt hasta que no haya ninguna o se agote
+    time_budget (segundos). La mejor ruta encontrada siempre es válida.
+
+    Devuelve (orden de visita, coste, estadísticas) o lanza ValueError con
+    las habitaciones a las que no se puede llegar.
+    """
+    targets = [room for room in dict.fromkeys(targets) if room != start]
+    stops = [start] + targets
+
+    # Submatriz solo con las paradas; hace falta poder ir de cualquiera a
+    # cualquiera porque las mejoras prueban todos los órdenes
+    dist = {a: {b: table.dist.get(a, {}).get(b, math.inf) for b in stops} for a in stops}
+    unreachable = sorted({b for a in stops for b in stops if dist[a][b] == math.inf})
+    if unreachable:
+        raise ValueError(unreachable)
+
+    deadline = time.perf_counter() + time_budget
+    route = [start] + nearest_neighbour(dist, start, targets)
+    if return_to_start:
+        route.append(start)
+    seed_cost = route_cost(dist, route)
+
+    # Última posición que se puede mover (la vuelta a start es fija)
+    last = len(route) - 2 if return_to_start else len(route) - 1
+    moves = 0
+    timed_out = False
+    while True:
+        moved = _two_opt_move(dist, route, last, deadline)
+        if moved is False:
+            moved = _or_opt_move(dist, route, last, deadline)
+        if moved is None:
+            timed_out = True
+            break
+        if not moved:
+            break
+        moves += 1
+
+    order = route[1:last + 1]
+    return order, route_cost(dist, route), {
+        "seed_cost": seed_cost,
+        "moves": moves,
+        "timed_out": timed_out
+    }
+
+
+def expand_tour(table, start, order, return_to_start=False):
+    """
+    Camino habitación a habitación que une start y las paradas en orden.
+    """
+    stops = [start] + order + ([start] if return_to_start else [])
+    path = [start]
+    for a, b in zip(stops, stops[1:]):
+        path.extend(table.path(a, b)[1:])
+    return path
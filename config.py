@@ -1,5 +1,132 @@
 import os
 
+
+def _int_env(name, default=None):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+
+def _float_env(name, default=None):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return float(value)
+
+
+def _list_env(name, default):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return [int(v) for v in value.split(",")]
+
+
 class Config:
     MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/indoor_db")
     DEBUG = os.getenv("DEBUG", "true").lower() == "true"
+
+    # Pool de conexiones del MongoClient compartido
+    MONGO_MAX_POOL_SIZE = _int_env("MONGO_MAX_POOL_SIZE", 100)
+    MONGO_MIN_POOL_SIZE = _int_env("MONGO_MIN_POOL_SIZE", 0)
+    MONGO_CONNECT_TIMEOUT_MS = _int_env("MONGO_CONNECT_TIMEOUT_MS", 5000)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = _int_env("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)
+    MONGO_SOCKET_TIMEOUT_MS = _int_env("MONGO_SOCKET_TIMEOUT_MS")
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = _int_env("MONGO_WAIT_QUEUE_TIMEOUT_MS")
+
+    # Read/write concern (vacío = el del servidor)
+    MONGO_READ_CONCERN = os.getenv("MONGO_READ_CONCERN", "")
+    MONGO_WRITE_CONCERN_W = os.getenv("MONGO_WRITE_CONCERN_W", "")
+    MONGO_WRITE_CONCERN_J = os.getenv("MONGO_WRITE_CONCERN_J", "").lower() == "true" or None
+
+    # Crear los índices declarados en db/indexes.py al arrancar
+    MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "true").lower() == "true"
+
+    # Cache del grafo de habitaciones para las rutas
+    GRAPH_CACHE_TTL = _int_env("GRAPH_CACHE_TTL", 0)  # segundos, 0 = sin caducidad
+    GRAPH_CACHE_WATCH = os.getenv("GRAPH_CACHE_WATCH", "auto")  # auto | changestream | poll | off
+    GRAPH_CACHE_POLL_INTERVAL = _int_env("GRAPH_CACHE_POLL_INTERVAL", 30)
+    TRAVERSAL_CACHE_SIZE = _int_env("TRAVERSAL_CACHE_SIZE", 1024)  # recorridos bfs/dfs memorizados
+    ROUTE_CACHE_SIZE = _int_env("ROUTE_CACHE_SIZE", 1024)  # rutas guardadas memorizadas por id
+    RESPONSE_CACHE_SIZE = _int_env("RESPONSE_CACHE_SIZE", 256)  # cuerpos JSON con ETag (/rooms, /routes...)
+
+    # Serialización de respuestas: JSON rápido si hay orjson, MessagePack por
+    # Accept (si hay msgpack) y gzip/deflate a partir de un tamaño (0 = nunca)
+    JSON_BACKEND = os.getenv("JSON_BACKEND", "auto")  # auto | orjson | stdlib
+    RESPONSE_COMPRESSION_MIN_BYTES = _int_env("RESPONSE_COMPRESSION_MIN_BYTES", 1024)
+    RESPONSE_COMPRESSION_LEVEL = _int_env("RESPONSE_COMPRESSION_LEVEL", 6)
+
+    # GET /routes: tamaño de página por defecto y máximo
+    ROUTES_PAGE_SIZE = _int_env("ROUTES_PAGE_SIZE", 100)
+    ROUTES_MAX_PAGE_SIZE = _int_env("ROUTES_MAX_PAGE_SIZE", 1000)
+    # /routes/auto reutiliza la ruta de (algoritmo, inicio, versión del grafo)
+    ROUTE_DEDUP = os.getenv("ROUTE_DEDUP", "false").lower() == "true"
+
+    # /routes/tour: tiempo máximo de mejora del orden de visita
+    TOUR_TIME_BUDGET_MS = _int_env("TOUR_TIME_BUDGET_MS", 200)
+
+    # Rutas ponderadas: coste extra por tramo con escaleras
+    ROUTE_STAIRS_PENALTY = _float_env("ROUTE_STAIRS_PENALTY", 10.0)
+
+    # Rutas que evitan aglomeraciones: niveles de ocupación y coste por nivel
+    ROUTE_OCCUPANCY_THRESHOLDS = _list_env("ROUTE_OCCUPANCY_THRESHOLDS", [5, 10, 20])
+    ROUTE_OCCUPANCY_PENALTY = _float_env("ROUTE_OCCUPANCY_PENALTY", 5.0)
+    ROUTE_OCCUPANCY_REFRESH_INTERVAL = _int_env("ROUTE_OCCUPANCY_REFRESH_INTERVAL", 5)
+
+    # /position/update: confirmar estado, eventos y ocupación en una transacción
+    # (requiere replica set)
+    POSITION_TRANSACTIONS = os.getenv("POSITION_TRANSACTIONS", "false").lower() == "true"
+
+    # Agrupación de latidos "stay" en /position/update
+    STAY_COALESCING = os.getenv("STAY_COALESCING", "false").lower() == "true"
+    STAY_FLUSH_INTERVAL = _float_env("STAY_FLUSH_INTERVAL", 2.0)  # segundos
+    STAY_FLUSH_MAX_DIRTY = _int_env("STAY_FLUSH_MAX_DIRTY", 500)  # usuarios pendientes
+    # Habitación recordada por usuario (segundos); si otro worker lo mueve
+    # entretanto, el latido que no coincide se aplica como transición al volcar
+    STAY_KNOWN_ROOM_TTL = _int_env("STAY_KNOWN_ROOM_TTL", 60)
+
+    # /position/update asíncrono: cola acotada + workers escritores (responde 202/429)
+    POSITION_ASYNC = os.getenv("POSITION_ASYNC", "false").lower() == "true"
+    POSITION_ASYNC_WORKERS = _int_env("POSITION_ASYNC_WORKERS", 4)
+    POSITION_ASYNC_QUEUE_SIZE = _int_env("POSITION_ASYNC_QUEUE_SIZE", 1000)  # por worker
+
+    # /rooms/room_events: tamaño de página por defecto y máximo
+    ROOM_EVENTS_PAGE_SIZE = _int_env("ROOM_EVENTS_PAGE_SIZE", 100)
+    ROOM_EVENTS_MAX_PAGE_SIZE = _int_env("ROOM_EVENTS_MAX_PAGE_SIZE", 1000)
+
+    # Retención de room_events: TTL sobre event_at (0 = sin caducidad) y
+    # archivo en segmentos locales de lo anterior a ARCHIVE_AFTER_DAYS
+    ROOM_EVENTS_TTL_DAYS = _int_env("ROOM_EVENTS_TTL_DAYS", 0)
+    ROOM_EVENTS_ARCHIVE_AFTER_DAYS = _int_env("ROOM_EVENTS_ARCHIVE_AFTER_DAYS", 7)
+    ROOM_EVENTS_ARCHIVE_DIR = os.getenv("ROOM_EVENTS_ARCHIVE_DIR", "archive/room_events")
+    ROOM_EVENTS_ARCHIVE_CHUNK = _int_env("ROOM_EVENTS_ARCHIVE_CHUNK", 5000)  # eventos por bloque
+    ROOM_EVENTS_SEGMENT_MAX_MB = _int_env("ROOM_EVENTS_SEGMENT_MAX_MB", 64)
+
+    # Series por habitación (room_rollups) y /rooms/<room_id>/history
+    ROOM_ROLLUPS = os.getenv("ROOM_ROLLUPS", "true").lower() == "true"
+    ROOM_HISTORY_MAX_BUCKETS = _int_env("ROOM_HISTORY_MAX_BUCKETS", 2000)
+
+    # Visitas cerradas (dwell_sessions) para las estadísticas de permanencia
+    DWELL_SESSIONS = os.getenv("DWELL_SESSIONS", "true").lower() == "true"
+
+    # /rooms/occupancy/stream (SSE)
+    OCCUPANCY_STREAM_HEARTBEAT = _int_env("OCCUPANCY_STREAM_HEARTBEAT", 15)  # segundos
+    OCCUPANCY_STREAM_MAX_PENDING = _int_env("OCCUPANCY_STREAM_MAX_PENDING", 100)  # mensajes por cliente
+
+    # Motor de ocupación en memoria: contadores volcados a rooms en bloque
+    OCCUPANCY_ENGINE = os.getenv("OCCUPANCY_ENGINE", "false").lower() == "true"
+    OCCUPANCY_FLUSH_INTERVAL = _float_env("OCCUPANCY_FLUSH_INTERVAL", 1.0)  # segundos
+
+    # Localización kNN por huellas RSSI (/position/locate con mode=knn)
+    FINGERPRINT_K = _int_env("FINGERPRINT_K", 5)
+    FINGERPRINT_RELOAD_INTERVAL = _int_env("FINGERPRINT_RELOAD_INTERVAL", 30)  # segundos
+    # Reconstrucción completa del índice (huellas de otros workers fuera del margen)
+    FINGERPRINT_FULL_RELOAD_INTERVAL = _int_env("FINGERPRINT_FULL_RELOAD_INTERVAL", 600)  # segundos
+
+    # Suavizado de detecciones antes de la máquina de estados
+    SMOOTHING_MODE = os.getenv("SMOOTHING_MODE", "off")  # off | majority | ema
+    SMOOTHING_WINDOW = _int_env("SMOOTHING_WINDOW", 5)  # detecciones (majority)
+    SMOOTHING_EMA_ALPHA = _float_env("SMOOTHING_EMA_ALPHA", 0.5)
+    SMOOTHING_EMA_MARGIN = _float_env("SMOOTHING_EMA_MARGIN", 0.2)
+    SMOOTHING_MIN_DWELL = _float_env("SMOOTHING_MIN_DWELL", 0.0)  # segundos
+    SMOOTHING_IDLE_TTL = _int_env("SMOOTHING_IDLE_TTL", 600)  # segundos
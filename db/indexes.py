@@ -0,0 +1,101 @@
+import logging
+
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Índices que necesitan las consultas de los endpoints.
+# (colección, claves, opciones)
+INDEXES = [
+    # position.py / routes.py: estado por usuario (uno por usuario)
+    ("users_state", [("user_id", ASCENDING)], {"name": "user_id_unique", "unique": True}),
+    # routes.py: ruta asignada por usuario (una por usuario)
+    ("user_routes", [("user_id", ASCENDING)], {"name": "user_id_unique", "unique": True}),
+    # routes.py: listado de rutas paginado por (created_at, _id)
+    ("routes", [("created_at", ASCENDING), ("_id", ASCENDING)], {"name": "created_at_id"}),
+    # rooms.py: eventos de un usuario paginados por (timestamp, _id)
+    ("room_events", [("user_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+     {"name": "user_id_timestamp_id"}),
+    # rooms.py: eventos de todos los usuarios paginados por (timestamp, _id)
+    ("room_events", [("timestamp", ASCENDING), ("_id", ASCENDING)], {"name": "timestamp_id"}),
+    # rooms.py: buckets de /rooms/<room_id>/history por rango de tiempo
+    ("room_rollups", [("room_id", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)],
+     {"name": "room_id_granularity_bucket"}),
+    # rooms.py: estadísticas de permanencia por habitación / usuario y rango
+    ("dwell_sessions", [("room_id", ASCENDING), ("exited_at", ASCENDING)], {"name": "room_id_exited_at"}),
+    ("dwell_sessions", [("user_id", ASCENDING), ("exited_at", ASCENDING)], {"name": "user_id_exited_at"}),
+]
+
+
+def ensure_indexes(db):
+    """
+    Crea los índices declarados (create_index es idempotente).
+    Devuelve la lista de errores, p.ej. un índice único que no se puede
+    crear porque ya hay duplicados.
+    """
+    errors = []
+    for collection, keys, options in INDEXES:
+        try:
+            db[collection].create_index(keys, **options)
+        except OperationFailure as e:
+            logger.error("could not create index %s on %s: %s", options.get("name"), collection, e)
+            errors.append({"collection": collection, "index": options.get("name"), "error": str(e)})
+    return errors
+
+
+def ensure_ttl_index(db, collection, field, seconds):
+    """
+    Índice TTL "<field>_ttl" con expireAfterSeconds=seconds. Si ya existe con
+    otro valor se cambia con collMod; con seconds a 0 se elimina (sin
+    caducidad). Va aparte de INDEXES porque el plazo sale de la configuración.
+    """
+    name = f"{field}_ttl"
+    existing = db[collection].index_information().get(name)
+    if not seconds:
+        if existing:
+            db[collection].drop_index(name)
+        return
+    if existing is None:
+        db[collection].create_index([(field, ASCENDING)], name=name, expireAfterSeconds=seconds)
+    elif existing.get("expireAfterSeconds") != seconds:
+        db.command("collMod", collection, index={"name": name, "expireAfterSeconds": seconds})
+
+
+def index_report(db):
+    """
+    Compara los índices declarados con los que existen:
+    - missing: declarados pero no creados
+    - unused: existentes sin ningún uso desde que arrancó el servidor ($indexStats)
+    - undeclared: existentes que no están en INDEXES
+    """
+    declared = {}
+    for collection, keys, options in INDEXES:
+        declared.setdefault(collection, {})[tuple(keys)] = options.get("name")
+
+    report = {"missing": [], "unused": [], "undeclared": []}
+
+    for collection in sorted(declared.keys() | set(db.list_collection_names())):
+        existing = db[collection].index_information()
+        existing_keys = {tuple(info["key"]): name for name, info in existing.items()}
+        # Los TTL los gestiona ensure_ttl_index según la configuración
+        ttl_names = {name for name, info in existing.items() if "expireAfterSeconds" in info}
+
+        for keys, name in declared.get(collection, {}).items():
+            if keys not in existing_keys:
+                report["missing"].append({"collection": collection, "index": name, "keys": list(keys)})
+
+        for keys, name in existing_keys.items():
+            if name != "_id_" and name not in ttl_names and keys not in declared.get(collection, {}):
+                report["undeclared"].append({"collection": collection, "index": name, "keys": list(keys)})
+
+        try:
+            stats = db[collection].aggregate([{"$indexStats": {}}])
+            for s in stats:
+                if s["name"] != "_id_" and s["accesses"]["ops"] == 0:
+                    report["unused"].append({"collection": collection, "index": s["name"]})
+        except OperationFailure:
+            # $indexStats no está disponible (permisos o versión del servidor)
+            pass
+
+    return report
@@ -1,23 +1,119 @@
+import os
+import threading
+
 from flask import current_app, g
 from pymongo import MongoClient
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
+
+# Cliente único por proceso (MongoClient ya mantiene su propio pool de conexiones).
+# Guardamos el PID con el que se creó para no reutilizarlo tras un fork
+# (p.ej. workers de gunicorn): pymongo no es fork-safe.
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def _write_concern(config):
+    w = config.get("MONGO_WRITE_CONCERN_W")
+    if w is None or w == "":
+        return None
+    if isinstance(w, str) and w.isdigit():
+        w = int(w)
+    return WriteConcern(w=w, j=config.get("MONGO_WRITE_CONCERN_J"))
+
+
+def _read_concern(config):
+    level = config.get("MONGO_READ_CONCERN")
+    if not level:
+        return None
+    return ReadConcern(level)
+
+
+def _client_options(config):
+    """
+    Traduce la configuración de la app a opciones de MongoClient.
+    """
+    options = {
+        "maxPoolSize": config.get("MONGO_MAX_POOL_SIZE", 100),
+        "minPoolSize": config.get("MONGO_MIN_POOL_SIZE", 0),
+        "connectTimeoutMS": config.get("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "serverSelectionTimeoutMS": config.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "socketTimeoutMS": config.get("MONGO_SOCKET_TIMEOUT_MS"),
+        "waitQueueTimeoutMS": config.get("MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+        # No arrancar los hilos de monitorización hasta la primera operación
+        "connect": False,
+    }
+    return {k: v for k, v in options.items() if v is not None}
+
+
+def get_client(config=None):
+    """
+    Devuelve el MongoClient compartido por todo el proceso.
+    Se crea de forma perezosa la primera vez que se usa en cada proceso,
+    así cada worker tiene el suyo propio aunque la app se cargue antes del fork.
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    if config is None:
+        config = current_app.config
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            # Si venimos de un fork no cerramos el cliente heredado:
+            # sus sockets pertenecen al proceso padre.
+            _client = MongoClient(config["MONGO_URI"], **_client_options(config))
+            _client_pid = pid
+    return _client
+
+
+def get_database(config=None):
+    """
+    Devuelve la base de datos por defecto del cliente compartido, con el
+    read/write concern configurado. Se puede usar fuera de un request
+    (hilos en segundo plano, scripts) pasando la config explícitamente.
+    """
+    if config is None:
+        config = current_app.config
+
+    client = get_client(config)
+    # Si en la URI no viene el nombre de la DB, usa la "default"
+    return client.get_default_database(
+        write_concern=_write_concern(config),
+        read_concern=_read_concern(config)
+    )
+
 
 def get_db():
     """
     Devuelve la base de datos MongoDB asociada a la app.
-    Usa g para guardar la conexión por request.
+    Usa g para cachear el handle durante el request; el cliente es compartido.
     """
     if "mongo_db" not in g:
-        mongo_uri = current_app.config["MONGO_URI"]
-        client = MongoClient(mongo_uri)
-        g.mongo_client = client
-        # Si en la URI no viene el nombre de la DB, usa la "default"
-        g.mongo_db = client.get_default_database()
+        g.mongo_db = get_database()
     return g.mongo_db
 
+
 def close_db(e=None):
     """
-    Cierra la conexión a MongoDB al final del request/app context.
+    Al final del request/app context solo soltamos el handle.
+    El cliente (y su pool) sigue vivo para los siguientes requests.
     """
-    client = g.pop("mongo_client", None)
-    if client is not None:
-        client.close()
+    g.pop("mongo_db", None)
+
+
+def close_client():
+    """
+    Cierra el cliente compartido (apagado del proceso).
+    """
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING
+
+from utils.segments import SegmentWriter
+
+
+def archive_events(db, directory, older_than_days, chunk_size=5000, segment_max_bytes=64 * 1024 * 1024):
+    """
+    Mueve los room_events con timestamp anterior a ahora - older_than_days a
+    segmentos comprimidos en directory, por trozos de chunk_size en orden
+    (timestamp, _id). Cada trozo es un bloque del segmento: se escribe, se
+    indexa y solo entonces se borra de Mongo, así que un corte a mitad como
+    mucho duplica un bloque en el archivo (los _id permiten descartarlo).
+    Devuelve {"events": n, "blocks": n}.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).isoformat()
+    writer = SegmentWriter(directory, max_bytes=segment_max_bytes)
+
+    archived = blocks = 0
+    while True:
+        chunk = list(db.room_events.find(
+            {"timestamp": {"$lt": cutoff}}, {"event_at": 0}
+        ).sort([("timestamp", ASCENDING), ("_id", ASCENDING)]).limit(chunk_size))
+        if not chunk:
+            break
+
+        ids = [event["_id"] for event in chunk]
+        for event in chunk:
+            event["_id"] = str(event["_id"])
+        writer.append_block(chunk)
+        db.room_events.delete_many({"_id": {"$in": ids}})
+
+        archived += len(chunk)
+        blocks += 1
+
+    return {"events": archived, "blocks": blocks}
+
+
+def backfill_event_at(db):
+    """
+    Rellena event_at (fecha real para el índice TTL) en los eventos escritos
+    antes de que existiera, convirtiendo el timestamp ISO en el servidor.
+    """
+    result = db.room_events.update_many(
+        {"event_at": {"$exists": False}},
+        [{"$set": {"event_at": {"$dateFromString": {"dateString": "$timestamp", "onError": "$$NOW"}}}}]
+    )
+    return result.modified_count
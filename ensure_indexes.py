@@ -0,0 +1,26 @@
+import json
+import os
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from db.indexes import ensure_indexes, index_report
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/indoor_db")
+
+def main():
+    client = MongoClient(MONGO_URI)
+    db = client.get_default_database()
+
+    errors = ensure_indexes(db)
+    for error in errors:
+        print(f"Error creando {error['index']} en {error['collection']}: {error['error']}")
+
+    report = index_report(db)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Recalcula current_occupancy de todas las habitaciones a partir de
+users_state. Ejecutar con los workers de la API parados (o antes de
+arrancarlos): los deltas del motor de ocupación que aún no se hayan
+volcado se contarían dos veces.
+"""
+import argparse
+import os
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from blueprints.occupancy_engine import occupancy_engine
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/indoor_db")
+
+def main():
+    argparse.ArgumentParser(description=__doc__).parse_args()
+
+    client = MongoClient(MONGO_URI)
+    db = client.get_default_database()
+
+    counts = occupancy_engine.rebuild(db)
+    for room_id, count in sorted(counts.items()):
+        print(f"{room_id}: {count}")
+
+    client.close()
+
+if __name__ == "__main__":
+    main()
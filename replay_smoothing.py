@@ -0,0 +1,101 @@
+"""
+Reproduce el historial de room_events con el suavizado de detecciones y
+mide cuántas escrituras en Mongo se ahorran por cambio real de habitación.
+
+room_events solo guarda las entradas confirmadas, así que entre dos
+"enter" de un usuario se generan detecciones de la habitación en la que
+estaba cada --interval segundos. Se considera cambio real una visita que
+dura al menos --real-dwell segundos; las más cortas son ruido.
+"""
+import argparse
+import os
+from itertools import groupby
+
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+from utils.smoothing import RoomSmoother
+from utils.time_utils import parse_iso_seconds
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/indoor_db")
+
+# Escrituras de un cambio de habitación: 2 room_events, 2 $inc y el estado
+WRITES_PER_CHANGE = 5
+
+
+def detections(enters, interval, max_gap):
+    """
+    Detecciones sintéticas (room_id, segundos) a partir de las entradas
+    consecutivas de un usuario.
+    """
+    for (room_id, start), (_, end) in zip(enters, enters[1:] + [(None, None)]):
+        if end is None:
+            yield room_id, start
+            continue
+        t = start
+        while t < end and t - start <= max_gap:
+            yield room_id, t
+            t += interval
+
+
+def count_changes(rooms):
+    return sum(1 for a, b in zip(rooms, rooms[1:]) if a != b)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", default="majority", choices=["majority", "ema"])
+    parser.add_argument("--window", type=int, default=5)
+    parser.add_argument("--ema-alpha", type=float, default=0.5)
+    parser.add_argument("--ema-margin", type=float, default=0.2)
+    parser.add_argument("--min-dwell", type=float, default=3.0)
+    parser.add_argument("--interval", type=float, default=1.0, help="segundos entre detecciones simuladas")
+    parser.add_argument("--max-gap", type=float, default=300.0, help="máximo de segundos simulados por visita")
+    parser.add_argument("--real-dwell", type=float, default=10.0)
+    args = parser.parse_args()
+
+    client = MongoClient(MONGO_URI)
+    db = client.get_default_database()
+    cursor = db.room_events.find(
+        {"event": "enter"},
+        {"_id": 0, "user_id": 1, "room_id": 1, "timestamp": 1}
+    ).sort([("user_id", 1), ("timestamp", 1)])
+
+    smoother = RoomSmoother(
+        mode=args.mode,
+        window=args.window,
+        ema_alpha=args.ema_alpha,
+        ema_margin=args.ema_margin,
+        min_dwell=args.min_dwell
+    )
+
+    users = raw_changes = smoothed_changes = real_changes = 0
+    for user_id, events in groupby(cursor, key=lambda e: e["user_id"]):
+        enters = [(e["room_id"], parse_iso_seconds(e["timestamp"])) for e in events]
+        users += 1
+
+        raw_changes += len(enters) - 1
+        real_rooms = [room for (room, t), (_, t_next) in zip(enters, enters[1:] + [(None, float("inf"))])
+                      if t_next - t >= args.real_dwell]
+        real_changes += count_changes([r for r, _ in groupby(real_rooms)])
+
+        committed = [
+            smoother.observe(user_id, room, None, t)
+            for room, t in detections(enters, args.interval, args.max_gap)
+        ]
+        smoothed_changes += count_changes(committed)
+
+    client.close()
+
+    print(f"usuarios: {users}")
+    print(f"cambios reales (visitas >= {args.real_dwell:g}s): {real_changes}")
+    for name, changes in (("sin suavizado", raw_changes), (f"{args.mode}", smoothed_changes)):
+        writes = changes * WRITES_PER_CHANGE
+        per_real = writes / real_changes if real_changes else float("nan")
+        print(f"{name:<15} cambios: {changes:>7}  escrituras: {writes:>8}  por cambio real: {per_real:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import mongomock
+import pytest
+
+import seed_rooms
+from config import Config
+from db import mongo
+from blueprints.graph_cache import room_graph_cache
+from blueprints.occupancy import occupancy_tracker
+from blueprints.routes import route_cache
+from blueprints.stay_coalescer import stay_coalescer
+from utils.http_cache import response_cache
+
+
+class MockClient(mongomock.MongoClient):
+    """
+    MongoClient en memoria; `created` cuenta cuántas veces la app ha
+    construido un cliente.
+    """
+
+    created = 0
+
+    def get_default_database(self, **kwargs):
+        return self["indoor_db"]
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def mongo_client(monkeypatch):
+    """
+    Sustituye MongoClient por mongomock (base vacía en cada test) y carga
+    las habitaciones de seed_rooms.
+    """
+    client = MockClient()
+
+    def construct(*args, **kwargs):
+        client.created += 1
+        return client
+
+    monkeypatch.setattr(mongo, "MongoClient", construct)
+    monkeypatch.setattr(seed_rooms, "MongoClient", lambda *args, **kwargs: client)
+    monkeypatch.setattr(mongo, "_client", None)
+    monkeypatch.setattr(mongo, "_client_pid", None)
+
+    seed_rooms.seed_rooms()
+    return client
+
+
+@pytest.fixture
+def app(mongo_client, monkeypatch):
+    monkeypatch.setattr(Config, "MONGO_ENSURE_INDEXES", False)
+    monkeypatch.setattr(Config, "GRAPH_CACHE_WATCH", "off")
+
+    from app import create_app
+    app = create_app()
+    app.config["TESTING"] = True
+
+    # Los singletons del proceso sobreviven entre tests
+    room_graph_cache.invalidate("test")
+    route_cache.clear()
+    response_cache._bodies.clear()
+    stay_coalescer._pending.clear()
+    stay_coalescer._known_rooms.clear()
+    # Como en un worker recién arrancado: sin foto de ocupación cargada
+    occupancy_tracker._counts = {}
+    occupancy_tracker._levels = {}
+    occupancy_tracker._refreshed_at = 0.0
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def db(app):
+    return mongo.get_database(app.config)
@@ -0,0 +1,24 @@
+import math
+
+from utils.beacon_locator import rssi_scores
+
+
+def rssi_score(rssi):
+    # Función original de utils/locator.txt
+    if rssi > -60:
+        return 3
+    elif rssi > -75:
+        return 2
+    elif rssi > -90:
+        return 1
+    else:
+        return 0
+
+
+def test_rssi_scores_match_legacy_function():
+    values = list(range(-120, 1)) + [-60.5, -59.5, -75.01, -89.99]
+    assert list(rssi_scores(values)) == [rssi_score(v) for v in values]
+
+
+def test_rssi_scores_at_thresholds():
+    assert list(rssi_scores([-60, -75, -90, math.nan])) == [2, 1, 0, 0]
@@ -0,0 +1,44 @@
+import pytest
+
+from blueprints.dwell import dwell_sessions, histogram_percentile
+
+
+def visit(db, user_id, room_id, minute, duration):
+    entered_at = f"2024-01-01T10:{minute:02d}:00+00:00"
+    db.dwell_sessions.insert_one({"_id": f"{user_id}|{room_id}|{entered_at}", "user_id": user_id,
+                                  "room_id": room_id, "entered_at": entered_at, "duration": duration})
+
+
+def test_stats_from_histogram(db):
+    durations = [10, 20, 30, 40, 600]
+    for minute, duration in enumerate(durations):
+        visit(db, "u1", "SALON", minute, duration)
+    visit(db, "u2", "COCINA", 0, 5)
+
+    salon, = dwell_sessions.stats(db, {"room_id": "SALON"}, "room_id")
+
+    assert (salon["count"], salon["mean"], salon["max"]) == (5, 140, 600)
+    # Bins de un solo valor: los percentiles coinciden con los exactos
+    assert salon["p50"] == 30
+    assert salon["p90"] == pytest.approx(40 + (600 - 40) * 0.6)
+    assert [s["room_id"] for s in dwell_sessions.stats(db, {}, "room_id")] == ["COCINA", "SALON"]
+
+
+def test_histogram_percentile_interpolates_inside_a_bin():
+    assert histogram_percentile([], 50) is None
+    assert histogram_percentile([(3, 100, 110)], 50) == 105
+    assert histogram_percentile([(1, 1, 1), (1, 9, 9)], 50) == 5
+
+
+def test_backfill_pairs_visits_of_interleaved_users(client, db):
+    for user_id, room, second in [("u1", "SALON", 0), ("u2", "COCINA", 1), ("u1", "HAB1", 30), ("u2", "HAB1", 41)]:
+        client.post("/position/update", json={
+            "user_id": user_id, "detected_room": room, "timestamp": f"2024-01-01T10:00:{second:02d}+00:00"
+        })
+    db.dwell_sessions.delete_many({})
+
+    result = dwell_sessions.backfill(db, chunk_size=2)
+
+    assert result["sessions"] == 2
+    visits = {(v["user_id"], v["room_id"]): v["duration"] for v in db.dwell_sessions.find()}
+    assert visits == {("u1", "SALON"): 30, ("u2", "COCINA"): 40}
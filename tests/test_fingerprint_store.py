@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from blueprints.fingerprint_store import FingerprintStore
+from blueprints.graph_cache import room_graph_cache
+
+
+def fingerprint(room_id, rssi, **extra):
+    return dict({"room_id": room_id, "beacons": [{"mac": "AA", "rssi": rssi}]}, **extra)
+
+
+def test_loads_out_of_order_ids_from_other_workers(app, db):
+    store = FingerprintStore()
+    store.configure({"FINGERPRINT_RELOAD_INTERVAL": -1})
+    snapshot = room_graph_cache.get(db)
+
+    store.add(db, snapshot, [fingerprint("SALON", -60)])
+    assert len(store.index(db, snapshot)) == 1
+    # Otro worker con el reloj unos segundos atrasado: su _id es menor que el ya cargado
+    earlier = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=10))
+    db.fingerprints.insert_one(fingerprint("COCINA", -70, _id=earlier))
+
+    assert len(store.index(db, snapshot)) == 2
+    # Las siguientes cargas no duplican las que ya están en el índice
+    assert len(store.index(db, snapshot)) == 2
+
+
+def test_periodic_full_reload(app, db):
+    store = FingerprintStore()
+    store.configure({"FINGERPRINT_RELOAD_INTERVAL": 3600, "FINGERPRINT_FULL_RELOAD_INTERVAL": -1})
+    snapshot = room_graph_cache.get(db)
+    assert len(store.index(db, snapshot)) == 0
+
+    db.fingerprints.insert_one(fingerprint("SALON", -60))
+
+    assert len(store.index(db, snapshot)) == 1
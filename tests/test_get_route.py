@@ -0,0 +1,49 @@
+import gzip
+import json
+
+import msgpack
+import pytest
+
+from config import Config
+
+
+@pytest.fixture
+def compression(monkeypatch):
+    monkeypatch.setattr(Config, "RESPONSE_COMPRESSION_MIN_BYTES", 1)
+
+
+def test_every_representation_of_a_cached_route(compression, client, db):
+    db.routes.insert_one({"_id": "r1", "name": "Ruta", "steps": [{"room_id": "SALON"}, {"room_id": "COCINA"}]})
+    expected = {"name": "Ruta", "steps": [{"room_id": "SALON"}, {"room_id": "COCINA"}], "route_id": "r1"}
+
+    identity = client.get("/routes/r1", headers={"Accept-Encoding": "identity"})
+    assert identity.status_code == 200
+    assert identity.json == expected
+
+    # La ruta ya está en la cache: el resto de variantes se serializan sin 500
+    compressed = client.get("/routes/r1", headers={"Accept-Encoding": "gzip"})
+    assert compressed.status_code == 200
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(compressed.data)) == expected
+
+    packed = client.get("/routes/r1", headers={"Accept": "application/msgpack", "Accept-Encoding": "identity"})
+    assert packed.status_code == 200
+    assert msgpack.unpackb(packed.data) == expected
+
+    assert len({identity.headers["ETag"], compressed.headers["ETag"], packed.headers["ETag"]}) == 3
+
+
+def test_missing_route(client):
+    assert client.get("/routes/none").status_code == 404
+
+
+def test_route_deleted_by_another_worker(client, db):
+    db.routes.insert_one({"_id": "r1", "name": "Ruta", "steps": []})
+    first = client.get("/routes/r1")
+    assert first.status_code == 200
+
+    # DELETE atendido por otro worker: la cache de respuestas de este proceso sigue llena
+    db.routes.delete_one({"_id": "r1"})
+
+    assert client.get("/routes/r1").status_code == 404
+    assert client.get("/routes/r1", headers={"If-None-Match": first.headers["ETag"]}).status_code == 404
@@ -0,0 +1,14 @@
+from utils import http_cache
+
+
+def test_forked_worker_does_not_reuse_parent_etag(client, monkeypatch):
+    parent = client.get("/rooms/occupancy")
+    assert client.get("/rooms/occupancy", headers={"If-None-Match": parent.headers["ETag"]}).status_code == 304
+
+    # Worker creado con fork tras precargar la app: mismo módulo, otro PID
+    monkeypatch.setattr(http_cache, "_instance_pid", -1)
+
+    child = client.get("/rooms/occupancy", headers={"If-None-Match": parent.headers["ETag"]})
+    assert child.status_code == 200
+    assert child.headers["ETag"] != parent.headers["ETag"]
+    assert http_cache.instance_tag("x") == http_cache.instance_tag("x")
@@ -0,0 +1,28 @@
+import threading
+import time
+
+from blueprints.ingest_queue import IngestionQueue
+
+
+def test_shutdown_does_not_block_on_a_full_queue(app):
+    release = threading.Event()
+    ingestion = IngestionQueue()
+    ingestion.configure(dict(app.config, POSITION_ASYNC=True, POSITION_ASYNC_WORKERS=1, POSITION_ASYNC_QUEUE_SIZE=1))
+    # Handler atascado (p.ej. Mongo caído): la cola se queda llena
+    ingestion.set_handler(lambda db, config, update: release.wait(5))
+
+    assert ingestion.submit({"user_id": "u1"})
+    time.sleep(0.1)
+    assert ingestion.submit({"user_id": "u1"})
+    assert not ingestion.submit({"user_id": "u1"})
+
+    started = time.monotonic()
+    ingestion.shutdown(timeout=0.2)
+    assert time.monotonic() - started < 1
+    assert not ingestion.submit({"user_id": "u1"})
+
+    # Al desatascarse, el worker vacía la cola y termina por el evento de parada
+    release.set()
+    ingestion._threads[0].join(2)
+    assert not ingestion._threads[0].is_alive()
+    assert ingestion.stats()["processed"] == 2
@@ -0,0 +1,26 @@
+import os
+
+from db import mongo
+
+
+def test_requests_share_one_client(client, mongo_client):
+    for _ in range(20):
+        assert client.get("/position/users_state").status_code == 200
+        assert client.get("/rooms/occupancy").status_code == 200
+
+    assert mongo_client.created == 1
+
+
+def test_client_is_rebuilt_after_fork(client, mongo_client, monkeypatch):
+    assert client.get("/position/users_state").status_code == 200
+    assert mongo_client.created == 1
+
+    # Cliente heredado de otro proceso (p.ej. el master de gunicorn)
+    monkeypatch.setattr(mongo, "_client_pid", -1)
+
+    assert client.get("/position/users_state").status_code == 200
+    assert mongo_client.created == 2
+    assert mongo._client_pid == os.getpid()
+
+    assert client.get("/position/users_state").status_code == 200
+    assert mongo_client.created == 2
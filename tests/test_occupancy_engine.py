@@ -0,0 +1,49 @@
+import pytest
+
+from config import Config
+from blueprints.occupancy import OccupancyTracker
+from blueprints.occupancy_engine import occupancy_engine
+
+
+def test_set_count_keeps_unflushed_deltas():
+    tracker = OccupancyTracker()
+    tracker.set_pending_source(lambda: {"HAB1": 2})
+
+    tracker.set_count("HAB1", 3)
+    tracker.set_count("HAB2", 1)
+
+    assert tracker.counts() == {"HAB1": 5, "HAB2": 1}
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(Config, "OCCUPANCY_ENGINE", True)
+    yield
+    occupancy_engine.enabled = False
+
+
+def test_app_start_does_not_rebuild(engine, mongo_client, monkeypatch):
+    db = mongo_client.get_default_database()
+    # Ocupación que incluye deltas ya volcados por otros workers
+    db.rooms.update_one({"_id": "HAB1"}, {"$set": {"current_occupancy": 4}})
+
+    monkeypatch.setattr(Config, "MONGO_ENSURE_INDEXES", False)
+    monkeypatch.setattr(Config, "GRAPH_CACHE_WATCH", "off")
+    from app import create_app
+    create_app()
+
+    assert db.rooms.find_one({"_id": "HAB1"})["current_occupancy"] == 4
+
+
+def test_rebuild_counts_users_state(engine, db):
+    db.users_state.insert_many([
+        {"user_id": "u1", "current_room": "HAB1"},
+        {"user_id": "u2", "current_room": "HAB1"},
+        {"user_id": "u3", "current_room": "SALON"},
+    ])
+    db.rooms.update_one({"_id": "COCINA"}, {"$set": {"current_occupancy": 3}})
+
+    counts = occupancy_engine.rebuild(db)
+
+    assert (counts["HAB1"], counts["SALON"], counts["COCINA"]) == (2, 1, 0)
+    assert db.rooms.find_one({"_id": "COCINA"})["current_occupancy"] == 0
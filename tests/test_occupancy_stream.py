@@ -0,0 +1,41 @@
+import json
+import os
+
+from blueprints.occupancy import occupancy_tracker
+from blueprints.occupancy_stream import occupancy_broker
+
+
+def read_event(lines):
+    event = {}
+    for line in lines:
+        line = line.decode() if isinstance(line, bytes) else line
+        for part in line.splitlines():
+            if part.startswith("event: "):
+                event["event"] = part[len("event: "):]
+            elif part.startswith("data: "):
+                event["data"] = json.loads(part[len("data: "):])
+        if "data" in event:
+            return event
+
+
+def test_merged_deltas_do_not_change_other_subscribers(client, monkeypatch):
+    # Sin hilo de change stream: los cambios se publican a mano
+    monkeypatch.setattr(occupancy_broker, "_feeder_pid", os.getpid())
+    other = occupancy_broker.subscribe()
+    try:
+        response = client.get("/rooms/occupancy/stream", buffered=False)
+        stream = iter(response.response)
+        assert read_event(stream)["event"] == "snapshot"
+
+        occupancy_tracker.set_count("HAB1", 7)
+        occupancy_tracker.set_count("HAB2", 3)
+
+        delta = read_event(stream)
+        assert delta["event"] == "delta"
+        assert delta["data"] == {"HAB1": 7, "HAB2": 3}
+        response.close()
+
+        messages = [other.queue.get_nowait()[1], other.queue.get_nowait()[1]]
+        assert messages == [{"HAB1": 7}, {"HAB2": 3}]
+    finally:
+        occupancy_broker.unsubscribe(other)
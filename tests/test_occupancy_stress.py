@@ -0,0 +1,96 @@
+"""
+Prueba de carga concurrente de /position/update contra un MongoDB real.
+Necesita un replica set (para el modo con transacciones) en MONGO_TEST_URI,
+p.ej. mongodb://localhost:27017/indoor_test?replicaSet=rs0; la base de
+datos de la URI se vacía. Ejecutar con: pytest -m integration
+"""
+import os
+import random
+import threading
+from collections import Counter
+
+import pytest
+from pymongo import MongoClient
+
+import seed_rooms
+from config import Config
+from db import mongo
+from blueprints.graph_cache import room_graph_cache
+from blueprints.occupancy import occupancy_tracker
+
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI")
+
+THREADS = 16
+UPDATES_PER_THREAD = 200
+USERS = 40
+
+pytestmark = [
+    pytest.mark.integration,
+    pytest.mark.skipif(not MONGO_TEST_URI, reason="MONGO_TEST_URI no configurada"),
+]
+
+
+@pytest.fixture(params=[False, True], ids=["atomic", "transactions"])
+def live_app(request, monkeypatch):
+    monkeypatch.setattr(Config, "MONGO_URI", MONGO_TEST_URI)
+    monkeypatch.setattr(Config, "POSITION_TRANSACTIONS", request.param)
+    monkeypatch.setattr(Config, "GRAPH_CACHE_WATCH", "off")
+    monkeypatch.setattr(seed_rooms, "MONGO_URI", MONGO_TEST_URI)
+    monkeypatch.setattr(mongo, "_client", None)
+    monkeypatch.setattr(mongo, "_client_pid", None)
+
+    client = MongoClient(MONGO_TEST_URI)
+    db = client.get_default_database()
+    client.drop_database(db.name)
+    seed_rooms.seed_rooms()
+
+    from app import create_app
+    app = create_app()
+    room_graph_cache.invalidate("test")
+    occupancy_tracker.refresh(db)
+    yield app, db
+
+    mongo.close_client()
+    client.close()
+
+
+def test_occupancy_matches_users_state(live_app):
+    app, db = live_app
+    rooms = [r["_id"] for r in db.rooms.find({}, {"_id": 1})]
+    errors = []
+    start = threading.Barrier(THREADS)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        start.wait()
+        for _ in range(UPDATES_PER_THREAD):
+            response = client.post("/position/update", json={
+                "user_id": f"user{rng.randrange(USERS)}",
+                "detected_room": rng.choice(rooms)
+            })
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+
+    in_room = Counter(s["current_room"] for s in db.users_state.find({}, {"current_room": 1}))
+    stored = {r["_id"]: r.get("current_occupancy", 0) for r in db.rooms.find({}, {"current_occupancy": 1})}
+    assert stored == {room: in_room.get(room, 0) for room in rooms}
+    assert sum(stored.values()) == db.users_state.count_documents({})
+
+    # La foto en memoria ha recibido cada delta una sola vez
+    counts = occupancy_tracker.counts()
+    assert {room: counts.get(room, 0) for room in rooms} == stored
+
+    # Cada usuario: entradas - salidas == 1 (está en una sola habitación)
+    events = Counter()
+    for event in db.room_events.find({}, {"user_id": 1, "event": 1}):
+        events[event["user_id"]] += 1 if event["event"] == "enter" else -1
+    assert set(events.values()) == {1}
@@ -0,0 +1,104 @@
+import pytest
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from blueprints import position
+from blueprints.occupancy import occupancy_tracker
+
+
+class FakeSession:
+    """
+    Sesión que ejecuta el callback de with_transaction `attempts` veces
+    (reintentos por error transitorio) y opcionalmente aborta al final.
+    """
+
+    def __init__(self, attempts=1, abort=False):
+        self.attempts = attempts
+        self.abort = abort
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def with_transaction(self, callback):
+        for _ in range(self.attempts):
+            result = callback(self)
+        if self.abort:
+            raise OperationFailure("transaction aborted")
+        return result
+
+
+class FakeClient:
+    def __init__(self, *sessions):
+        self.sessions = list(sessions)
+
+    def start_session(self):
+        return self.sessions.pop(0)
+
+
+class FakeDB:
+    def __init__(self, *sessions):
+        self.client = FakeClient(*sessions)
+
+
+@pytest.fixture
+def transition(monkeypatch):
+    calls = []
+
+    def write_transition(db, user_id, detected_room, confidence, timestamp, session=None):
+        calls.append(session)
+        return {"status": "ok", "event": "enter", "room": detected_room}, {detected_room: 1}
+
+    monkeypatch.setattr(position, "write_transition", write_transition)
+    occupancy_tracker.set_count("HAB1", 0)
+    return calls
+
+
+def test_retried_transaction_counts_once(app, transition):
+    db = FakeDB(FakeSession(attempts=3))
+    position.apply_transition_transactional(db, "u1", "HAB1", 0.9, "2024-01-01T10:00:00+00:00")
+
+    assert len(transition) == 3
+    assert occupancy_tracker.counts()["HAB1"] == 1
+
+
+def test_aborted_transaction_leaves_counters(app, transition):
+    db = FakeDB(FakeSession(abort=True))
+    with pytest.raises(OperationFailure):
+        position.apply_transition_transactional(db, "u1", "HAB1", 0.9, "2024-01-01T10:00:00+00:00")
+
+    assert occupancy_tracker.counts()["HAB1"] == 0
+
+
+def test_duplicate_user_retries_outside_the_session(app, transition):
+    class DuplicateSession(FakeSession):
+        def with_transaction(self, callback):
+            raise DuplicateKeyError("E11000 duplicate key")
+
+    db = FakeDB(DuplicateSession(), FakeSession())
+    result = position.apply_transition_transactional(db, "u1", "HAB1", 0.9, "2024-01-01T10:00:00+00:00")
+
+    assert result["event"] == "enter"
+    assert occupancy_tracker.counts()["HAB1"] == 1
+
+
+def test_update_and_batch_use_the_same_occupancy_rule(client, db):
+    client.post("/position/update", json={"user_id": "u1", "detected_room": "ENTRADA"})
+    client.post("/position/update", json={"user_id": "u2", "detected_room": "ENTRADA"})
+    # Contador desfasado: ninguna de las dos rutas lo recorta a 0
+    db.rooms.update_one({"_id": "ENTRADA"}, {"$set": {"current_occupancy": 0}})
+
+    client.post("/position/update", json={"user_id": "u1", "detected_room": "SALON"})
+    client.post("/position/update_batch", json={"updates": [{"user_id": "u2", "detected_room": "SALON"}]})
+
+    assert db.rooms.find_one({"_id": "ENTRADA"})["current_occupancy"] == -2
+    assert db.rooms.find_one({"_id": "SALON"})["current_occupancy"] == 2
+
+
+@pytest.mark.parametrize("field, value", [
+    ("detected_room", ["SALON"]), ("detected_room", {"_id": "SALON"}), ("user_id", ["u1"]), ("user_id", 7)
+])
+def test_non_string_ids_are_rejected(client, field, value):
+    data = dict({"user_id": "u1", "detected_room": "SALON"}, **{field: value})
+    assert client.post("/position/update", json=data).status_code == 400
@@ -0,0 +1,43 @@
+from blueprints.routes import bump_routes_version
+
+
+def assign(client, db, rooms):
+    db.routes.insert_one({"_id": "r1", "name": "Ruta", "steps": [{"room_id": r, "poi_id": None} for r in rooms]})
+    assert client.post("/routes/assign", json={"user_id": "u1", "route_id": "r1"}).status_code == 200
+
+
+def progress(client, room_id):
+    return client.post("/routes/progress", json={"user_id": "u1", "room_id": room_id}).json
+
+
+def test_progress_advances_until_completed(client, db):
+    assign(client, db, ["ENTRADA", "SALON"])
+
+    assert progress(client, "ENTRADA") == {"status": "ok", "current_step": 1, "completed": False}
+    assert progress(client, "SALON") == {"status": "ok", "current_step": 2, "completed": True}
+    assert progress(client, "SALON") == {"status": "already_completed"}
+
+    user_route = db.user_routes.find_one({"user_id": "u1"})
+    assert (user_route["current_step"], user_route["completed"]) == (2, True)
+
+
+def test_progress_mismatch_does_not_advance(client, db):
+    assign(client, db, ["ENTRADA", "SALON"])
+
+    assert progress(client, "COCINA") == {"status": "mismatch", "expected_room": "ENTRADA", "reached_room": "COCINA"}
+    assert db.user_routes.find_one({"user_id": "u1"})["current_step"] == 0
+
+
+def test_route_deleted_by_another_worker_is_not_reused(client, db):
+    client.post("/position/update", json={"user_id": "u1", "detected_room": "ENTRADA"})
+    first = client.post("/routes/auto/bfs", json={"user_id": "u1", "dedup": True}).json
+    assert client.post("/routes/auto/bfs", json={"user_id": "u1", "dedup": True}).json["reused"] is True
+
+    # DELETE atendido por otro worker: el LRU de este proceso sigue teniendo la ruta
+    db.routes.delete_one({"_id": first["route_id"]})
+    bump_routes_version(db)
+
+    assert client.post("/routes/assign", json={"user_id": "u1", "route_id": first["route_id"]}).status_code == 404
+    again = client.post("/routes/auto/bfs", json={"user_id": "u1", "dedup": True}).json
+    assert again["reused"] is False
+    assert db.routes.find_one({"_id": first["route_id"]}) is not None
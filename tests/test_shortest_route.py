@@ -0,0 +1,19 @@
+import pytest
+
+
+def shortest(client, **data):
+    return client.post("/routes/shortest", json=dict({"start_room": "ENTRADA", "target_room": "COCINA"}, **data))
+
+
+@pytest.mark.parametrize("field, value", [
+    ("target_room", ["COCINA"]), ("target_room", {"room_id": "COCINA"}), ("target_room", 3),
+    ("start_room", ["ENTRADA"]), ("start_room", {"room_id": "ENTRADA"})
+])
+def test_room_ids_must_be_strings(client, field, value):
+    assert shortest(client, **{field: value}).status_code == 400
+
+
+def test_valid_request(client):
+    response = shortest(client)
+    assert response.status_code == 200
+    assert response.json["rooms"][0] == "ENTRADA" and response.json["rooms"][-1] == "COCINA"
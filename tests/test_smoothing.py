@@ -0,0 +1,80 @@
+import pytest
+
+from config import Config
+from blueprints import position
+from utils.smoothing import RoomSmoother
+
+
+@pytest.fixture
+def smoothing(monkeypatch):
+    monkeypatch.setattr(Config, "SMOOTHING_MODE", "majority")
+    monkeypatch.setattr(Config, "SMOOTHING_WINDOW", 5)
+
+
+def update(client, room, second, **extra):
+    return client.post("/position/update", json=dict({
+        "user_id": "u1", "detected_room": room, "timestamp": f"2024-01-01T10:00:{second:02d}+00:00"
+    }, **extra)).json
+
+
+def test_first_detection_starts_from_stored_room(smoothing, client, db):
+    db.users_state.insert_one({"user_id": "u1", "current_room": "SALON", "last_room_change": "2024-01-01T09:00:00+00:00"})
+
+    result = update(client, "HAB1", 0)
+
+    assert result == {"status": "ok", "event": "stay", "room": "SALON", "detected_room": "HAB1"}
+    assert db.room_events.count_documents({}) == 0
+    assert db.users_state.find_one({"user_id": "u1"})["current_room"] == "SALON"
+
+
+def test_change_from_another_worker_is_followed(smoothing, client, db):
+    assert update(client, "SALON", 0)["event"] == "enter"
+    # Otro worker confirma HAB1; el suavizado de este proceso sigue en SALON
+    position.apply_transition(db, "u1", "HAB1", 0.9, "2024-01-01T10:00:05+00:00")
+
+    result = update(client, "SALON", 10)
+
+    assert result == {"status": "ok", "event": "stay", "room": "HAB1", "detected_room": "SALON"}
+    assert db.users_state.find_one({"user_id": "u1"})["current_room"] == "HAB1"
+    assert db.room_events.count_documents({"user_id": "u1"}) == 3
+
+
+def test_non_numeric_confidence(smoothing, client):
+    assert update(client, "SALON", 0, confidence="high")["event"] == "enter"
+    assert update(client, "SALON", 1, confidence=None)["event"] == "stay"
+
+
+def test_batch_is_smoothed(smoothing, client, db):
+    db.users_state.insert_one({"user_id": "u1", "current_room": "SALON", "last_room_change": "2024-01-01T09:00:00+00:00"})
+
+    results = client.post("/position/update_batch", json={"updates": [
+        {"user_id": "u1", "detected_room": "HAB1", "timestamp": f"2024-01-01T10:00:0{s}+00:00"}
+        for s in range(3)
+    ]}).json["results"]
+
+    # Ventana [SALON, HAB1, HAB1]: HAB1 es mayoría en la segunda detección
+    assert [r["event"] for r in results] == ["stay", "room_changed", "stay"]
+    assert results[0]["detected_room"] == "HAB1" and "detected_room" not in results[1]
+    assert db.users_state.find_one({"user_id": "u1"})["current_room"] == "HAB1"
+    assert db.room_events.count_documents({"user_id": "u1"}) == 2
+
+
+def test_future_timestamp_does_not_evict_other_users():
+    smoother = RoomSmoother(mode="majority", idle_ttl=600)
+    smoother.decide("u1", "SALON", timestamp="2024-01-01T10:00:00+00:00")
+    smoother._observed = 998
+    smoother.decide("u2", "SALON", timestamp="2099-01-01T10:00:00+00:00")
+
+    assert smoother.stats()["users"] == 2
+
+
+@pytest.mark.parametrize("timestamp", [["2024-01-01"], {"t": 1}, "not a date", float("nan")])
+def test_invalid_timestamp_uses_server_time(timestamp):
+    smoother = RoomSmoother(mode="majority")
+    assert smoother.decide("u1", "SALON", timestamp=timestamp) == ("SALON", True)
+
+
+def test_non_string_timestamp_in_update(smoothing, client):
+    assert update(client, "SALON", 0)["event"] == "enter"
+    response = client.post("/position/update", json={"user_id": "u1", "detected_room": "SALON", "timestamp": [1]})
+    assert response.status_code == 400
@@ -0,0 +1,49 @@
+import pytest
+
+from config import Config
+from blueprints import position
+from blueprints.stay_coalescer import stay_coalescer
+
+
+@pytest.fixture
+def coalescing(monkeypatch):
+    monkeypatch.setattr(Config, "STAY_COALESCING", True)
+    monkeypatch.setattr(Config, "STAY_FLUSH_INTERVAL", 3600)
+
+
+def test_stale_known_room_is_replayed_as_transition(coalescing, client, db):
+    client.post("/position/update", json={
+        "user_id": "u1", "detected_room": "ENTRADA", "timestamp": "2024-01-01T10:00:00+00:00"
+    })
+    # Otro worker mueve al usuario; este proceso sigue recordando ENTRADA
+    position.apply_transition(db, "u1", "SALON", 0.8, "2024-01-01T10:00:05+00:00")
+
+    response = client.post("/position/update", json={
+        "user_id": "u1", "detected_room": "ENTRADA", "timestamp": "2024-01-01T10:00:10+00:00"
+    })
+    assert response.json["event"] == "stay"
+
+    stay_coalescer.flush(db)
+
+    state = db.users_state.find_one({"user_id": "u1"})
+    assert (state["current_room"], state["last_room_change"]) == ("ENTRADA", "2024-01-01T10:00:10+00:00")
+    events = [(e["event"], e["room_id"]) for e in db.room_events.find({"user_id": "u1"})]
+    assert events[-2:] == [("exit", "SALON"), ("enter", "ENTRADA")]
+    assert db.rooms.find_one({"_id": "ENTRADA"})["current_occupancy"] == 1
+    assert db.rooms.find_one({"_id": "SALON"})["current_occupancy"] == 0
+
+
+def test_superseded_heartbeat_is_dropped(coalescing, client, db):
+    client.post("/position/update", json={
+        "user_id": "u1", "detected_room": "ENTRADA", "timestamp": "2024-01-01T10:00:00+00:00"
+    })
+    client.post("/position/update", json={
+        "user_id": "u1", "detected_room": "ENTRADA", "timestamp": "2024-01-01T10:00:05+00:00"
+    })
+    # Otro worker registra después un cambio más reciente que el latido
+    position.apply_transition(db, "u1", "SALON", 0.8, "2024-01-01T10:00:10+00:00")
+
+    stay_coalescer.flush(db)
+
+    assert db.users_state.find_one({"user_id": "u1"})["current_room"] == "SALON"
+    assert db.room_events.count_documents({"user_id": "u1"}) == 3
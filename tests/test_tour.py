@@ -0,0 +1,26 @@
+import pytest
+
+
+def tour(client, **data):
+    return client.post("/routes/tour", json=dict({"start_room": "ENTRADA", "rooms": ["SALON", "COCINA"]}, **data))
+
+
+@pytest.mark.parametrize("budget", ["nan", "inf", "-inf", 0, -5, "abc", [1]])
+def test_invalid_time_budget(client, budget):
+    response = tour(client, time_budget_ms=budget)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("rooms", [[["SALON"]], [{"id": "SALON"}], ["SALON", 3]])
+def test_rooms_must_be_ids(client, rooms):
+    assert tour(client, rooms=rooms).status_code == 400
+
+
+def test_start_room_must_be_an_id(client):
+    assert tour(client, start_room=["ENTRADA"]).status_code == 400
+
+
+def test_valid_tour(client):
+    response = tour(client, time_budget_ms="5")
+    assert response.status_code == 200
+    assert sorted(response.json["order"]) == ["COCINA", "SALON"]
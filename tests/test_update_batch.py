@@ -0,0 +1,61 @@
+from blueprints import position
+
+
+def occupancy(db):
+    return {r["_id"]: r.get("current_occupancy", 0) for r in db.rooms.find({}, {"current_occupancy": 1})}
+
+
+def test_records_without_timestamp_are_applied_last(client, db):
+    response = client.post("/position/update_batch", json={"updates": [
+        {"user_id": "u1", "detected_room": "HAB1", "timestamp": "2024-01-01T10:00:00+00:00"},
+        {"user_id": "u1", "detected_room": "SALON"},
+        {"user_id": "u1", "detected_room": "COCINA", "timestamp": "2024-01-01T09:00:00+00:00"},
+    ]})
+    assert response.status_code == 200
+
+    events = list(db.room_events.find({"user_id": "u1"}, {"_id": 0, "room_id": 1, "event": 1, "timestamp": 1}))
+    assert [(e["event"], e["room_id"]) for e in events] == [
+        ("enter", "COCINA"), ("exit", "COCINA"), ("enter", "HAB1"), ("exit", "HAB1"), ("enter", "SALON")
+    ]
+    timestamps = [e["timestamp"] for e in events]
+    assert timestamps == sorted(timestamps)
+    assert db.dwell_sessions.count_documents({"user_id": "u1"}) == 2
+    assert db.users_state.find_one({"user_id": "u1"})["current_room"] == "SALON"
+
+
+def test_concurrent_update_is_not_overwritten(client, db, monkeypatch):
+    client.post("/position/update", json={"user_id": "u1", "detected_room": "ENTRADA"})
+
+    write_batch_states = position.write_batch_states
+
+    def racing_write(db, states, read_states):
+        # Un /update del mismo usuario entre la lectura y la escritura del lote
+        position.apply_transition(db, "u1", "SALON", 0.9, "2024-01-01T10:00:00+00:00")
+        return write_batch_states(db, states, read_states)
+
+    monkeypatch.setattr(position, "write_batch_states", racing_write)
+    response = client.post("/position/update_batch", json={"updates": [
+        {"user_id": "u1", "detected_room": "HAB1", "timestamp": "2024-01-01T10:00:01+00:00"},
+        {"user_id": "u2", "detected_room": "HAB1", "timestamp": "2024-01-01T10:00:01+00:00"},
+    ]})
+    assert response.json["results"][0] == {"status": "ok", "event": "room_changed", "from": "SALON", "to": "HAB1"}
+    assert response.json["results"][1] == {"status": "ok", "event": "enter", "room": "HAB1"}
+
+    assert db.users_state.find_one({"user_id": "u1"})["current_room"] == "HAB1"
+    counts = occupancy(db)
+    assert (counts["ENTRADA"], counts["SALON"], counts["HAB1"]) == (0, 0, 2)
+    assert db.room_events.count_documents({"user_id": "u1"}) == 5
+
+
+def test_records_with_wrong_types_fail_alone(client, db):
+    response = client.post("/position/update_batch", json={"updates": [
+        {"user_id": 1, "detected_room": "SALON"},
+        {"user_id": "a", "detected_room": "SALON"},
+        {"user_id": "b", "detected_room": ["SALON"]},
+        {"user_id": "c", "detected_room": "SALON", "timestamp": 1704103200},
+    ]})
+    assert response.status_code == 200
+
+    results = response.json["results"]
+    assert [r["status"] for r in results] == ["error", "ok", "error", "error"]
+    assert db.users_state.count_documents({}) == 1
@@ -0,0 +1,102 @@
+import numpy as np
+
+# Umbrales de RSSI (dBm) y puntuación asociada, como en utils/locator.txt
+RSSI_THRESHOLDS = np.array([-90, -75, -60])
+
+# Peso de un beacon sobre su propia habitación y sobre las contiguas
+OWN_ROOM_WEIGHT = 1.0
+NEIGHBOR_WEIGHT = 0.5
+
+
+def beacon_key(uuid, major, minor):
+    """
+    Clave normalizada de un beacon iBeacon (uuid sin guiones en mayúsculas).
+    """
+    return (str(uuid).replace("-", "").upper(), int(major), int(minor))
+
+
+def rssi_scores(rssi):
+    """
+    Versión vectorizada de rssi_score: 3 muy cerca, 2 cerca, 1 lejos, 0 ignorar.
+    Los NaN (beacon no visto) puntúan 0.
+    """
+    rssi = np.asarray(rssi, dtype=float)
+    # side="left": un valor igual al umbral no lo supera (rssi > umbral)
+    scores = np.searchsorted(RSSI_THRESHOLDS, rssi, side="left").astype(float)
+    scores[np.isnan(rssi)] = 0.0
+    return scores
+
+
+class BeaconLocator:
+    """
+    Estimación de habitación a partir de escaneos de varios beacons.
+
+    La matriz de cobertura (beacons x habitaciones) se calcula una vez a
+    partir de rooms: cada beacon cubre su habitación y, con menos peso,
+    las habitaciones conectadas. Un lote de escaneos se puntúa con un
+    único producto de matrices.
+    """
+
+    def __init__(self, rooms):
+        self.room_ids = sorted(rooms)
+        room_index = {room_id: i for i, room_id in enumerate(self.room_ids)}
+
+        self.beacon_index = {}
+        rows = []
+        for room_id in self.room_ids:
+            room = rooms[room_id]
+            for beacon in room.get("beacons") or []:
+                key = beacon_key(beacon["uuid"], beacon["major"], beacon["minor"])
+                if key in self.beacon_index:
+                    continue
+                row = np.zeros(len(self.room_ids))
+                for neighbor in room.get("connections") or []:
+                    if neighbor in room_index:
+                        row[room_index[neighbor]] = NEIGHBOR_WEIGHT
+                row[room_index[room_id]] = OWN_ROOM_WEIGHT
+                self.beacon_index[key] = len(rows)
+                rows.append(row)
+
+        self.coverage = np.array(rows).reshape(len(rows), len(self.room_ids))
+
+    def rssi_matrix(self, scans):
+        """
+        scans: lista de escaneos, cada uno una lista de
+        {"uuid", "major", "minor", "rssi"}. Devuelve (escaneos x beacons)
+        con el RSSI más fuerte de cada beacon conocido y NaN si no se vio.
+        """
+        matrix = np.full((len(scans), len(self.beacon_index)), np.nan)
+        for i, beacons in enumerate(scans):
+            for b in beacons:
+                try:
+                    column = self.beacon_index.get(beacon_key(b["uuid"], b["major"], b["minor"]))
+                    rssi = float(b["rssi"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if column is not None and not rssi <= matrix[i, column]:
+                    matrix[i, column] = rssi
+        return matrix
+
+    def locate(self, scans):
+        """
+        Devuelve para cada escaneo (room_id, confidence) o (None, 0.0) si
+        ningún beacon conocido puntúa. La confianza es la parte de la
+        puntuación total que se lleva la habitación ganadora.
+        """
+        if not scans:
+            return []
+        if not self.beacon_index:
+            return [(None, 0.0)] * len(scans)
+
+        room_scores = rssi_scores(self.rssi_matrix(scans)) @ self.coverage
+        best = room_scores.argmax(axis=1)
+        top = room_scores[np.arange(len(scans)), best]
+        totals = room_scores.sum(axis=1)
+
+        results = []
+        for b, t, total in zip(best, top, totals):
+            if t <= 0:
+                results.append((None, 0.0))
+            else:
+                results.append((self.room_ids[b], round(float(t / total), 3)))
+        return results
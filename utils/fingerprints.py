@@ -0,0 +1,149 @@
+import heapq
+from collections import Counter
+
+import numpy as np
+
+# RSSI que se asigna a un beacon no visto en un escaneo
+MISSING_RSSI = -100.0
+
+LEAF_SIZE = 16
+
+
+class KDTree:
+    """
+    KD-tree sencillo sobre una matriz (n x d) para búsqueda de k vecinos.
+    Los nodos guardan rangos de índices sobre una permutación de los
+    puntos, así no se copian los vectores.
+    """
+
+    def __init__(self, points):
+        self.points = points
+        self.order = np.arange(len(points))
+        # Nodo: (inicio, fin, dimensión, valor de corte, hijo izq, hijo der)
+        self.nodes = []
+        if len(points):
+            self._build(0, len(points))
+
+    def _build(self, start, end):
+        node_id = len(self.nodes)
+        self.nodes.append(None)
+
+        if end - start <= LEAF_SIZE:
+            self.nodes[node_id] = (start, end, -1, 0.0, -1, -1)
+            return node_id
+
+        idx = self.order[start:end]
+        subset = self.points[idx]
+        dim = int(np.argmax(subset.max(axis=0) - subset.min(axis=0)))
+        mid = (end - start) // 2
+        partition = np.argpartition(subset[:, dim], mid)
+        self.order[start:end] = idx[partition]
+        split = float(self.points[self.order[start + mid], dim])
+
+        left = self._build(start, start + mid)
+        right = self._build(start + mid, end)
+        self.nodes[node_id] = (start, end, dim, split, left, right)
+        return node_id
+
+    def query(self, point, k):
+        """
+        Devuelve [(distancia², índice)] de los k puntos más cercanos.
+        """
+        if not self.nodes:
+            return []
+
+        # Max-heap de los mejores k (distancias negadas)
+        best = []
+        stack = [(0, 0.0)]
+        while stack:
+            node_id, bound = stack.pop()
+            if len(best) == k and bound >= -best[0][0]:
+                continue
+
+            start, end, dim, split, left, right = self.nodes[node_id]
+            if dim < 0:
+                idx = self.order[start:end]
+                dists = ((self.points[idx] - point) ** 2).sum(axis=1)
+                for d, i in zip(dists, idx):
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, int(i)))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, int(i)))
+                continue
+
+            diff = point[dim] - split
+            near, far = (left, right) if diff < 0 else (right, left)
+            # Primero se apila el lado lejano para visitar antes el cercano
+            stack.append((far, max(bound, diff * diff)))
+            stack.append((near, bound))
+
+        return sorted((-d, i) for d, i in best)
+
+
+class FingerprintIndex:
+    """
+    Huellas RSSI etiquetadas con su habitación, en una matriz float32.
+
+    Las huellas nuevas van a un búfer que se busca por fuerza bruta; cuando
+    el búfer supera rebuild_ratio del tamaño del árbol se reconstruye el
+    KD-tree con todo (coste amortizado por inserción).
+    """
+
+    def __init__(self, dims, rebuild_ratio=0.25, min_buffer=64):
+        self.dims = dims
+        self.rebuild_ratio = rebuild_ratio
+        self.min_buffer = min_buffer
+        self._points = np.empty((0, dims), dtype=np.float32)
+        self._labels = []
+        self._tree = KDTree(self._points)
+        self._tree_size = 0
+        self.rebuilds = 0
+
+    def __len__(self):
+        return len(self._labels)
+
+    def add(self, vectors, labels):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dims)
+        if not len(vectors):
+            return
+        self._points = np.vstack([self._points, vectors])
+        self._labels.extend(labels)
+
+        buffered = len(self._labels) - self._tree_size
+        if buffered > max(self.min_buffer, self.rebuild_ratio * self._tree_size):
+            self._rebuild()
+
+    def _rebuild(self):
+        self._tree = KDTree(self._points[:len(self._labels)])
+        self._tree_size = len(self._labels)
+        self.rebuilds += 1
+
+    def neighbors(self, point, k):
+        point = np.asarray(point, dtype=np.float32)
+        candidates = self._tree.query(point, k)
+
+        # Búfer aún no indexado: fuerza bruta
+        if self._tree_size < len(self._labels):
+            buffered = self._points[self._tree_size:]
+            dists = ((buffered - point) ** 2).sum(axis=1)
+            candidates.extend((float(d), self._tree_size + i) for i, d in enumerate(dists))
+            candidates.sort()
+
+        return candidates[:k]
+
+    def predict(self, vectors, k=5):
+        """
+        Para cada vector devuelve (room_id, confidence) por voto de los k
+        vecinos ponderado por la inversa de la distancia.
+        """
+        results = []
+        for point in np.asarray(vectors, dtype=np.float32).reshape(-1, self.dims):
+            votes = Counter()
+            for dist, i in self.neighbors(point, k):
+                votes[self._labels[i]] += 1.0 / (1.0 + np.sqrt(dist))
+            if not votes:
+                results.append((None, 0.0))
+                continue
+            room_id, weight = votes.most_common(1)[0]
+            results.append((room_id, round(float(weight / sum(votes.values())), 3)))
+        return results
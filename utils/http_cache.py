@@ -0,0 +1,98 @@
+import os
+import uuid
+
+from flask import Response, current_app, request
+
+from .lru import LRUCache
+from .serialization import MSGPACK, compress, negotiated_encoding, negotiated_mimetype, response_compressor
+
+# Distingue los contadores de este proceso de los de otros workers: una
+# ETag de otro proceso nunca coincide y se responde 200. Se genera en el
+# primer uso de cada PID: los workers creados con fork tras precargar la
+# app no deben heredar el del padre.
+_instance = None
+_instance_pid = None
+
+
+def _instance_token():
+    global _instance, _instance_pid
+    pid = os.getpid()
+    if _instance_pid != pid:
+        _instance = f"{pid}-{uuid.uuid4().hex[:8]}"
+        _instance_pid = pid
+    return _instance
+
+
+def instance_tag(*parts):
+    """
+    ETag a partir de contadores locales del proceso (versión del grafo,
+    de la ocupación...).
+    """
+    return "-".join([_instance_token()] + [str(part) for part in parts])
+
+
+class ResponseCache:
+    """
+    Cuerpos ya serializados por clave, junto con su ETag.
+
+    respond(key, etag, build) contesta 304 si el cliente ya tiene esa ETag
+    (If-None-Match) y, si no, reutiliza el cuerpo guardado mientras la ETag
+    no cambie; solo con una ETag nueva se llama a build() y se serializa.
+    Con with_headers=True, build() devuelve (objeto, cabeceras) y las
+    cabeceras se guardan con el cuerpo.
+    Cada representación (JSON/MessagePack, comprimida o no) tiene su propia
+    ETag y su propio cuerpo.
+    """
+
+    def __init__(self, maxsize=256):
+        self._bodies = LRUCache(maxsize)
+
+    def configure(self, config):
+        self._bodies.maxsize = config.get("RESPONSE_CACHE_SIZE", self._bodies.maxsize)
+
+    def respond(self, key, etag, build, with_headers=False):
+        mimetype = negotiated_mimetype()
+        encoding = negotiated_encoding() if response_compressor.min_bytes else None
+        variant_etag = f"{etag}-{'msgpack' if mimetype == MSGPACK else 'json'}-{encoding or 'identity'}"
+
+        if request.if_none_match.contains(variant_etag):
+            response = Response(status=304)
+            response.set_etag(variant_etag)
+            return response
+
+        cached = self._bodies.get(key)
+        if cached is None or cached[0] != etag:
+            # Versión nueva: se descartan todas las representaciones anteriores
+            cached = (etag, {})
+            self._bodies.put(key, cached)
+        variants = cached[1]
+
+        if (mimetype, encoding) in variants:
+            body, content_encoding, headers = variants[(mimetype, encoding)]
+        else:
+            obj, headers = build() if with_headers else (build(), {})
+            body, mimetype = current_app.json.encode(obj)
+            content_encoding = None
+            if encoding and len(body) >= response_compressor.min_bytes:
+                body = compress(body, encoding, response_compressor.level)
+                content_encoding = encoding
+            variants[(mimetype, encoding)] = (body, content_encoding, headers)
+
+        response = Response(body, mimetype=mimetype, headers=headers)
+        response.set_etag(variant_etag)
+        response.vary.update(("Accept", "Accept-Encoding"))
+        if content_encoding:
+            response.headers["Content-Encoding"] = content_encoding
+        # El cliente debe revalidar siempre (barato: 304 sin cuerpo)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    def contains(self, key, etag):
+        cached = self._bodies.get(key)
+        return cached is not None and cached[0] == etag
+
+    def invalidate(self, key):
+        self._bodies.pop(key)
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,48 @@
+import base64
+import json
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort_value, doc_id):
+    """
+    Cursor opaco con la última clave vista (valor de ordenación, _id).
+    """
+    kind = "oid" if isinstance(doc_id, ObjectId) else "raw"
+    payload = json.dumps([sort_value, kind, str(doc_id)])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        sort_value, kind, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if kind == "oid":
+            doc_id = ObjectId(doc_id)
+    except (ValueError, TypeError, InvalidId) as e:
+        raise InvalidCursor(str(e))
+    return sort_value, doc_id
+
+
+def keyset_filter(field, cursor):
+    """
+    Condición "después del cursor" para el orden (field, _id) ascendente.
+    """
+    sort_value, doc_id = decode_cursor(cursor)
+    return {"$or": [
+        {field: {"$gt": sort_value}},
+        {field: sort_value, "_id": {"$gt": doc_id}}
+    ]}
+
+
+def parse_limit(value, default, maximum):
+    if value is None:
+        return default
+    limit = int(value)
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    return min(limit, maximum)
@@ -0,0 +1,103 @@
+import gzip
+import json
+import os
+
+INDEX_FILE = "index.ndjson"
+
+
+class SegmentWriter:
+    """
+    Archivo de eventos en segmentos locales de solo-añadir.
+
+    - Cada segmento (segment-000001.ndjson.gz, ...) es una sucesión de
+      bloques gzip independientes, un evento JSON por línea.
+    - index.ndjson tiene una línea por bloque: segmento, offset, longitud,
+      número de eventos y primer/último timestamp. Para leer un rango basta
+      con el índice y descomprimir los bloques que se solapan.
+    - Cuando un segmento pasa de max_bytes se empieza el siguiente.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        entries = read_index(directory)
+        self._number = int(entries[-1]["segment"].split("-")[1].split(".")[0]) if entries else 1
+
+    def append_block(self, events):
+        """
+        Escribe un bloque (eventos ya ordenados por timestamp) y después su
+        línea de índice, ambos con fsync. Devuelve la entrada del índice.
+        """
+        data = gzip.compress(
+            "".join(json.dumps(event, default=str) + "\n" for event in events).encode()
+        )
+
+        path = os.path.join(self.directory, self._segment())
+        if os.path.exists(path) and os.path.getsize(path) >= self.max_bytes:
+            self._number += 1
+            path = os.path.join(self.directory, self._segment())
+        with open(path, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        entry = {
+            "segment": self._segment(),
+            "offset": offset,
+            "length": len(data),
+            "count": len(events),
+            "first": events[0]["timestamp"],
+            "last": events[-1]["timestamp"]
+        }
+        with open(os.path.join(self.directory, INDEX_FILE), "a+") as f:
+            # Si un corte dejó la última línea a medias, empezamos en otra
+            prefix = ""
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(f.tell() - 1)
+                prefix = "" if f.read(1) == "\n" else "\n"
+            f.write(prefix + json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return entry
+
+    def _segment(self):
+        return f"segment-{self._number:06d}.ndjson.gz"
+
+
+def read_index(directory):
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        # Las líneas a medias (corte durante la escritura) se ignoran
+        entries = []
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+        return entries
+
+
+def scan_range(directory, start=None, end=None):
+    """
+    Eventos archivados con start <= timestamp < end (ISO), leyendo solo los
+    bloques del índice que se solapan con el rango, uno a uno.
+    """
+    for entry in read_index(directory):
+        if start is not None and entry["last"] < start:
+            continue
+        if end is not None and entry["first"] >= end:
+            continue
+        with open(os.path.join(directory, entry["segment"]), "rb") as f:
+            f.seek(entry["offset"])
+            block = gzip.decompress(f.read(entry["length"]))
+        for line in block.decode().splitlines():
+            event = json.loads(line)
+            if start is not None and event["timestamp"] < start:
+                continue
+            if end is not None and event["timestamp"] >= end:
+                continue
+            yield event
@@ -0,0 +1,149 @@
+import gzip
+import zlib
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # backend opcional: sin él se usa json de la stdlib
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # sin msgpack solo se sirve JSON
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK, "application/x-msgpack")
+
+
+def encode_default(obj):
+    """
+    Tipos que no son JSON/MessagePack nativos (ObjectId, fechas...), igual
+    que el proveedor por defecto de Flask.
+    """
+    try:
+        return DefaultJSONProvider.default(obj)
+    except TypeError:
+        return str(obj)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Proveedor JSON de la app (jsonify, request.get_json) que usa orjson si
+    está instalado y JSON_BACKEND lo permite, con la misma salida que el de
+    Flask (claves ordenadas y fechas en formato HTTP). Además negocia
+    MessagePack por la cabecera Accept.
+    """
+
+    backend = "orjson" if orjson else "stdlib"
+
+    def dumps(self, obj, **kwargs):
+        if self.backend != "orjson" or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def dumps_bytes(self, obj, indent=False):
+        if self.backend != "orjson":
+            return super().dumps(obj, **({"indent": 2} if indent else {})).encode()
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=encode_default, option=option)
+
+    def loads(self, s, **kwargs):
+        if self.backend != "orjson" or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def encode(self, obj):
+        """
+        Cuerpo y mimetype según el Accept de la petición.
+        """
+        if msgpack is not None and negotiated_mimetype() == MSGPACK:
+            return msgpack.packb(obj, default=encode_default, use_bin_type=True), MSGPACK
+        # Como jsonify: con DEBUG la salida va indentada
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self.dumps_bytes(obj, indent=indent) + b"\n", JSON
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body, mimetype = self.encode(obj)
+        response = self._app.response_class(body, mimetype=mimetype)
+        if msgpack is not None:
+            response.vary.add("Accept")
+        return response
+
+    def configure(self, config):
+        backend = config.get("JSON_BACKEND", "auto")
+        if backend == "auto":
+            backend = "orjson" if orjson else "stdlib"
+        if backend == "orjson" and orjson is None:
+            raise RuntimeError("JSON_BACKEND=orjson but orjson is not installed")
+        self.backend = backend
+
+
+def negotiated_mimetype():
+    if msgpack is None:
+        return JSON
+    best = request.accept_mimetypes.best_match((JSON,) + MSGPACK_TYPES, default=JSON)
+    return MSGPACK if best in MSGPACK_TYPES else JSON
+
+
+def negotiated_encoding():
+    accept = request.accept_encodings
+    for encoding in ("gzip", "deflate"):
+        if accept[encoding]:
+            return encoding
+    return None
+
+
+def compress(body, encoding, level=6):
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=level)
+    return zlib.compress(body, level)
+
+
+class ResponseCompressor:
+    """
+    after_request que comprime con gzip/deflate (según Accept-Encoding) los
+    cuerpos de más de min_bytes. Las respuestas en streaming (SSE, NDJSON)
+    y las ya comprimidas no se tocan.
+    """
+
+    def __init__(self, min_bytes=1024, level=6):
+        self.min_bytes = min_bytes
+        self.level = level
+
+    def configure(self, config):
+        self.min_bytes = config.get("RESPONSE_COMPRESSION_MIN_BYTES", self.min_bytes)
+        self.level = config.get("RESPONSE_COMPRESSION_LEVEL", self.level)
+
+    def __call__(self, response):
+        if (
+            not self.min_bytes
+            or response.is_streamed
+            or response.direct_passthrough
+            or response.status_code != 200
+            or "Content-Encoding" in response.headers
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        body = response.get_data()
+        encoding = negotiated_encoding()
+        if encoding is None or len(body) < self.min_bytes:
+            return response
+
+        response.set_data(compress(body, encoding, self.level))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            # Otra representación: otra ETag fuerte
+            response.set_etag(f"{etag}-{encoding}", weak=weak)
+        return response
+
+
+response_compressor = ResponseCompressor()
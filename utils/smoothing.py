@@ -0,0 +1,186 @@
+import math
+import threading
+import time
+from collections import Counter, deque
+
+from .time_utils import parse_iso_seconds
+
+
+def _weight(confidence):
+    """
+    Peso de una detección en la media exponencial: la confianza si es un
+    número finito, 1 si no viene o no es válida.
+    """
+    try:
+        weight = float(confidence)
+    except (TypeError, ValueError):
+        return 1.0
+    return weight if math.isfinite(weight) else 1.0
+
+
+class UserSmoothingState:
+    __slots__ = ("committed", "window", "ema", "candidate", "candidate_since", "last_seen")
+
+    def __init__(self, window):
+        self.committed = None
+        self.window = deque(maxlen=window)
+        self.ema = {}
+        self.candidate = None
+        self.candidate_since = None
+        self.last_seen = 0.0
+
+
+class RoomSmoother:
+    """
+    Filtro por usuario antes de la máquina de estados de /position/update.
+
+    Decide qué habitación se "confirma" para cada detección:
+    - majority: la habitación tiene que ser mayoría en las últimas
+      `window` detecciones
+    - ema: media exponencial de la confianza por habitación; la nueva
+      tiene que superar a la actual en `ema_margin`
+    y además, en ambos modos, tiene que mantenerse como líder durante
+    `min_dwell` segundos (según los timestamps de las detecciones).
+    Mientras no se confirma, la detección cuenta como "stay".
+    Cada usuario parte de la habitación guardada en users_state, así un
+    reinicio u otro worker no aceptan tal cual una primera detección ruidosa.
+    """
+
+    def __init__(self, mode="off", window=5, ema_alpha=0.5, ema_margin=0.2, min_dwell=0.0, idle_ttl=600):
+        self.mode = mode
+        self.window = window
+        self.ema_alpha = ema_alpha
+        self.ema_margin = ema_margin
+        self.min_dwell = min_dwell
+        self.idle_ttl = idle_ttl
+        self._users = {}
+        self._lock = threading.Lock()
+        self._observed = 0
+        self.suppressed = 0
+
+    def configure(self, config):
+        self.mode = config.get("SMOOTHING_MODE", "off")
+        self.window = config.get("SMOOTHING_WINDOW", 5)
+        self.ema_alpha = config.get("SMOOTHING_EMA_ALPHA", 0.5)
+        self.ema_margin = config.get("SMOOTHING_EMA_MARGIN", 0.2)
+        self.min_dwell = config.get("SMOOTHING_MIN_DWELL", 0.0)
+        self.idle_ttl = config.get("SMOOTHING_IDLE_TTL", 600)
+        self._users = {}
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def observe(self, user_id, detected_room, confidence=None, timestamp=None, stored_room=None):
+        """
+        Registra una detección y devuelve la habitación confirmada.
+        """
+        return self.decide(user_id, detected_room, confidence, timestamp, stored_room)[0]
+
+    def decide(self, user_id, detected_room, confidence=None, timestamp=None, stored_room=None):
+        """
+        Registra una detección y devuelve (habitación confirmada, si ha
+        cambiado con esta detección).
+
+        stored_room() devuelve la habitación guardada en users_state; solo se
+        llama la primera vez que este proceso ve al usuario (arranque, otro
+        worker...), para partir de ella y no de la primera detección.
+        """
+        # timestamp: ISO 8601 (requests) o segundos epoch (replay). Solo mide
+        # min_dwell entre detecciones del mismo usuario; la inactividad va
+        # con el reloj del servidor, así un timestamp del futuro de un
+        # cliente no expulsa al resto de usuarios
+        server_now = time.time()
+        try:
+            if isinstance(timestamp, (int, float)):
+                now = float(timestamp)
+            else:
+                now = parse_iso_seconds(timestamp) if timestamp else server_now
+        except (AttributeError, TypeError, ValueError, OverflowError):
+            now = server_now
+        if not math.isfinite(now):
+            now = server_now
+        weight = _weight(confidence)
+
+        self._observed += 1
+        if self._observed % 1000 == 0:
+            self.forget_idle(server_now)
+
+        seed = None
+        if stored_room is not None and user_id not in self._users:
+            seed = stored_room()
+
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None:
+                state = self._users[user_id] = UserSmoothingState(self.window)
+                if seed is not None:
+                    self._seed(state, seed)
+            previous = state.committed
+
+            state.last_seen = server_now
+            state.window.append(detected_room)
+            for room_id in list(state.ema):
+                state.ema[room_id] *= 1 - self.ema_alpha
+            state.ema[detected_room] = state.ema.get(detected_room, 0.0) + self.ema_alpha * weight
+
+            # Usuario nuevo (nada guardado): no hay nada que suavizar
+            if state.committed is None:
+                state.committed = detected_room
+                return detected_room, True
+
+            leader = self._leader(state)
+            if leader == state.committed:
+                state.candidate = None
+            else:
+                if leader != state.candidate:
+                    state.candidate = leader
+                    state.candidate_since = now
+                if now - state.candidate_since >= self.min_dwell:
+                    state.committed = leader
+                    state.candidate = None
+
+            if state.committed != detected_room:
+                self.suppressed += 1
+            return state.committed, state.committed != previous
+
+    def resync(self, user_id, room_id):
+        """
+        Vuelve a partir de room_id (otro worker ha confirmado otro cambio).
+        """
+        with self._lock:
+            state = self._users[user_id] = UserSmoothingState(self.window)
+            state.last_seen = time.time()
+            self._seed(state, room_id)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def _seed(self, state, room_id):
+        # La habitación guardada cuenta como una detección previa con confianza 1
+        state.committed = room_id
+        state.window.append(room_id)
+        state.ema[room_id] = self.ema_alpha
+
+    def _leader(self, state):
+        if self.mode == "majority":
+            room_id, count = Counter(state.window).most_common(1)[0]
+            return room_id if count * 2 > len(state.window) else state.committed
+
+        # ema
+        room_id = max(state.ema, key=state.ema.get)
+        current = state.ema.get(state.committed, 0.0)
+        return room_id if state.ema[room_id] - current > self.ema_margin else state.committed
+
+    def forget_idle(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            for user_id in [u for u, s in self._users.items() if now - s.last_seen > self.idle_ttl]:
+                del self._users[user_id]
+
+    def stats(self):
+        return {"mode": self.mode, "users": len(self._users), "suppressed": self.suppressed}
+
+
+room_smoother = RoomSmoother()
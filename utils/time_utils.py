@@ -2,3 +2,31 @@ from datetime import datetime, timezone
 
 def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
+
+
+def parse_iso_datetime(value: str) -> datetime:
+    """
+    Timestamp ISO 8601 -> datetime con zona (sin zona horaria se asume UTC).
+    """
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def parse_iso_seconds(value: str) -> float:
+    """
+    Timestamp ISO 8601 -> segundos epoch (sin zona horaria se asume UTC).
+    """
+    return parse_iso_datetime(value).timestamp()
+
+
+def event_datetime(value) -> datetime:
+    """
+    Fecha real (BSON date) de un timestamp de evento, para el índice TTL.
+    Si el cliente envía un timestamp que no es ISO se usa la hora actual.
+    """
+    try:
+        return parse_iso_datetime(value)
+    except (AttributeError, TypeError, ValueError):
+        return datetime.now(timezone.utc)